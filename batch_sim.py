@@ -0,0 +1,487 @@
+# batch_sim.py
+
+import argparse
+import time
+
+import numpy as np
+
+from fuel_planner import FUEL_VALUE
+from map_graph import BoardMap, choose_zones, citiesUS
+from objects import PRICE_LADDERS, ResourceMarket, power_plant_plug, power_plant_socket
+from rule_tables import (building_cost, city_cashback, game_end_cities, remove_cards,
+                         resource_replenishment, zones_played)
+
+# Lockstep batch simulator: K games held as NumPy arrays (one row per game) and stepped
+# through each phase together, for parameter sweeps where thousands of games are needed.
+#
+# Rules are the ones GameBehaviour enforces and decisions are the ones the player agents make
+# (player_agent.py), with these simplifications:
+# - one ledger per player (the agents keep their own copy of elektro next to the manager's);
+# - the phase 2 auction is settled in closed form: the bidder able to go highest wins and pays
+#   just above what the runner-up could offer, as the +3 raises of decide_bid_amount would end up;
+# - resources are bought with the old greedy rule (cheapest resource first, each one costing at most 60%
+#   of the budget left, up to what the plants burn in a round), not with fuel_planner.plan_purchase: the agents
+#   cap the fuel by the cities they own and plan to build, out of what the build plan leaves;
+# - the resource market is refilled every round from resource_replenishment;
+# - the step is fixed at 2, as in Environment;
+# - every game plays the regions choose_zones picks, as in Environment, but they are drawn from the
+#   generator of the batch: a game doesn't play the map of the GameContext with the same seed.
+
+RESOURCES = ["coal", "oil", "garbage", "uranium"]
+STEP = 2  # Environment keeps the step fixed at 2
+HOUSES = 21  # houses of a player once the first one is placed on the score track, as in Environment
+
+############################  RULE TABLES AS ARRAYS  ############################
+# Plants are identified by their index in PLANTS, sorted by min_bid, so sorting ids sorts by price.
+# NO_PLANT is one past the last id: it sorts after every real plant and marks empty slots.
+PLANTS = sorted(power_plant_plug + power_plant_socket, key=lambda pp: pp.min_bid)
+NO_PLANT = len(PLANTS)
+
+PLANT_COST = np.array([pp.min_bid for pp in PLANTS] + [10 ** 6], dtype=np.int64)  # never affordable
+PLANT_NUMBER = np.array([pp.min_bid for pp in PLANTS] + [0], dtype=np.int64)  # 0 for "largest plant"
+PLANT_CITIES = np.array([pp.cities for pp in PLANTS] + [0], dtype=np.int64)
+PLANT_NEED = np.array([pp.resource_num if pp.resource_type else 0 for pp in PLANTS] + [0], dtype=np.int64)
+PLANT_USES = np.array([[r in pp.resource_type for r in RESOURCES] for pp in PLANTS] + [[False] * 4])
+PLANT_HYBRID = np.array([pp.is_hybrid for pp in PLANTS] + [False])
+PLANT_SINGLE = PLANT_USES.any(axis=1) & ~PLANT_HYBRID
+# Units of every resource burnt by a single-resource plant, and of coal and/or oil by a hybrid one
+PLANT_SINGLE_NEED = np.where(PLANT_SINGLE[:, None] & PLANT_USES, PLANT_NEED[:, None], 0)
+PLANT_HYBRID_NEED = np.where(PLANT_HYBRID, PLANT_NEED, 0)
+# Position of the fuelled plants in the order of fuel_planner.plant_key (eco plants and empty slots last), so
+# that subsets of plants are tried in the order of allocate_fuel, which keeps the first of equal allocations
+_FUEL_KEYS = sorted((pp.cities, tuple(pp.resource_type), pp.resource_num, pp.is_hybrid, i)
+                    for i, pp in enumerate(PLANTS) if pp.resource_type)
+PLANT_FUEL_ORDER = np.full(NO_PLANT + 1, len(_FUEL_KEYS), dtype=np.int64)
+PLANT_FUEL_ORDER[[key[-1] for key in _FUEL_KEYS]] = np.arange(len(_FUEL_KEYS))
+PLANT_IS_PLUG = np.array([any(pp is plug for plug in power_plant_plug) for pp in PLANTS] + [False])
+# evaluate_power_plant of the player agents
+PLANT_VALUE = PLANT_CITIES * 10 + np.where(PLANT_USES.any(axis=1), 0, 20)
+
+# PRICE_LADDER[r, n] is the price of the next unit of resource r when n units are in the market
+MARKET_MAX = np.array([ResourceMarket().max[r] for r in RESOURCES], dtype=np.int64)
+PRICE_LADDER = np.zeros((len(RESOURCES), MARKET_MAX.max() + 1), dtype=np.int64)
+for _r, _resource in enumerate(RESOURCES):
+    PRICE_LADDER[_r, :len(PRICE_LADDERS[_resource])] = PRICE_LADDERS[_resource]
+# Buying q units with n in the market costs PRICE_PREFIX[r, n] - PRICE_PREFIX[r, n - q]
+PRICE_PREFIX = np.cumsum(PRICE_LADDER, axis=1)
+
+CASHBACK = np.array(city_cashback, dtype=np.int64)
+
+# Cities as bit positions, in the order of citiesUS
+CITY_TAGS = list(citiesUS)
+CITY_BITS = np.arange(len(CITY_TAGS), dtype=np.uint64)
+
+
+def zone_distances(zones):
+    """
+    Shortest connection cost between any two cities of the map restricted to some regions, as
+    BoardMap.from_zones builds it for a real game.
+
+    :param zones: Colors of the regions played (keys of zonesUS).
+    :return: (N, N) float array indexed like CITY_TAGS, inf between cities not joined on that map
+             (so the diagonal is 0 for the cities played, inf for the others).
+    """
+    board = BoardMap.from_zones(zones)
+    ids = [CITY_TAGS.index(tag) for tag in board.city_tags]
+    distances = np.full((len(CITY_TAGS), len(CITY_TAGS)), np.inf)
+    distances[np.ix_(ids, ids)] = board.distances
+    return distances
+
+
+def popcount(masks):
+    """
+    Number of set bits of every uint64 in an array.
+
+    :param masks: Array of uint64 bitmasks.
+    :return: int64 array of the same shape.
+    """
+    as_bytes = np.ascontiguousarray(masks, dtype=np.uint64).view(np.uint8)
+    return np.unpackbits(as_bytes).reshape(*masks.shape, 64).sum(axis=-1, dtype=np.int64)
+
+
+def unpack_cities(masks):
+    """
+    Expands city bitmasks into booleans.
+
+    :param masks: Array of uint64 bitmasks, any shape.
+    :return: Boolean array with one more axis, of length len(CITY_TAGS).
+    """
+    return ((masks[..., None] >> CITY_BITS) & np.uint64(1)).astype(bool)
+
+
+class BatchGames:
+    """
+    K games with the same number of players, as structure-of-arrays state:
+    - elektro: (K, P) balance of every player;
+    - resources: (K, P, 4) coal, oil, garbage and uranium stored by every player;
+    - plants: (K, P, 3) plant ids (NO_PLANT for an empty slot);
+    - cities: (K, P) uint64 bitmask of the cities of every player (bit i is CITY_TAGS[i]);
+    - order: (K, P) player index at every position of the turn order;
+    - board: (K,) map of every game, an index into board_distance (one per combination of zones played).
+    """
+    def __init__(self, num_games, num_players, seed=None):
+        """
+        :param num_games: Number of games K.
+        :param num_players: Number of players in every game, between 2 and 6.
+        :param seed: Seed of the batch. The same seed replays the same games.
+        """
+        if not (2 <= num_players <= 6):
+            raise ValueError("Number of players must be between 2 and 6.")
+
+        self.num_games = num_games
+        self.num_players = num_players
+        self.rng = np.random.default_rng(seed)
+        self.games = np.arange(num_games)
+
+        K, P = num_games, num_players
+        self.elektro = np.full((K, P), 50, dtype=np.int64)
+        self.resources = np.zeros((K, P, len(RESOURCES)), dtype=np.int64)
+        self.plants = np.full((K, P, 3), NO_PLANT, dtype=np.int64)
+        self.cities = np.zeros((K, P), dtype=np.uint64)
+        self.cities_powered = np.zeros((K, P), dtype=np.int64)
+        self.order = self.rng.permuted(np.tile(np.arange(P), (K, 1)), axis=1)
+
+        # Every game plays the regions choose_zones picks for it, as Environment does
+        zones = [tuple(choose_zones(zones_played[P], self.rng)) for _ in range(K)]
+        boards = sorted(set(zones))
+        self.board = np.array([boards.index(game_zones) for game_zones in zones], dtype=np.int64)
+        self.board_distance = np.stack([zone_distances(board_zones) for board_zones in boards])
+        self.playable = np.isfinite(np.diagonal(self.board_distance, axis1=1, axis2=2))[self.board]
+
+        self.market_resources = np.tile(MARKET_MAX, (K, 1))
+        self.replenishment = np.array([resource_replenishment[STEP][P][r] for r in RESOURCES], dtype=np.int64)
+        self._initialize_plant_markets()
+
+        self.round = 1
+        self.finished = np.zeros(K, dtype=bool)
+        self.winner = np.full(K, -1, dtype=np.int64)
+        self.rounds = np.zeros(K, dtype=np.int64)
+
+    def _initialize_plant_markets(self):
+        """
+        Shuffles one deck per game and deals the current and future markets,
+        after removing cards as PowerPlantMarket does.
+        """
+        K = self.num_games
+        deck = self.rng.permuted(np.tile(np.arange(NO_PLANT), (K, 1)), axis=1)
+
+        plug_to_remove, socket_to_remove = remove_cards[self.num_players]
+        is_plug = PLANT_IS_PLUG[deck]
+        removed = (is_plug & (np.cumsum(is_plug, axis=1) <= plug_to_remove)) | \
+                  (~is_plug & (np.cumsum(~is_plug, axis=1) <= socket_to_remove))
+        deck = deck[~removed].reshape(K, -1)  # every game removes the same number of cards
+
+        self.current_market = np.sort(deck[:, :4], axis=1)
+        self.future_market = np.sort(deck[:, 4:8], axis=1)
+        self.deck = deck[:, 8:]
+        self.deck_position = np.zeros(K, dtype=np.int64)
+
+    def _draw(self, games):
+        """
+        Draws the next card of the deck of the given games (NO_PLANT where the deck is empty).
+        """
+        position = self.deck_position[games]
+        has_card = position < self.deck.shape[1]
+        card = np.where(has_card, self.deck[games, np.minimum(position, self.deck.shape[1] - 1)], NO_PLANT)
+        self.deck_position[games] += has_card
+        return card
+
+    def _refill_plant_markets(self, games, slot):
+        """
+        Removes current_market[:, slot] of the given games and refills the markets like
+        PowerPlantMarket.update_markets: the lowest future plant moves to the current market,
+        and the deck refills the future market.
+        """
+        self.current_market[games, slot] = self.future_market[games, 0]
+        self.current_market[games] = np.sort(self.current_market[games], axis=1)
+        self.future_market[games, 0] = self._draw(games)
+        self.future_market[games] = np.sort(self.future_market[games], axis=1)
+
+    #############################  PHASES  #############################
+    def _reach(self, owned):
+        """
+        Connection cost of every city to a network, on the map of every game.
+
+        :param owned: (K, N) boolean array of the cities of the network in every game.
+        :return: (K, N) float array, inf everywhere for an empty network.
+        """
+        reach = np.full(owned.shape, np.inf)
+        for board, distances in enumerate(self.board_distance):
+            games = self.board == board
+            reach[games] = np.where(owned[games][:, :, None], distances, np.inf).min(axis=1)
+        return reach
+
+    def phase1(self):
+        """
+        Turn order: most cities first, then the largest power plant.
+        """
+        largest_plant = PLANT_NUMBER[self.plants].max(axis=2)
+        key = popcount(self.cities) * 1000 + largest_plant
+        order = np.argsort(-key, axis=1, kind="stable")
+        self.order = np.where(self.finished[:, None], self.order, order)
+
+    def phase2(self):
+        """
+        Auctions, in turn order. Each player starts an auction or passes like should_pass and
+        choose_power_plant_to_auction; a player who loses an auction may start another one.
+        """
+        g = self.games
+        bought = self.finished[:, None] | np.zeros((self.num_games, self.num_players), dtype=bool)
+
+        for position in range(self.num_players):
+            for _ in range(self.num_players):  # at most one auction won per player
+                starter = self.order[:, position]
+                turn = ~bought[g, starter]
+                if not turn.any():
+                    break
+
+                budget = self.elektro[g, starter]
+                cost = PLANT_COST[self.current_market]
+                affordable = cost <= budget[:, None]
+                can_afford = affordable.any(axis=1)
+
+                # should_pass: the most valuable affordable plant must leave 10 Elektro, and 3 plants is enough
+                best = np.where(affordable, PLANT_VALUE[self.current_market], -1).argmax(axis=1)
+                remaining = budget - cost[g, best]
+                plant_count = (self.plants[g, starter] != NO_PLANT).sum(axis=1)
+                passes = ~can_afford
+                if self.round > 1:  # nobody can pass in the first round
+                    passes |= (remaining < 10) | (plant_count >= 3)
+                bought[g, starter] |= turn & passes
+                auction = turn & ~passes
+                if not auction.any():
+                    continue
+
+                # choose_power_plant_to_auction: best cities per Elektro among the affordable plants
+                ratio = np.where(affordable, PLANT_CITIES[self.current_market] / cost, -1.0)
+                slot = ratio.argmax(axis=1)
+                plant = self.current_market[g, slot]
+                min_bid = PLANT_COST[plant]
+
+                # Highest bid every player could reach with decide_bid_amount (+3 while under the value)
+                reach = np.minimum(PLANT_VALUE[plant][:, None] + 2, self.elektro)
+                reach[g, starter] = np.maximum(reach[g, starter], min_bid)
+                reach = np.where(bought, -1, reach)
+                # Ties go to the starter, who holds the opening bid
+                tie_break = np.zeros_like(reach)
+                tie_break[g, starter] = 1
+                winner = (reach * 2 + tie_break).argmax(axis=1)
+                runner_up = np.where(np.arange(self.num_players) == winner[:, None], -1, reach).max(axis=1)
+                price = np.where(runner_up > min_bid,
+                                 np.maximum(min_bid, np.minimum(reach[g, winner], runner_up + 3)),
+                                 min_bid)
+
+                won = auction
+                w = winner[won]
+                self.elektro[g[won], w] -= price[won]
+                # Fill an empty slot, or replace the cheapest plant (choose_power_plant_to_discard)
+                slots = self.plants[g[won], w]
+                full = (slots != NO_PLANT).all(axis=1)
+                target = np.where(full, slots.argmin(axis=1), slots.argmax(axis=1))
+                self.plants[g[won], w, target] = plant[won]
+                bought[g[won], w] = True
+                self._refill_plant_markets(g[won], slot[won])
+
+    def phase3(self):
+        """
+        Resource purchases in reverse turn order, decided with the greedy rule of the header (not the
+        plan_purchase of decide_resources_to_buy) and charged at the market price like handle_resource_purchase.
+        """
+        g = self.games
+        active = ~self.finished
+        for position in reversed(range(self.num_players)):
+            player = self.order[:, position]
+            plants = self.plants[g, player]
+            uses = PLANT_USES[plants]
+            needs = (uses * PLANT_NEED[plants][..., None]).sum(axis=1)
+            storage = needs * 2
+            stock = self.resources[g, player]
+            market = self.market_resources
+
+            # Cheapest resource first, priced at the next unit
+            unit_cost = PRICE_LADDER[np.arange(len(RESOURCES)), market]
+            priority = np.argsort(np.where(market > 0, unit_cost, 10 ** 6), axis=1, kind="stable")
+
+            budget = self.elektro[g, player].astype(np.float64)
+            purchases = np.zeros_like(stock)
+            for rank in range(len(RESOURCES)):
+                r = priority[:, rank]
+                cost = unit_cost[g, r]
+                units = np.minimum(np.minimum(needs[g, r], market[g, r]), storage[g, r] - stock[g, r])
+                units = np.where(cost > 0, np.minimum(units, budget // np.maximum(cost, 1)), 0)
+                over_limit = units * cost > budget * 0.6
+                units = np.where(over_limit, np.minimum(units, (budget * 0.6) // np.maximum(cost, 1)), units)
+                units = np.maximum(units, 0).astype(np.int64)
+                purchases[g, r] = units
+                budget -= units * cost
+
+            # The manager charges the real price, unit by unit, and refuses what the player can't pay
+            for r in range(len(RESOURCES)):
+                units = purchases[:, r]
+                price = PRICE_PREFIX[r, market[:, r]] - PRICE_PREFIX[r, market[:, r] - units]
+                accepted = active & (units > 0) & (price <= self.elektro[g, player])
+                self.elektro[g, player] -= np.where(accepted, price, 0)
+                self.resources[g, player, r] += np.where(accepted, units, 0)
+                self.market_resources[:, r] -= np.where(accepted, units, 0)
+
+    def phase4(self):
+        """
+        Building in reverse turn order, like decide_cities_to_build and BoardMap.plan_build: every player
+        keeps adding the cheapest city to connect to their network as it grows during the turn
+        (least occupied city first between equal costs, then map order), while elektro and houses last.
+        """
+        g = self.games
+        active = ~self.finished
+        num_cities = len(CITY_TAGS)
+        city_order = np.broadcast_to(np.arange(num_cities), (self.num_games, num_cities))
+        for position in reversed(range(self.num_players)):
+            player = self.order[:, position]
+            occupancy = unpack_cities(self.cities).sum(axis=1)
+            owned = unpack_cities(self.cities[g, player])
+
+            # Connection cost of every city to the player's network (0 everywhere without a city)
+            has_network = owned.any(axis=1)
+            reach = np.where(has_network[:, None], self._reach(owned), 0)
+            remaining = ~owned & (occupancy < STEP) & self.playable
+            houses = HOUSES - owned.sum(axis=1)
+            building = active.copy()
+
+            while building.any():
+                total = reach + building_cost[STEP]
+                affordable = remaining & (total <= self.elektro[g, player][:, None])
+                ranked = np.lexsort((city_order, occupancy, np.where(affordable, total, np.inf)), axis=-1)
+                city = ranked[:, 0]
+                building &= affordable.any(axis=1) & (houses > 0)
+
+                self.elektro[g, player] -= np.where(building, total[g, city], 0).astype(np.int64)
+                self.cities[g, player] |= np.where(building, np.uint64(1) << CITY_BITS[city], np.uint64(0))
+                remaining[g[building], city[building]] = False
+                # The first city of a network is its only source: the next ones pay their connection to it
+                first = building & ~has_network
+                distances = self.board_distance[self.board, city]
+                reach = np.where(building[:, None], np.minimum(reach, distances), reach)
+                reach = np.where(first[:, None], distances, reach)
+                has_network |= building
+                houses -= building
+
+    def phase5(self):
+        """
+        Bureaucracy: power cities like decide_cities_to_power (the allocation of fuel_planner.allocate_fuel),
+        cash in, refill the markets, then end the games as check_game_end does.
+        """
+        active = ~self.finished
+        city_count = popcount(self.cities)
+        held = self.resources
+        slots = np.take_along_axis(self.plants, PLANT_FUEL_ORDER[self.plants].argsort(axis=-1, kind="stable"), axis=-1)
+        fuelled = PLANT_USES[slots].any(axis=-1)
+        free_cities = np.where(fuelled, 0, PLANT_CITIES[slots]).sum(axis=-1)  # eco plants always run
+
+        # Every subset of the 3 plant slots, ranked as allocate_fuel does: most cities (up to the cities
+        # owned), then least valuable fuel burnt, then most of the scarcer of coal and oil left
+        best_cities = np.full_like(city_count, -1)
+        best_value = np.zeros(city_count.shape)
+        best_scarce = np.zeros_like(city_count)
+        consumed = np.zeros_like(held)
+        for mask in range(1 << 3):
+            selected = [slot for slot in range(3) if mask >> slot & 1]
+            plants = slots[:, :, selected]
+            cities = free_cities + np.where(fuelled[:, :, selected], PLANT_CITIES[plants], 0).sum(axis=-1)
+            cities = np.minimum(cities, city_count)
+            needs = PLANT_SINGLE_NEED[plants].sum(axis=2)
+            hybrid_need = PLANT_HYBRID_NEED[plants].sum(axis=-1)
+            left = held - needs
+            coal, oil = left[..., 0], left[..., 1]
+            feasible = (left.min(axis=-1) >= 0) & (coal + oil >= hybrid_need)
+
+            # Split the hybrid need between coal and oil, keeping as much as possible of the scarcer one
+            coal_share = np.minimum(np.maximum(np.maximum((coal - oil + hybrid_need) // 2, hybrid_need - oil), 0),
+                                    np.minimum(hybrid_need, coal))
+            burnt = needs.copy()
+            burnt[..., 0] += coal_share
+            burnt[..., 1] += hybrid_need - coal_share
+            value = burnt @ FUEL_VALUE
+            scarce = np.minimum(coal - coal_share, oil - hybrid_need + coal_share)
+
+            better = feasible & ((cities > best_cities) |
+                                 (cities == best_cities) & ((value < best_value) |
+                                                            (value == best_value) & (scarce > best_scarce)))
+            best_cities = np.where(better, cities, best_cities)
+            best_value = np.where(better, value, best_value)
+            best_scarce = np.where(better, scarce, best_scarce)
+            consumed = np.where(better[..., None], burnt, consumed)
+
+        powered = best_cities  # the empty subset is always feasible
+        resources = held - consumed
+        income = CASHBACK[np.minimum(powered, len(CASHBACK) - 1)]
+        self.elektro += np.where(active[:, None], income, 0)
+        self.resources = np.where(active[:, None, None], resources, self.resources)
+        self.cities_powered = np.where(active[:, None], powered, self.cities_powered)
+
+        # Resource market: replenish up to the maximum of each resource
+        refilled = np.minimum(self.market_resources + self.replenishment, MARKET_MAX)
+        self.market_resources = np.where(active[:, None], refilled, self.market_resources)
+
+        # Power plant market: the lowest current plant leaves while the deck lasts
+        rotate = self.games[active & (self.deck_position < self.deck.shape[1])]
+        self._refill_plant_markets(rotate, 0)
+
+        # End of the game, when a player reached game_end_cities or, as BoardMap.is_full, when every player
+        # has a network and none can reach a city with room left: most cities powered wins, then most Elektro
+        owned = unpack_cities(self.cities)
+        occupancy = owned.sum(axis=1)
+        can_build = np.zeros(self.num_games, dtype=bool)
+        for player in range(self.num_players):
+            room = np.isfinite(self._reach(owned[:, player])) & ~owned[:, player] & (occupancy < STEP)
+            can_build |= room.any(axis=1)
+        full = owned.any(axis=2).all(axis=1) & ~can_build
+        ended = active & ((city_count >= game_end_cities[self.num_players]).any(axis=1) | full)
+        score = self.cities_powered * 10 ** 6 + self.elektro
+        self.winner = np.where(ended, score.argmax(axis=1), self.winner)
+        self.rounds = np.where(ended, self.round, self.rounds)
+        self.finished |= ended
+
+    def run(self, max_rounds=100):
+        """
+        Plays every game to the end, all rounds in lockstep.
+
+        :param max_rounds: Games still running after this many rounds are left unfinished (winner -1).
+        :return: Dictionary of arrays {'winner': player index, 'rounds', 'elektro', 'cities'}.
+        """
+        while not self.finished.all() and self.round <= max_rounds:
+            self.phase1()
+            self.phase2()
+            self.phase3()
+            self.phase4()
+            self.phase5()
+            self.round += 1
+
+        return {
+            "winner": self.winner,
+            "rounds": self.rounds,
+            "elektro": self.elektro,
+            "cities": popcount(self.cities)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many simplified Power Grid games in lockstep with NumPy.")
+    parser.add_argument("--games", type=int, default=10000, help="number of games")
+    parser.add_argument("--players", type=int, default=3, help="players per game (2-6)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the batch")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = BatchGames(args.games, args.players, seed=args.seed).run()
+    elapsed = time.perf_counter() - start
+
+    finished = result["winner"] >= 0
+    print(f"Played {args.games} games in {elapsed:.2f} s ({args.games / elapsed:.0f} games/s), "
+          f"{finished.sum()} finished.")
+    print(f"Average rounds: {result['rounds'][finished].mean():.1f}")
+    wins = np.bincount(result["winner"][finished], minlength=args.players)
+    for player, count in enumerate(wins):
+        print(f"player{player + 1}: {count} wins")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+# benchmarks.py
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import timeit
+
+from game_context import GameContext
+from headless import HeadlessPlayer, HeadlessPlayerBehaviour, run_headless_game
+from map_generator import generate_map
+from map_graph import BoardMap, zonesUS
+from objects import ResourceMarket, power_plant_plug, power_plant_socket
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# A mid-game board: 3 players with 6 cities each, 2 or 3 power plants and some resources
+PLAYER_CITIES = {
+    1: ["SEA", "POR", "BOI", "BIL", "CHE", "DEN"],
+    2: ["SFO", "LVG", "LAX", "SLC", "PHX", "SDG"],
+    3: ["KSC", "OKC", "DAL", "HOU", "MEM", "NOA"],
+}
+PLAYER_PLANTS = {
+    1: [power_plant_plug[1], power_plant_socket[0]],  # coal 8, coal 20
+    2: [power_plant_plug[4], power_plant_socket[19], power_plant_socket[22]],  # oil 3, hybrid 21, eco 18
+    3: [power_plant_plug[9], power_plant_socket[10]],  # uranium 11, garbage 19
+}
+
+
+def mid_game_context():
+    """
+    Builds a seeded 3-player game on the full map with PLAYER_CITIES and PLAYER_PLANTS in place.
+
+    :return: The GameContext.
+    """
+    context = GameContext(3, seed=0, zones=list(zonesUS))
+    environment = context.environment
+    for player_id, cities in PLAYER_CITIES.items():
+        jid = f"player{player_id}@localhost"
+        for city in cities:
+            environment.map.update_owner(jid, city)
+        inventory = environment.players[player_id]
+        inventory['cities_owned'] = list(cities)
+        inventory['number_cities_owned'] = len(cities)
+        inventory['power_plants'] = list(PLAYER_PLANTS[player_id])
+        inventory['resources'] = {"coal": 2, "oil": 1, "garbage": 0, "uranium": 0}
+        inventory['elektro'] = 120
+    return context
+
+
+def player_behaviour(context, player_id):
+    """
+    A player behaviour of the headless engine, to call its decision methods directly.
+    """
+    behaviour = HeadlessPlayerBehaviour()
+    behaviour.agent = HeadlessPlayer(f"player{player_id}@localhost", player_id, context)
+    return behaviour
+
+
+########################  BENCHMARKS  ########################
+# Each one prepares its state and returns the function to time, which must leave the state as it found it.
+
+def bench_get_connection_cost():
+    board_map = mid_game_context().environment.map
+    return lambda: board_map.get_connection_cost("player1@localhost", "NYC")
+
+
+def bench_is_connected():
+    board_map = mid_game_context().environment.map
+    return lambda: board_map.is_connected("player1@localhost", "NYC")
+
+
+def bench_count_player_cities():
+    # The view is memoized until the next change of owners: drop it first, to time the count itself
+    board_map = mid_game_context().environment.map
+
+    def count():
+        board_map._changed()
+        board_map.count_player_cities()
+    return count
+
+
+def bench_connection_costs_dijkstra():
+    # Pricing a whole network from scratch, as on a map too large for the all-pairs matrix
+    # (get_connection_cost itself reads the player's frontier, kept up to date by update_owner)
+    board_map = mid_game_context().environment.map
+    owned_ids = [board_map.city_ids[city] for city in PLAYER_CITIES[1]]
+    return lambda: board_map.graph.shortest_costs(owned_ids)
+
+
+def bench_resource_price():
+    market = ResourceMarket(coal=14)
+    return lambda: market.resource_price("coal")
+
+
+def bench_purchase_resource():
+    market = ResourceMarket()
+
+    def purchase():
+        market.in_market["coal"] = 24
+        market.purchase_resource("coal", 6)
+    return purchase
+
+
+def bench_update_markets():
+    market = GameContext(3, seed=0).environment.power_plant_market
+    snapshot = market.snapshot()
+
+    def update():
+        # Remove the cheapest plant, as after an auction, and refill the markets
+        market.restore(snapshot)
+        market.current_market.pop(0)
+        market.update_markets()
+    return update
+
+
+def bench_decide_resources_to_buy():
+    context = mid_game_context()
+    behaviour = player_behaviour(context, 2)
+    in_market = dict(context.environment.resource_market.in_market)
+
+    def decide():
+        behaviour.agent.elektro = 120
+        behaviour.decide_resources_to_buy(in_market)
+    return decide
+
+
+def bench_decide_cities_to_build():
+    context = mid_game_context()
+    behaviour = player_behaviour(context, 1)
+    agent = behaviour.agent
+    map_status = context.environment.map.get_status()
+    cities, elektro, houses = list(agent.cities_owned), agent.elektro, agent.houses
+
+    def decide():
+        behaviour.decide_cities_to_build(map_status)
+        agent.cities_owned[:] = cities
+        agent.elektro, agent.houses = elektro, houses
+        agent.update_inventory()
+    return decide
+
+
+def bench_headless_game():
+    # Pinned to the full map: without zones, every game would play a random zone sub-map of its own
+    return lambda: asyncio.run(run_headless_game(GameContext(3, seed=0, zones=list(zonesUS))))
+
+
+BENCHMARKS = {
+    "get_connection_cost": bench_get_connection_cost,
+    "is_connected": bench_is_connected,
+    "count_player_cities": bench_count_player_cities,
+    "connection_costs_dijkstra": bench_connection_costs_dijkstra,
+    "resource_price": bench_resource_price,
+    "purchase_resource": bench_purchase_resource,
+    "update_markets": bench_update_markets,
+    "decide_resources_to_buy": bench_decide_resources_to_buy,
+    "decide_cities_to_build": bench_decide_cities_to_build,
+    "headless_game": bench_headless_game,
+}
+
+
+########################  SCALING BENCHMARKS  ########################
+# The same calls on generated maps of growing size, to catch the ones that grow faster than the map
+
+SCALING_SIZES = (100, 1000, 10000)
+SCALING_PLAYERS = (3, 6)
+SCALING_CITIES_PER_PLAYER = 10
+# Growth exponent (time ~ cities ** exponent) above which a benchmark is reported as superlinear
+SCALING_MAX_EXPONENT = 1.5
+
+
+def scaled_context(num_cities, num_players, seed=0):
+    """
+    Builds a seeded game on a generated map, every player owning SCALING_CITIES_PER_PLAYER connected cities
+    (grown from a random city, as a network grows during a game), with some elektro.
+
+    :return: Tuple (GameContext, cities, links) of the map.
+    """
+    cities, links, zones = generate_map(num_cities, seed)
+    context = GameContext(num_players, seed=seed)
+    environment = context.environment
+    board_map = environment.map = BoardMap(cities, links)
+    environment.zones = None
+
+    for player_id in range(1, num_players + 1):
+        jid = f"player{player_id}@localhost"
+        owned = []
+        queue = [context.rng.randrange(num_cities)]
+        while queue and len(owned) < SCALING_CITIES_PER_PLAYER:
+            city_id = queue.pop(0)
+            city = board_map.city_tags[city_id]
+            if city in owned or board_map.get_occupancy(city) >= environment.step:
+                continue
+            board_map.update_owner(jid, city)
+            owned.append(city)
+            queue.extend(neighbour for neighbour, weight in board_map.graph.adjacency[city_id])
+
+        inventory = environment.players[player_id]
+        inventory['cities_owned'] = owned
+        inventory['number_cities_owned'] = len(owned)
+        inventory['elektro'] = 120
+    return context, cities, links
+
+
+def scale_construction(context, cities, links):
+    return lambda: BoardMap(cities, links)
+
+
+def scale_get_connection_cost(context, cities, links):
+    board_map = context.environment.map
+    far_city = board_map.city_tags[-1]
+    return lambda: board_map.get_connection_cost("player1@localhost", far_city)
+
+
+def scale_is_connected(context, cities, links):
+    board_map = context.environment.map
+    far_city = board_map.city_tags[-1]
+    return lambda: board_map.is_connected("player1@localhost", far_city)
+
+
+def scale_get_status(context, cities, links):
+    # Dropping the memoized status first, to time building it rather than a cache hit
+    board_map = context.environment.map
+
+    def status():
+        board_map._changed()
+        board_map.get_status()
+    return status
+
+
+def scale_decide_cities_to_build(context, cities, links):
+    behaviour = player_behaviour(context, 1)
+    agent = behaviour.agent
+    map_status = context.environment.map.get_status()
+    owned, elektro, houses = list(agent.cities_owned), agent.elektro, agent.houses
+
+    def decide():
+        behaviour.decide_cities_to_build(map_status)
+        agent.cities_owned[:] = owned
+        agent.elektro, agent.houses = elektro, houses
+        agent.update_inventory()
+    return decide
+
+
+SCALING_BENCHMARKS = {
+    "construction": scale_construction,
+    "get_connection_cost": scale_get_connection_cost,
+    "is_connected": scale_is_connected,
+    "get_status": scale_get_status,
+    "decide_cities_to_build": scale_decide_cities_to_build,
+}
+
+
+def run_scaling(names=None, sizes=SCALING_SIZES, players=SCALING_PLAYERS, repeat=3):
+    """
+    Times the scaling benchmarks on every map size and number of players, silenced like run_benchmarks.
+
+    :return: Dictionary {(name, players): [seconds per call for each size]}.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for num_players in players:
+            for size in sizes:
+                context, cities, links = scaled_context(size, num_players)
+                for name in names or SCALING_BENCHMARKS:
+                    timing = measure(SCALING_BENCHMARKS[name](context, cities, links), repeat)
+                    results.setdefault((name, num_players), []).append(timing)
+    return results
+
+
+def growth_exponents(sizes, timings):
+    """
+    :return: Exponent of the growth between each pair of consecutive sizes: 0 for a constant time,
+             1 for a time proportional to the size, 2 for a quadratic one.
+    """
+    return [math.log(timings[i + 1] / timings[i]) / math.log(sizes[i + 1] / sizes[i]) for i in range(len(sizes) - 1)]
+
+
+def measure(function, repeat=5):
+    """
+    Times a function with timeit: enough calls per run to last about 0.2 s, best of several runs.
+
+    :param function: Function without arguments.
+    :param repeat: Number of runs.
+    :return: Seconds per call of the fastest run.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_benchmarks(names=None, repeat=5):
+    """
+    Runs the benchmarks with the agents' terminal output and the map's logging silenced.
+
+    :param names: Names of the benchmarks to run (all of them if None).
+    :param repeat: Number of timed runs of each benchmark.
+    :return: Dictionary {name: seconds per call}.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name in names or BENCHMARKS:
+            results[name] = measure(BENCHMARKS[name](), repeat)
+    return results
+
+
+def load_baseline(path=BASELINE_FILE):
+    """
+    :return: The stored results {name: seconds per call}, or {} if there is no baseline yet.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file).get("results", {})
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """
+    Stores the results as the new baseline, merged with the stored ones of benchmarks that weren't run.
+    """
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, "w") as baseline_file:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": baseline
+        }, baseline_file, indent=4, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def format_time(seconds):
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+
+def scaling_report(names, sizes, players, repeat):
+    """
+    Prints the time of every scaling benchmark per map size, and its growth exponents.
+
+    :return: 1 if a benchmark grows faster than cities ** SCALING_MAX_EXPONENT, 0 otherwise.
+    """
+    results = run_scaling(names, sizes, players, repeat)
+
+    superlinear = []
+    print(f"{'Benchmark':<24} | {'Players':>7} | " + " | ".join(f"{size:>9}" for size in sizes) + " | Growth")
+    print("-" * (47 + 12 * len(sizes)))
+    for (name, num_players), timings in results.items():
+        exponents = growth_exponents(sizes, timings)
+        flag = "  SUPERLINEAR" if exponents and max(exponents) > SCALING_MAX_EXPONENT else ""
+        if flag:
+            superlinear.append(name)
+        print(f"{name:<24} | {num_players:>7} | " + " | ".join(f"{format_time(t):>9}" for t in timings)
+              + " | " + " ".join(f"{exponent:.2f}" for exponent in exponents) + flag)
+    return 1 if superlinear else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the hot paths, compared against a stored baseline.")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark, the best one counts")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="ratio to the baseline above which a benchmark is reported as a regression")
+    parser.add_argument("--save", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file")
+    parser.add_argument("--scaling", action="store_true",
+                        help=f"run the scaling benchmarks instead: {', '.join(SCALING_BENCHMARKS)}")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SCALING_SIZES),
+                        help="map sizes of the scaling benchmarks")
+    parser.add_argument("--players", type=int, nargs="+", default=list(SCALING_PLAYERS),
+                        help="player counts of the scaling benchmarks")
+    args = parser.parse_args()
+
+    known = SCALING_BENCHMARKS if args.scaling else BENCHMARKS
+    unknown = [name for name in args.names if name not in known]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    if args.scaling:
+        return scaling_report(args.names, sorted(args.sizes), args.players, args.repeat)
+
+    baseline = load_baseline(args.baseline)
+    results = run_benchmarks(args.names, args.repeat)
+
+    regressions = []
+    print(f"{'Benchmark':<26} | {'Time':>11} | {'Baseline':>11} | Ratio")
+    print("-" * 62)
+    for name, seconds in results.items():
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            flag = "  REGRESSION" if ratio > args.tolerance else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:<26} | {format_time(seconds):>11} | {format_time(baseline[name]):>11} | {ratio:.2f}{flag}")
+        else:
+            print(f"{name:<26} | {format_time(seconds):>11} | {'-':>11} | -")
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}.")
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
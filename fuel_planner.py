@@ -0,0 +1,177 @@
+# fuel_planner.py
+
+from collections import namedtuple
+from functools import lru_cache
+
+from objects import PRICE_LADDERS, PRICE_PREFIX
+
+RESOURCES = ("coal", "oil", "garbage", "uranium")
+COAL, OIL, GARBAGE, URANIUM = range(4)
+
+# QUOTES[resource][n][k]: cost of buying k units of a resource with n units in the market, as ResourceMarket.quote
+QUOTES = {
+    resource: [(prefix[n] - prefix[n::-1]).tolist() for n in range(len(prefix))]
+    for resource, prefix in PRICE_PREFIX.items()
+}
+# Average price of a unit of every resource over its ladder (uranium, the scarcest, is the dearest): the fuel
+# burnt first when several allocations power as many cities is the cheapest one
+FUEL_VALUE = [PRICE_LADDERS[resource][1:].mean().item() for resource in RESOURCES]
+
+# Result of allocate_fuel: cities powered, and units of each resource burnt (a tuple in RESOURCES order)
+FuelAllocation = namedtuple("FuelAllocation", ["cities", "consumed"])
+
+
+def plant_key(plants):
+    """
+    :param plants: List of PowerPlant.
+    :return: Hashable key of what the plants burn and power, the same whatever their order.
+    """
+    return tuple(sorted((plant.cities, tuple(plant.resource_type), plant.resource_num, plant.is_hybrid)
+                        for plant in plants))
+
+
+def plant_subsets(plants):
+    """
+    Every subset of the fuelled plants that can be run together, with what it needs.
+
+    :param plants: List of PowerPlant.
+    :return: Tuple of (cities, needs, hybrid_need): the cities powered by the subset and by the ecological plants,
+             the units of each resource needed by its single-fuel plants (a tuple in RESOURCES order), and the coal
+             and/or oil needed by its hybrid plants.
+    """
+    return _plant_subsets(plant_key(plants))
+
+
+@lru_cache(maxsize=4096)
+def _plant_subsets(key):
+    free_cities = sum(cities for cities, resource_type, _, _ in key if not resource_type)
+    fuelled = [plant for plant in key if plant[1]]
+    subsets = []
+    for mask in range(1 << len(fuelled)):
+        cities = free_cities
+        needs = [0, 0, 0, 0]
+        hybrid_need = 0
+        for i, (plant_cities, resource_type, resource_num, is_hybrid) in enumerate(fuelled):
+            if mask >> i & 1:
+                cities += plant_cities
+                if is_hybrid:
+                    hybrid_need += resource_num
+                else:
+                    needs[RESOURCES.index(resource_type[0])] += resource_num
+        subsets.append((cities, tuple(needs), hybrid_need))
+    return tuple(subsets)
+
+
+def storage_capacity(plants):
+    """
+    :param plants: List of PowerPlant.
+    :return: Tuple (capacity, hybrid_capacity): the units of each resource the single-fuel plants can store
+             (a list in RESOURCES order), and the coal and/or oil the hybrid plants can store between them.
+             Every plant stores twice the resources it burns.
+    """
+    capacity = [0, 0, 0, 0]
+    hybrid_capacity = 0
+    for plant in plants:
+        if plant.resource_type:
+            if plant.is_hybrid:
+                hybrid_capacity += 2 * plant.resource_num
+            else:
+                capacity[RESOURCES.index(plant.resource_type[0])] += 2 * plant.resource_num
+    return capacity, hybrid_capacity
+
+
+def storage_overflow(stock, capacity, hybrid_capacity):
+    """
+    :return: Number of units of the stock (a list in RESOURCES order) that don't fit in the plants,
+             the coal and oil left over by their own plants going to the hybrid ones.
+    """
+    overflow = max(stock[GARBAGE] - capacity[GARBAGE], 0) + max(stock[URANIUM] - capacity[URANIUM], 0)
+    hybrid = max(stock[COAL] - capacity[COAL], 0) + max(stock[OIL] - capacity[OIL], 0)
+    return overflow + max(hybrid - hybrid_capacity, 0)
+
+
+def plan_purchase(plants, stock, market, budget, city_cap=None):
+    """
+    The cheapest purchase that lets the plants power as many cities as possible next round.
+    Every subset of plants is tried, and for the hybrid plants every split of their need between coal and oil;
+    the subset is priced with the exact quotes of the market (the stock already held is used first), and kept
+    if it is within the budget, the market has the units and the plants can store them.
+
+    :param plants: List of PowerPlant of the player.
+    :param stock: Dictionary {resource: units} held by the player.
+    :param market: Dictionary {resource: units} in the market.
+    :param budget: Elektro that can be spent.
+    :param city_cap: Most cities that can be powered (e.g. the cities owned), None for no limit.
+    :return: Tuple (purchases {resource: units}, total_cost, cities powered next round).
+    """
+    held = [stock.get(resource, 0) for resource in RESOURCES]
+    quotes = [QUOTES[resource][min(market.get(resource, 0), len(QUOTES[resource]) - 1)] for resource in RESOURCES]
+    capacity, hybrid_capacity = storage_capacity(plants)
+    overflow = storage_overflow(held, capacity, hybrid_capacity)
+
+    best_cities, best_cost, best_buy = 0, 0, [0, 0, 0, 0]
+    for cities, needs, hybrid_need in plant_subsets(plants):
+        if city_cap is not None:
+            cities = min(cities, city_cap)
+        if cities < best_cities:
+            continue
+
+        garbage = max(needs[GARBAGE] - held[GARBAGE], 0)
+        uranium = max(needs[URANIUM] - held[URANIUM], 0)
+        if garbage >= len(quotes[GARBAGE]) or uranium >= len(quotes[URANIUM]):
+            continue
+        fixed_cost = quotes[GARBAGE][garbage] + quotes[URANIUM][uranium]
+
+        # Split the hybrid need: coal_share units of coal, the rest oil
+        for coal_share in range(hybrid_need + 1):
+            coal = max(needs[COAL] + coal_share - held[COAL], 0)
+            oil = max(needs[OIL] + hybrid_need - coal_share - held[OIL], 0)
+            if coal >= len(quotes[COAL]) or oil >= len(quotes[OIL]):
+                continue
+            cost = fixed_cost + quotes[COAL][coal] + quotes[OIL][oil]
+            if cost > budget or (cities == best_cities and cost >= best_cost):
+                continue
+            buy = [coal, oil, garbage, uranium]
+            if storage_overflow([held[r] + buy[r] for r in range(4)], capacity, hybrid_capacity) > overflow:
+                continue
+            best_cities, best_cost, best_buy = cities, cost, buy
+
+    return dict(zip(RESOURCES, best_buy)), best_cost, best_cities
+
+
+def allocate_fuel(plants, stock, city_cap=None):
+    """
+    The best use of the resources held in phase 5: the plants to run, and the coal or oil burnt by the hybrid
+    ones, so as to power as many cities as possible, no more than city_cap. Among the allocations powering as
+    many cities, the one burning the least valuable fuel is kept (see FUEL_VALUE), and then the one leaving the
+    most of the coal or oil the player has least of. The plants' order doesn't matter.
+    Results are memoized on (plant set, resources held, city cap), which repeat a lot over simulated games.
+
+    :param plants: List of PowerPlant.
+    :param stock: Dictionary {resource: units} held.
+    :param city_cap: Most cities that can be powered (the cities owned), None for no limit.
+    :return: FuelAllocation (cities powered, units of each resource burnt in RESOURCES order). Shared by the
+             callers with the same state, so it must not be modified.
+    """
+    return _allocate_fuel(plant_key(plants), tuple(stock.get(resource, 0) for resource in RESOURCES), city_cap)
+
+
+@lru_cache(maxsize=65536)
+def _allocate_fuel(key, held, city_cap):
+    best, best_rank = FuelAllocation(0, (0, 0, 0, 0)), None
+    for cities, needs, hybrid_need in _plant_subsets(key):
+        if city_cap is not None:
+            cities = min(cities, city_cap)
+        left = [held[r] - needs[r] for r in range(4)]
+        if min(left) < 0 or left[COAL] + left[OIL] < hybrid_need:
+            continue
+
+        # Split the hybrid need between coal and oil, keeping as much as possible of the scarcer one
+        coal_share = min(max((left[COAL] - left[OIL] + hybrid_need) // 2, hybrid_need - left[OIL], 0),
+                         hybrid_need, left[COAL])
+        consumed = (needs[COAL] + coal_share, needs[OIL] + hybrid_need - coal_share, needs[GARBAGE], needs[URANIUM])
+        value = sum(units * FUEL_VALUE[r] for r, units in enumerate(consumed))
+        rank = (cities, -value, min(left[COAL] - coal_share, left[OIL] - hybrid_need + coal_share))
+        if best_rank is None or rank > best_rank:
+            best, best_rank = FuelAllocation(cities, consumed), rank
+    return best
@@ -0,0 +1,69 @@
+# game_context.py
+
+import random
+
+from game_environment import Environment
+
+
+class GameContext:
+    """
+    Everything that belongs to one game: its environment (board, markets, inventories), its random
+    generator and its log.
+    It is handed to the game manager and to every player, so several games can live in the same
+    process, or even in the same event loop, without sharing any state.
+    """
+    def __init__(self, num_players, seed=None, log_path=None, echo=False, fast_forward=False, zones=None,
+                 map_path=None):
+        """
+        :param num_players: Number of players, between 2 and 6.
+        :param seed: Seed of the game's random generator. The same seed replays the same game.
+        :param log_path: File written by update_log, e.g. 'log.txt'. None turns the log off.
+        :param echo: Also print every log message to the terminal.
+        :param fast_forward: Drop the fixed pauses between phases, player cycles and status screens,
+                             so the game moves on as soon as the replies it waits for arrive.
+        :param zones: Colors of the map regions to play (keys of zonesUS in map_graph.py). None picks
+                      as many adjacent regions as the rules give for the number of players.
+        :param map_path: Map file (.json or .graphml, see map_loader.py) to play on instead of the US map.
+                         Its zones are only used when given in 'zones'.
+        """
+        if not (2 <= num_players <= 6):
+            raise ValueError("Number of players must be between 2 and 6.")
+
+        self.num_players = num_players
+        self.seed = seed
+        self.log_path = log_path
+        self.echo = echo
+        self.fast_forward = fast_forward
+        # All the randomness of the game (deck, starting order, player choices) comes from here
+        self.rng = random.Random(seed)
+        self.environment = Environment(num_players, self.rng, zones, map_path)
+
+    #######################  METHODS TO CREATE THE LOG  #########################
+    def create_log(self):
+        """
+        Creates or clears the log file of this game.
+        """
+        if not self.log_path:
+            return
+        with open(self.log_path, "w") as log_file:
+            # Opening in 'w' mode ensures the file is emptied if it exists.
+            pass
+        print(f"Log file '{self.log_path}' created or cleared.")
+
+    def update_log(self, message):
+        """
+        Appends the given string to the next line of the log file of this game.
+
+        :argument:
+            message (str): The message to append to the log file.
+        """
+        if self.log_path:
+            with open(self.log_path, "a") as log_file:
+                log_file.write(message + "\n")
+        if self.echo:
+            print(f"Message added to log: {message}")
+
+    def log_break(self):
+        if self.log_path:
+            with open(self.log_path, "a") as log_file:
+                log_file.write("\n" + "-" * 30 + "\n")
@@ -1,6 +1,7 @@
 import os
 from time import sleep
 import random
+from collections import namedtuple
 
 # import pandas and change settings for display the status
 import pandas as pd
@@ -9,7 +10,8 @@ pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
 pd.set_option('display.max_colwidth', None)
 
-from map_graph import BoardMap, citiesUS, edgesUS  # map class
+from map_graph import BoardMap, choose_zones  # map class
+from map_loader import load_map
 from rule_tables import *
 from objects import ResourceMarket, PowerPlantMarket
 
@@ -20,24 +22,65 @@ def clear_screen():
 def split_parts():
     print("\n" + "-" * 30 + "\n")
 
-# Global pointer to the environment instance
-environment_instance = None
+# Everything that changes during a game, as returned by Environment.snapshot()
+EnvironmentSnapshot = namedtuple(
+    "EnvironmentSnapshot",
+    ["inventories", "owners", "resource_market", "power_plant_market", "order_players", "step", "rng_state"]
+)
+
+
+def capture_inventories(*inventories):
+    """
+    Captures dictionaries of player inventories ({player: {field: value}}) without copying them deeply.
+    Every dictionary and list in them is saved with its current content, so restore_inventories can refill
+    the very same objects. Lists shared between inventories stay shared after the restore (the game
+    manager's players hold copies of the environment's, so theirs are not).
+    Power plants are cards that never change, so they are kept by reference.
+
+    :param inventories: One or more dictionaries of player inventories.
+    :return: Tuple of (container, content) pairs.
+    """
+    containers = []
+    for inventory in inventories:
+        containers.append(inventory)
+        for player in inventory.values():
+            containers.append(player)
+            containers.extend(value for value in player.values() if type(value) in (list, dict))
+
+    captured = []
+    seen = set()
+    for container in containers:
+        if id(container) in seen:
+            continue
+        seen.add(id(container))
+        content = tuple(container.items()) if type(container) is dict else tuple(container)
+        captured.append((container, content))
+    return tuple(captured)
+
+
+def restore_inventories(captured):
+    """
+    Refills every container captured by capture_inventories with its saved content.
+
+    :param captured: Value returned by capture_inventories.
+    """
+    for container, content in captured:
+        if type(container) is dict:
+            container.clear()
+            container.update(content)
+        else:
+            container[:] = content
 
-class Environment:
-    _instance = None  # Class-level private variable to hold the singleton instance
 
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(Environment, cls).__new__(cls)
-            # Initialize the instance only once
-            cls._instance.__initialized = False
-        return cls._instance
+class Environment:
+    # One instance per game, owned by its GameContext (game_context.py)
+    def __init__(self, player_no, rng=None, zones=None, map_path=None):
+        # zones: colors of the map regions to play (keys of zonesUS); None picks zones_played[player_no]
+        # adjacent regions at random, as in the original game
+        # map_path: map file to play on instead of the US map (see map_loader.py); there, None zones play the whole map
 
-        # Original initialization logic
-    def __init__(self, player_no):
-        if self.__initialized:  # Prevent re-initialization
-            return
-        self.__initialized = True
+        # Random generator of this game, so that a seed reproduces the whole game
+        self.rng = rng if rng is not None else random.Random()
 
         # ---------------  Full dictionaries imported ----------------
         self.city_cashback = city_cashback
@@ -64,7 +107,14 @@ class Environment:
         # From now on, follows the preparation steps order on the original order
 
         # 1) Map Instance
-        self.map = BoardMap(citiesUS, edgesUS)  # we define the class here, that way we can update costs
+        if map_path is not None:
+            self.zones = list(zones) if zones else None
+            self.map = load_map(map_path, self.zones)
+        else:
+            if zones is None:
+                zones = choose_zones(zones_played[player_no], self.rng)
+            self.zones = list(zones)
+            self.map = BoardMap.from_zones(self.zones)  # we define the class here, that way we can update costs
 
         """
         if self.map:
@@ -72,7 +122,6 @@ class Environment:
             sleep(1)
         """
 
-        # falta escolher as cores das regioes que sao precisas, a subregiao do mapa
 
 
         # 2, 3) Create current available houses and elektro, current  based on number of players
@@ -82,7 +131,7 @@ class Environment:
                   'elektro': 50,
                   'cities_owned': [],
                   'number_cities_owned': 0, # each time a new city is bought, increment
-                  'cities_powered': [],
+                  'cities_powered': 0,  # cities powered in the last bureaucracy phase
                   'power_plants': [],  # List of power plant numbers
                   'resources': {"coal": 0, "oil": 0, "garbage": 0, "uranium": 0},
                   'has_bought_power_plant': False,
@@ -96,7 +145,7 @@ class Environment:
         for player in self.players:
             self.players[player]['houses'] -= 1
             self.order_players.append(player)
-        random.shuffle(self.order_players)
+        self.rng.shuffle(self.order_players)
 
         # Assign positions based on the shuffled order
         for position, player_name in enumerate(self.order_players, start=1):
@@ -109,7 +158,7 @@ class Environment:
         # 7) Corresponds to the 3 variable defined above
 
         # 8) 9) Create the Power Plant Market
-        self.power_plant_market = PowerPlantMarket(player_no)
+        self.power_plant_market = PowerPlantMarket(player_no, self.rng)
 
     def print_environment(self):
         print("\n##########################################################   CURRENT ENVIRONMENT STATUS   ##########################################################  \n")
@@ -211,6 +260,41 @@ class Environment:
         print(f"Initial Future Market: {self.power_plant_market.future_market}")
         print(f"Initial Deck: {self.power_plant_market.deck}")
 
+    def snapshot(self, *inventories):
+        """
+        Captures the state of the game, cheaply enough to take one before every what-if:
+        only the parts that change during a game are saved, the rule tables and the map graph are not.
+
+        :param inventories: Other dictionaries of player inventories holding lists of this environment
+                            (e.g. the game manager's players), captured together so they stay in sync.
+        :return: An EnvironmentSnapshot, to be passed to restore().
+        """
+        return EnvironmentSnapshot(
+            inventories=capture_inventories(self.players, *inventories),
+            owners=self.map.snapshot_owners(),
+            resource_market=self.resource_market.snapshot(),
+            power_plant_market=self.power_plant_market.snapshot(),
+            order_players=tuple(self.order_players),
+            step=self.step,
+            rng_state=self.rng.getstate()
+        )
+
+    def restore(self, snapshot):
+        """
+        Puts the game back in the state captured by snapshot(). A snapshot can be restored any number of times.
+        Player agents keep a copy of their inventory between two messages: call get_inventory() on them
+        after a restore if they are going to play on.
+
+        :param snapshot: An EnvironmentSnapshot of this environment.
+        """
+        restore_inventories(snapshot.inventories)
+        self.map.restore_owners(snapshot.owners)
+        self.resource_market.restore(snapshot.resource_market)
+        self.power_plant_market.restore(snapshot.power_plant_market)
+        self.order_players = list(snapshot.order_players)
+        self.step = snapshot.step
+        self.rng.setstate(snapshot.rng_state)
+
 #os.system('clear')
 #env_test = Environment(3)
 #env_test.print_environment()
@@ -224,8 +308,4 @@ class Environment:
 
 # falta perceber so a funcao final do rule_tables
 # bfs e ou nao preciso, se for e preciso ser updated, se as cidades tem que estar ligadas
-# tbm falta a selecao inicial das zonas, nao sei como querem fazer isso mas as tantas e preciso outro dict
-# que ligue a zona A,B ou C (ou a cor) a uma lista das cidades
-# e importante para a selecao inicial das zonas do mapa, pq acho que se forem menos players, ha menos zonas, ha menos grafo tbm
-# e se for e preciso reduzir para um subgrafo que todas para toda edge (i,j) -> i, j pertencam as zonas legais
 # 🤓👆
\ No newline at end of file
@@ -7,9 +7,12 @@ from spade.message import Message
 import json
 import re
 import logging
+import itertools
+from collections import namedtuple
 
 # Import necessary classes and data structures
 from objects import ResourceMarket, PowerPlantMarket, PowerPlant
+from fuel_planner import RESOURCES, allocate_fuel
 from map_graph import BoardMap, citiesUS, edgesUS
 from rule_tables import (
     city_cashback,
@@ -18,85 +21,207 @@ from rule_tables import (
     step_start_cities,
     game_end_cities
 )
-from game_environment import Environment  # Import Environment class
 
 
 def split_parts():
     print("\n" + "-" * 30 + "\n")
 
-def log_break():
-    with open("log.txt", "a") as log_file:
-        log_file.write("\n" + "-" * 30 + "\n")
-
-#######################  METHODS TO CREATE THE LOG  #########################
-def create_log():
-    """
-    Creates or clears the log file named 'log.txt'.
-    """
-    with open("log.txt", "w") as log_file:
-        # Opening in 'w' mode ensures the file is emptied if it exists.
-        pass
-    print("Log file 'log.txt' created or cleared.")
-
-
-def update_log(message):
-    """
-    Appends the given string to the next line of the log file, called "log.txt".
-
-    :argument:
-        message (str): The message to append to the log file.
-    """
-    with open("log.txt", "a") as log_file:
-        log_file.write(message + "\n")
-    print(f"Message added to log: {message}")
-
 #############################################################################
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# State of a game as seen by the game manager, as returned by GameBehaviour.snapshot()
+GameSnapshot = namedtuple(
+    "GameSnapshot",
+    ["environment", "current_phase", "round", "current_step", "player_order", "game_over", "winner"]
+)
+
 class GameManagerAgent(Agent):
     class GameBehaviour(CyclicBehaviour):
-        def __init__(self, game_manager, player_jids):
+        def __init__(self, game_manager, player_jids, context):
             super().__init__()
             self.game_manager = game_manager
+            self.context = context  # GameContext of this game
             self.player_jids = player_jids  # List of player JIDs
             self.players = {}  # Will be initialized in the setup phase
             self.current_phase = "setup"
             self.round = 1
             self.current_step = 2  # Game starts at Step 1
             self.game_over = False
-            self.environment = None  # Will be initialized in setup phase
+            self.winner = None  # JID of the winner, set by end_game()
+            self.finished = asyncio.Event()  # set by end_game(), lets main.py wait for the end without polling
+
+            # Requests to the players carry a thread id, and replies are matched to them by it
+            self.conversation_ids = itertools.count(1)
+            self.pending_replies = {}  # {thread: (player jid, future resolved with the reply)}
+            self.reply_dispatcher = None  # task reading the mailbox, started with the first request
+            self.environment = None  # Taken from the context in the setup phase
 
         async def run(self):
             if self.game_over:
+                if self.context.fast_forward:
+                    self.kill()  # nothing left to do, stop being scheduled
+                    return
                 await asyncio.sleep(1)
                 return  # Exit the behaviour when the game is over
 
+            await self.run_current_phase()
+            # Each phase only ends once its replies are in, so fast-forward goes straight to the next one
+            if not self.context.fast_forward:
+                await asyncio.sleep(1)
+
+        async def run_current_phase(self):
+            """
+            Runs whichever phase the game is currently in. Used by run() and by the headless engine.
+            """
             if self.current_phase == "setup":
                 await self.setup_phase()
             elif self.current_phase == "phase1":
-                log_break()
+                self.context.log_break()
                 await self.phase1()
             elif self.current_phase == "phase2":
-                log_break()
+                self.context.log_break()
                 await self.phase2()
             elif self.current_phase == "phase3":
-                log_break()
+                self.context.log_break()
                 await self.phase3()
             elif self.current_phase == "phase4":
-                log_break()
+                self.context.log_break()
                 await self.phase4()
             elif self.current_phase == "phase5":
-                log_break()
+                self.context.log_break()
                 await self.phase5()
-            await asyncio.sleep(1)
+
+        ######################  REQUESTS AND REPLIES  ######################
+        async def send_request(self, jid, body):
+            """
+            Sends a request to a player in a new conversation.
+
+            :param jid: The JID of the player.
+            :param body: Dictionary sent as the JSON body.
+            :return: The thread id of the conversation, to be passed to await_reply.
+            """
+            if self.reply_dispatcher is None or self.reply_dispatcher.done():
+                self.reply_dispatcher = asyncio.create_task(self.dispatch_replies())
+
+            thread = f"conversation-{next(self.conversation_ids)}"
+            self.pending_replies[thread] = (jid, asyncio.get_running_loop().create_future())
+
+            msg = Message(to=jid, thread=thread)
+            msg.body = json.dumps(body)
+            await self.send(msg)
+            return thread
+
+        async def await_reply(self, thread, timeout):
+            """
+            Waits for the reply to a request sent with send_request.
+
+            :param thread: The thread id returned by send_request.
+            :param timeout: Seconds to wait.
+            :return: The reply Message, or None after the timeout.
+            """
+            jid, future = self.pending_replies[thread]
+            try:
+                return await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self.pending_replies.pop(thread, None)
+
+        async def request(self, jid, body, timeout):
+            """
+            Sends a request to a player and waits for the reply to that same request.
+
+            :return: The reply Message, or None after the timeout.
+            """
+            thread = await self.send_request(jid, body)
+            return await self.await_reply(thread, timeout)
+
+        async def broadcast_request(self, body, timeout):
+            """
+            Sends the same request to every player at once and gathers the replies concurrently,
+            so a round costs one round-trip whatever the number of players.
+            All the players share one deadline: whoever hasn't replied by then is left out.
+
+            :param body: Dictionary sent as the JSON body.
+            :param timeout: Seconds to wait for all the replies.
+            :return: Dictionary {player_id: reply Message, or None if the player didn't reply in time}.
+            """
+            threads = {}
+            for player_id, player in self.players.items():
+                threads[player_id] = await self.send_request(player["jid"], body)
+
+            futures = {player_id: self.pending_replies[thread][1] for player_id, thread in threads.items()}
+            await asyncio.wait(futures.values(), timeout=timeout)
+
+            replies = {}
+            for player_id, thread in threads.items():
+                future = futures[player_id]
+                replies[player_id] = future.result() if future.done() else None
+                self.pending_replies.pop(thread, None)
+            return replies
+
+        async def dispatch_replies(self):
+            """
+            Reads the mailbox and hands every reply to the request with the same thread id.
+            Late replies and messages from anyone else are dropped right away, so they never
+            take the place of the reply a handler is waiting for.
+            """
+            while True:
+                msg = await self.receive(timeout=60)
+                if msg is None:
+                    continue
+                sender = str(msg.sender).split('/')[0]
+                pending = self.pending_replies.get(msg.thread)
+                if pending is None or pending[0] != sender:
+                    self.context.update_log(f"Ignoring unexpected message from {sender}: {msg.body}")
+                    continue
+                future = pending[1]
+                if not future.done():
+                    future.set_result(msg)
+
+        def stop_reply_dispatcher(self):
+            if self.reply_dispatcher is not None:
+                self.reply_dispatcher.cancel()
+                self.reply_dispatcher = None
+
+        ##########################  SNAPSHOTS  ###########################
+        def snapshot(self):
+            """
+            Captures the game: the environment, the manager's view of the players and the turn state.
+            Meant for lookahead: take a snapshot, play a what-if, restore, as many times as needed.
+
+            :return: A GameSnapshot, to be passed to restore().
+            """
+            return GameSnapshot(
+                environment=self.environment.snapshot(self.players),
+                current_phase=self.current_phase,
+                round=self.round,
+                current_step=self.current_step,
+                player_order=tuple(getattr(self, "player_order", ())),
+                game_over=self.game_over,
+                winner=self.winner
+            )
+
+        def restore(self, snapshot):
+            """
+            Puts the game back in the state captured by snapshot().
+
+            :param snapshot: A GameSnapshot of this game.
+            """
+            self.environment.restore(snapshot.environment)
+            self.current_phase = snapshot.current_phase
+            self.round = snapshot.round
+            self.current_step = snapshot.current_step
+            self.player_order = list(snapshot.player_order)
+            self.game_over = snapshot.game_over
+            self.winner = snapshot.winner
 
         async def setup_phase(self):
             print("Game Manager is setting up the game.")
-            # Initialize the environment with the number of players
-            player_no = len(self.player_jids)
-            self.environment = Environment(player_no)
+            # The environment was built for this game, with the number of players, by its context
+            self.environment = self.context.environment
 
             # Build mappings between JIDs and player IDs
             self.jid_to_player_id = {}
@@ -119,13 +244,15 @@ class GameManagerAgent(Agent):
                     raise KeyError(f"Player ID {player_id} not found in environment.")
 
                 player_data = self.environment.players[player_id]
+                # The manager keeps its own copy of every container: the player agent updates the ones in the
+                # environment in place, and each side books the results of the manager on its own
                 self.players[jid] = {
                     "jid": jid,
                     "name": player_id,
                     "elektro": player_data['elektro'],
-                    "power_plants": player_data['power_plants'],
-                    "resources": player_data['resources'],
-                    "cities": player_data['cities_owned'],
+                    "power_plants": list(player_data['power_plants']),
+                    "resources": dict(player_data['resources']),
+                    "cities": list(player_data['cities_owned']),
                     "houses": player_data['houses'],
                     "position": player_data['position'],
                     "has_bought_power_plant": player_data.get('has_bought_power_plant', False)
@@ -151,11 +278,11 @@ class GameManagerAgent(Agent):
 
             # Proceed to Phase 1
             self.current_phase = "phase1"
-            update_log("Moving to Phase 1")
+            self.context.update_log("Moving to Phase 1")
 
         async def phase1(self):
 
-            update_log("Phase 1: Determine Player Order")
+            self.context.update_log("Phase 1: Determine Player Order")
             # Determine player order based on number of cities and largest power plant
             sorted_players = self.determine_player_order()
 
@@ -174,10 +301,10 @@ class GameManagerAgent(Agent):
 
             # Proceed to Phase 2
             self.current_phase = "phase2"
-            update_log("Moving to Phase 2")
+            self.context.update_log("Moving to Phase 2")
 
         async def phase2(self):
-            update_log("Phase 2: Auction Power Plants")
+            self.context.update_log("Phase 2: Auction Power Plants")
             # Reset players' auction status
             for player in self.players.values():
                 player["has_bought_power_plant"] = False
@@ -191,7 +318,7 @@ class GameManagerAgent(Agent):
 
             # End of Phase 2
             self.current_phase = "phase3"
-            update_log("Moving to Phase 3")
+            self.context.update_log("Moving to Phase 3")
 
         async def handle_player_auction_choice(self, player):
             """
@@ -208,18 +335,14 @@ class GameManagerAgent(Agent):
                 self.serialize_power_plant(pp) for pp in self.environment.power_plant_market.current_market
             ]
 
-            msg = Message(to=player["jid"])
-            msg.body = json.dumps({
+            # Wait for player's response
+            response = await self.request(player["jid"], {
                 "phase": "phase2",
                 "action": "choose_or_pass",
                 "power_plants": available_power_plants,
                 "can_pass": can_pass
-            })
-            await self.send(msg)
-
-            # Wait for player's response
-            response = await self.receive(timeout=30)
-            if response and str(response.sender).split('/')[0] == player["jid"]:
+            }, timeout=30)
+            if response:
                 try:
                     data = json.loads(response.body)
                     choice = data.get("choice", "pass")
@@ -227,12 +350,12 @@ class GameManagerAgent(Agent):
                     #print(f"Invalid JSON response from {player['jid']}. Treating as pass.")
                     choice = "pass"
             else:
-                update_log(f"No response from {player['jid']}. Treating as pass.")
+                self.context.update_log(f"No response from {player['jid']}. Treating as pass.")
                 choice = "pass"
 
             if choice == "pass" and can_pass:
                 player["has_bought_power_plant"] = True
-                update_log(f"{player['jid']} chooses to pass on starting an auction.")
+                self.context.update_log(f"{player['jid']} chooses to pass on starting an auction.")
             elif choice == "auction":
                 chosen_plant_number = data.get("power_plant_number", None)
                 chosen_plant = self.get_power_plant_by_number(chosen_plant_number)
@@ -240,12 +363,12 @@ class GameManagerAgent(Agent):
                     await self.conduct_auction(chosen_plant, player)
                 else:
                     # Invalid choice, treat as pass
-                    update_log(f"Invalid power plant choice by {player['jid']}. They pass this auction phase.")
+                    self.context.update_log(f"Invalid power plant choice by {player['jid']}. They pass this auction phase.")
                     player["has_bought_power_plant"] = True
             else:
                 # Invalid choice or player couldn't pass
                 player["has_bought_power_plant"] = True
-                update_log(f"{player['jid']} cannot afford any power plant and passes.")
+                self.context.update_log(f"{player['jid']} cannot afford any power plant and passes.")
 
         async def conduct_auction(self, power_plant, starting_player):
             active_players = [p for p in self.get_players_in_order() if not p["has_bought_power_plant"]]
@@ -253,19 +376,14 @@ class GameManagerAgent(Agent):
                 active_players.append(starting_player)
             base_min_bid = power_plant.min_bid
 
-            # Prompt starting player for initial bid
-            msg = Message(to=starting_player["jid"])
-            msg.body = json.dumps({
+            # Prompt starting player for initial bid and wait for the response
+            response = await self.request(starting_player["jid"], {
                 "phase": "phase2",
                 "action": "initial_bid",
                 "base_min_bid": base_min_bid,
                 "power_plant": self.serialize_power_plant(power_plant)
-            })
-            await self.send(msg)
-
-            # Wait for player's response
-            response = await self.receive(timeout=15)
-            if response and str(response.sender).split('/')[0] == starting_player["jid"]:
+            }, timeout=15)
+            if response:
                 try:
                     data = json.loads(response.body)
                     bid = data.get("bid", 0)
@@ -274,7 +392,7 @@ class GameManagerAgent(Agent):
                     bid = base_min_bid
             else:
                 # No response; starting player must bid at least the base_min_bid
-                update_log(f"No response from {starting_player['jid']} for initial bid. Starting bid is {base_min_bid}.")
+                self.context.update_log(f"No response from {starting_player['jid']} for initial bid. Starting bid is {base_min_bid}.")
                 bid = base_min_bid
 
             if bid >= base_min_bid and bid <= starting_player["elektro"]:
@@ -284,7 +402,7 @@ class GameManagerAgent(Agent):
                 # Invalid bid; starting player must bid at least the base_min_bid
                 current_bid = base_min_bid
                 highest_bidder = starting_player
-                update_log(f"{starting_player['jid']} made an invalid initial bid. Starting bid is {base_min_bid}.")
+                self.context.update_log(f"{starting_player['jid']} made an invalid initial bid. Starting bid is {base_min_bid}.")
 
             bidding_active = True
             bidders = active_players.copy()
@@ -294,17 +412,13 @@ class GameManagerAgent(Agent):
                 for player in bidders.copy():
                     if player == highest_bidder:
                         continue  # Skip the highest bidder
-                    msg = Message(to=player["jid"])
-                    msg.body = json.dumps({
+                    response = await self.request(player["jid"], {
                         "phase": "phase2",
                         "action": "bid",
                         "current_bid": current_bid,
                         "power_plant": self.serialize_power_plant(power_plant)
-                    })
-                    await self.send(msg)
-
-                    response = await self.receive(timeout=15)
-                    if response and str(response.sender).split('/')[0] == player["jid"]:
+                    }, timeout=15)
+                    if response:
                         try:
                             data = json.loads(response.body)
                             bid = data.get("bid", 0)
@@ -315,15 +429,15 @@ class GameManagerAgent(Agent):
                         if bid > current_bid and bid <= player["elektro"]:
                             current_bid = bid
                             highest_bidder = player
-                            update_log(f"{player['jid']} bids {bid} for power plant {power_plant.min_bid}.")
+                            self.context.update_log(f"{player['jid']} bids {bid} for power plant {power_plant.min_bid}.")
                         else:
-                            update_log(f"{player['jid']} passes or cannot outbid {current_bid}.")
+                            self.context.update_log(f"{player['jid']} passes or cannot outbid {current_bid}.")
                             bidders.remove(player)
                             if len(bidders) == 1:
                                 bidding_active = False
                                 break
                     else:
-                        update_log(f"No response from {player['jid']}. They pass.")
+                        self.context.update_log(f"No response from {player['jid']}. They pass.")
                         bidders.remove(player)
                         if len(bidders) == 1:
                             bidding_active = False
@@ -334,14 +448,14 @@ class GameManagerAgent(Agent):
                 highest_bidder["elektro"] -= current_bid
                 highest_bidder["power_plants"].append(power_plant)
                 highest_bidder["has_bought_power_plant"] = True
-                update_log(f"{highest_bidder['jid']} wins the auction for power plant {power_plant.min_bid} with a bid of {current_bid} Elektro.")
+                self.context.update_log(f"{highest_bidder['jid']} wins the auction for power plant {power_plant.min_bid} with a bid of {current_bid} Elektro.")
 
-                update_log(f"Highest bidder: {highest_bidder}")
+                self.context.update_log(f"Highest bidder: {highest_bidder}")
                 # Handle discard if necessary
                 if len(highest_bidder["power_plants"]) > 3:
                     await self.handle_power_plant_discard(highest_bidder)
 
-                update_log(f"Highest bidder after waiting for discard: {highest_bidder}")
+                self.context.update_log(f"Highest bidder after waiting for discard: {highest_bidder}")
 
                 # Update the power plant market
                 self.environment.power_plant_market.remove_plant_from_market(power_plant)
@@ -363,7 +477,7 @@ class GameManagerAgent(Agent):
                 if starting_player != highest_bidder and not starting_player["has_bought_power_plant"]:
                     await self.handle_player_auction_choice(starting_player)
             else:
-                update_log("Auction ended with no winner.")
+                self.context.update_log("Auction ended with no winner.")
 
         def get_power_plant_by_number(self, number):
             """
@@ -382,17 +496,13 @@ class GameManagerAgent(Agent):
             # Exclude the just bought power plant
             discardable_plants = [pp for pp in player["power_plants"] if pp != player["power_plants"][-1]]
 
-            msg = Message(to=player["jid"])
-            msg.body = json.dumps({
+            # Wait for player's response
+            response = await self.request(player["jid"], {
                 "phase": "phase2",
                 "action": "discard_power_plant",
                 "power_plants": [self.serialize_power_plant(pp) for pp in discardable_plants]
-            })
-            await self.send(msg)
-
-            # Wait for player's response
-            response = await self.receive(timeout=30)
-            if response and str(response.sender).split('/')[0] == player["jid"]:
+            }, timeout=30)
+            if response:
                 try:
                     data = json.loads(response.body)
                     discard_number = data.get("discard_number", None)
@@ -402,23 +512,23 @@ class GameManagerAgent(Agent):
                 discarded_plant = self.get_player_power_plant_by_number(player, discard_number)
                 if discarded_plant and discarded_plant != player["power_plants"][-1]:
                     player["power_plants"].remove(discarded_plant)
-                    update_log(f"{player['jid']} discarded power plant {discarded_plant.min_bid}.")
+                    self.context.update_log(f"{player['jid']} discarded power plant {discarded_plant.min_bid}.")
                 else:
                     # Invalid choice; automatically discard the oldest plant (excluding the just bought one)
                     if discardable_plants:
                         plant_to_discard = discardable_plants[0]
                         player["power_plants"].remove(plant_to_discard)
-                        update_log(f"Invalid discard number from {player['jid']}. Automatically discarding power plant {plant_to_discard.min_bid}.")
+                        self.context.update_log(f"Invalid discard number from {player['jid']}. Automatically discarding power plant {plant_to_discard.min_bid}.")
                     else:
-                        update_log(f"No discardable plants for {player['jid']}.")
+                        self.context.update_log(f"No discardable plants for {player['jid']}.")
             else:
                 # No response; automatically discard the oldest plant (excluding the just bought one)
                 if discardable_plants:
                     plant_to_discard = discardable_plants[0]
                     player["power_plants"].remove(plant_to_discard)
-                    update_log(f"No response from {player['jid']} on discard. Automatically discarding power plant {plant_to_discard.min_bid}.")
+                    self.context.update_log(f"No response from {player['jid']} on discard. Automatically discarding power plant {plant_to_discard.min_bid}.")
                 else:
-                    update_log(f"No discardable plants for {player['jid']}.")
+                    self.context.update_log(f"No discardable plants for {player['jid']}.")
 
         def get_player_power_plant_by_number(self, player, number):
             for plant in player["power_plants"]:
@@ -472,7 +582,7 @@ class GameManagerAgent(Agent):
             }
 
         async def phase3(self):
-            update_log("Phase 3: Buy Resources")
+            self.context.update_log("Phase 3: Buy Resources")
             # Players buy resources in reverse player order
             player_order = self.get_players_in_reverse_order()
             for player in player_order:
@@ -480,67 +590,47 @@ class GameManagerAgent(Agent):
 
             # Proceed to Phase 4
             self.current_phase = "phase4"
-            update_log("Moving to Phase 4")
+            self.context.update_log("Moving to Phase 4")
 
         async def handle_resource_purchase(self, player):
-            msg = Message(to=player["jid"])
-            msg.body = json.dumps({
+            # Wait for player's response
+            response = await self.request(player["jid"], {
                 "phase": "phase3",
                 "action": "buy_resources",
                 "resource_market": self.environment.resource_market.in_market
-            })
-            await self.send(msg)
-
-            # Wait for player's response
-            response = await self.receive(timeout=30)
-            if response and str(response.sender).split('/')[0] == player["jid"]:
+            }, timeout=30)
+            if response:
                 try:
                     data = json.loads(response.body)
                     purchases = data.get("purchases", {})
                 except json.JSONDecodeError:
-                    #update_log(f"Invalid JSON response from {player['jid']} in resource purchase phase.")
+                    #self.context.update_log(f"Invalid JSON response from {player['jid']} in resource purchase phase.")
                     purchases = {}
 
-                total_cost = 0
-
-                for resource, amount in purchases.items():
-                    price = self.calculate_resource_price(resource, amount)
-                    if price <= player["elektro"] and amount <= self.environment.resource_market.in_market.get(resource, 0):
-                        player["elektro"] -= price
+                # The whole basket is priced and bought at once, or not at all
+                receipt = self.environment.resource_market.order(purchases, budget=player["elektro"])
+                if receipt.accepted:
+                    player["elektro"] -= receipt.total_cost
+                    for resource, amount in receipt.purchases.items():
                         player["resources"][resource] += amount
-                        self.environment.resource_market.in_market[resource] -= amount
-                        total_cost += price
-                    else:
-                        update_log(f"{player['jid']} cannot purchase {amount} of {resource}")
+                else:
+                    self.context.update_log(f"{player['jid']} cannot purchase {purchases}: {receipt.reason}")
 
-                # Notify player of the purchase result
+                # Notify player of the purchase result, with the receipt to apply
                 msg = Message(to=player["jid"])
                 msg.body = json.dumps({
                     "phase": "phase3",
                     "action": "purchase_result",
-                    "purchases": purchases,
-                    "total_cost": total_cost
+                    "purchases": receipt.purchases,
+                    "total_cost": receipt.total_cost,
+                    "receipt": receipt._asdict()
                 })
                 await self.send(msg)
             else:
-                update_log(f"No response from {player['jid']} in resource purchase phase.")
-
-        def calculate_resource_price(self, resource, amount):
-            # Implement resource price calculation using the environment's price table
-            total_price = 0
-            resource_market = self.environment.resource_market
-            resource = str(resource).strip()
-            for _ in range(amount):
-                price = resource_market.resource_price(resource)
-                if price is not None:
-                    total_price += price
-                else:
-                    update_log(f"Not enough {resource} available.")
-                    break
-            return total_price
+                self.context.update_log(f"No response from {player['jid']} in resource purchase phase.")
 
         async def phase4(self):
-            update_log("Phase 4: Build Houses")
+            self.context.update_log("Phase 4: Build Houses")
             # Players build houses in reverse player order
             player_order = self.get_players_in_reverse_order()
             for player in player_order:
@@ -548,26 +638,22 @@ class GameManagerAgent(Agent):
 
             # Proceed to Phase 5
             self.current_phase = "phase5"
-            update_log("Moving to Phase 5")
+            self.context.update_log("Moving to Phase 5")
 
         async def handle_build_houses(self, player):
-            msg = Message(to=player["jid"])
-            msg.body = json.dumps({
+            # Wait for player's response
+            response = await self.request(player["jid"], {
                 "phase": "phase4",
                 "action": "build_houses",
                 "map_status": self.environment.map.get_status(),
                 "step": self.current_step
-            })
-            await self.send(msg)
-
-            # Wait for player's response
-            response = await self.receive(timeout=30)
-            if response and str(response.sender).split('/')[0] == player["jid"]:
+            }, timeout=30)
+            if response:
                 try:
                     data = json.loads(response.body)
                     cities_to_build = data.get("cities", [])
                 except json.JSONDecodeError:
-                    #update_log(f"Invalid JSON response from {player['jid']} in build houses phase.")
+                    #self.context.update_log(f"Invalid JSON response from {player['jid']} in build houses phase.")
                     cities_to_build = []
 
                 total_cost = 0
@@ -579,7 +665,7 @@ class GameManagerAgent(Agent):
                         total_cost += cost
                         self.environment.map.update_owner(player["jid"], city_tag)
                     else:
-                        update_log(f"{player['jid']} cannot build in {city_tag}")
+                        self.context.update_log(f"{player['jid']} cannot build in {city_tag}")
 
                 # Notify player of the build result
                 msg = Message(to=player["jid"])
@@ -591,52 +677,50 @@ class GameManagerAgent(Agent):
                 })
                 await self.send(msg)
             else:
-                update_log(f"No response from {player['jid']} in build houses phase.")
+                self.context.update_log(f"No response from {player['jid']} in build houses phase.")
 
         def calculate_building_cost(self, player, city_tag):
-            # Implement building cost calculation using the environment's building cost
-            city = self.environment.map.map.nodes.get(city_tag)
-            if city:
-                occupancy = len(city.get('owners', []))
+            # Building cost of the step, plus the connection of the city to the player's network as it is now
+            occupancy = self.environment.map.get_occupancy(city_tag)
+            if occupancy is not None:
                 if occupancy < self.current_step:
                     building_cost = self.environment.building_cost[self.current_step]
-                    return building_cost
+                    return building_cost + self.environment.map.get_connection_cost(player["jid"], city_tag)
             return float('inf')
 
         def is_city_available(self, city_tag, player):
-            city = self.environment.map.map.nodes.get(city_tag)
-            if city:
-                occupancy = len(city.get('owners', []))
+            occupancy = self.environment.map.get_occupancy(city_tag)
+            if occupancy is not None:
                 if occupancy < self.current_step:
                     return True
             return False
 
         async def phase5(self):
-            update_log("Phase 5: Bureaucracy")
+            self.context.update_log("Phase 5: Bureaucracy")
 
-            # Request cities_powered from all players
-            for player_id, player in self.players.items():
-                msg = Message(to=player["jid"])
-                msg.body = json.dumps({
-                    "phase": "phase5",
-                    "action": "power_cities_request"
-                })
-                await self.send(msg)
-                update_log(f"Requested cities to power from Player {player_id}.")
+            # Request cities_powered from all players at once
+            responses = await self.broadcast_request({
+                "phase": "phase5",
+                "action": "power_cities_request"
+            }, timeout=30)
+            self.context.update_log("Requested cities to power from all players.")
 
-            # Collect responses
+            # Apply the responses, each one matched to the player it was asked from
             for player_id, player in self.players.items():
-                response = await self.receive(timeout=30)
-                if response:
+                response = responses[player_id]
+                if response is None:
+                    self.context.update_log(f"No response from Player {player_id} in phase 5.")
+                else:
                     data = json.loads(response.body)
                     if data.get("phase") == "phase5" and data.get("action") == "power_cities":
                         cities_powered = data.get("cities_powered", 0)
                         resources_consumed = data.get("resources_consumed", {})
-                        updated_elektro = data.get("elektro", 0)
 
                         # Verify and update player's Elektro
                         expected_income = city_cashback[cities_powered] if cities_powered < len(city_cashback) else \
                         city_cashback[-1]
+                        # The manager books the income on its own ledger, whatever balance the player reports
+                        player["elektro"] += expected_income
 
                         # Deduct consumed resources
                         for resource, amount in resources_consumed.items():
@@ -644,21 +728,21 @@ class GameManagerAgent(Agent):
                                 player["resources"][resource] -= amount
                                 if player["resources"][resource] < 0:
                                     player["resources"][resource] = 0  # Prevent negative resources
-                                update_log(f"Player {player_id}: Consumed {amount} of {resource}.")
+                                self.context.update_log(f"Player {player_id}: Consumed {amount} of {resource}.")
 
                         # Update player's powered cities
                         player["cities_powered"] = cities_powered
 
             # Resupply the resource market
             self.resupply_resource_market()
-            update_log("Resupplied the resource market.")
+            self.context.update_log("Resupplied the resource market.")
 
             # Update the power plant market
             self.update_power_plant_market_phase5()
-            update_log("Updated the power plant market.")
-            update_log("Player status before game end check:")
+            self.context.update_log("Updated the power plant market.")
+            self.context.update_log("Player status before game end check:")
             for player_id, player_data in self.players.items():
-                update_log(
+                self.context.update_log(
                     f"Player {player_id}: Cities owned = {len(player_data['cities'])}, Cities = {player_data['cities']}")
 
             # Check for game end conditions
@@ -668,54 +752,25 @@ class GameManagerAgent(Agent):
                 # Proceed to the next round
                 self.current_phase = "phase1"
                 self.round += 1
-                update_log(f"Starting Round {self.round}")
+                self.context.update_log(f"Starting Round {self.round}")
 
         def calculate_income(self, player):
             cities_powered = self.calculate_cities_powered(player)
             income_table = self.environment.city_cashback
             income = income_table[cities_powered] if cities_powered < len(income_table) else income_table[-1]
-            update_log(f"Player {player['jid']} powers {cities_powered} cities and earns {income} elektro.")
+            self.context.update_log(f"Player {player['jid']} powers {cities_powered} cities and earns {income} elektro.")
             return income
 
         def calculate_cities_powered(self, player):
             # Determine how many cities the player can power based on resources and power plants
-            total_capacity = 0
-            for plant in player["power_plants"]:
-                resource_types = plant.resource_type
-                resource_needed = plant.resource_num
-                if not resource_types:  # Eco plants
-                    total_capacity += plant.cities
-                else:
-                    # Check if player has enough resources
-                    if plant.is_hybrid:
-                        # For hybrid, sum resources
-                        total_resources = sum(player["resources"][rtype] for rtype in resource_types)
-                        if total_resources >= resource_needed:
-                            total_capacity += plant.cities
-                    else:
-                        rtype = resource_types[0]
-                        if player["resources"][rtype] >= resource_needed:
-                            total_capacity += plant.cities
-            return min(total_capacity, len(player["cities"]))
+            return allocate_fuel(player["power_plants"], player["resources"], len(player["cities"])).cities
 
         def consume_resources(self, player):
-            for plant in player["power_plants"]:
-                resource_needed = plant.resource_num
-                if not plant.resource_type:
-                    continue  # Eco-friendly plants consume no resources
-                elif plant.is_hybrid:
-                    # For hybrid, consume resources from available types
-                    for rtype in plant.resource_type:
-                        available = player["resources"][rtype]
-                        consume = min(resource_needed, available)
-                        player["resources"][rtype] -= consume
-                        resource_needed -= consume
-                        if resource_needed == 0:
-                            break
-                else:
-                    rtype = plant.resource_type[0]
-                    if player["resources"][rtype] >= resource_needed:
-                        player["resources"][rtype] -= resource_needed
+            # Burn the resources of the best allocation, the one calculate_cities_powered counts
+            allocation = allocate_fuel(player["power_plants"], player["resources"], len(player["cities"]))
+            for rtype, amount in zip(RESOURCES, allocation.consumed):
+                if amount > 0:
+                    player["resources"][rtype] -= amount
 
         def resupply_resource_market(self):
             """
@@ -728,11 +783,11 @@ class GameManagerAgent(Agent):
 
             # Ensure valid step and player count
             if current_step not in resource_replenishment_table:
-                update_log(f"Invalid game step: {current_step}. Cannot resupply resources.")
+                self.context.update_log(f"Invalid game step: {current_step}. Cannot resupply resources.")
                 return
 
             if nplayers not in resource_replenishment_table[current_step]:
-                update_log(f"Invalid number of players: {nplayers}. Cannot resupply resources.")
+                self.context.update_log(f"Invalid number of players: {nplayers}. Cannot resupply resources.")
                 return
 
             # Get replenishment rates for the current step and number of players
@@ -747,7 +802,7 @@ class GameManagerAgent(Agent):
 
                 # Update the resource market with the new quantity
                 resource_market.in_market[resource] = new_quantity
-                update_log(f"Resupplied {resource}: {current_quantity} -> {new_quantity} (Added: {amount})")
+                self.context.update_log(f"Resupplied {resource}: {current_quantity} -> {new_quantity} (Added: {amount})")
 
         def update_resource_prices(resource_market, price_table):
             """
@@ -760,7 +815,7 @@ class GameManagerAgent(Agent):
 
             for resource, quantity in resource_market.items():
                 if resource not in price_table:
-                    update_log(f"No pricing information available for {resource}. Skipping.")
+                    logger.info(f"No pricing information available for {resource}. Skipping.")
                     continue
 
                 # Uranium has direct mapping, handle it separately
@@ -801,38 +856,38 @@ class GameManagerAgent(Agent):
             # Dictionary to store player city counts
             player_city_counts = {}
 
-            # Query each player for their owned cities
-            for player_id, player_data in self.players.items():
-                # Send a message to the player to retrieve their owned cities
-                msg = Message(to=player_data["jid"])
-                msg.body = json.dumps({
-                    "phase": "check_game_end",
-                    "action": "get_cities_owned"
-                })
-                await self.send(msg)
-
-                # Await the player's response
-                response = await self.receive(timeout=10)  # Timeout of 10 seconds
+            # Query all players for their owned cities at once
+            responses = await self.broadcast_request({
+                "phase": "check_game_end",
+                "action": "get_cities_owned"
+            }, timeout=10)  # Timeout of 10 seconds, shared by all players
+            for player_id, response in responses.items():
                 if response:
                     data = json.loads(response.body)
                     if data.get("phase") == "check_game_end" and data.get("action") == "cities_owned":
                         cities_owned = data.get("cities_owned", [])
                         player_city_counts[player_id] = len(cities_owned)
 
-                        update_log(f"Player {player_id} owns {len(cities_owned)} cities.")
+                        self.context.update_log(f"Player {player_id} owns {len(cities_owned)} cities.")
                     else:
-                        update_log(f"Unexpected response from Player {player_id}: {data}")
+                        self.context.update_log(f"Unexpected response from Player {player_id}: {data}")
                 else:
-                    update_log(f"No response from Player {player_id}. Assuming 0 cities.")
+                    self.context.update_log(f"No response from Player {player_id}. Assuming 0 cities.")
                     player_city_counts[player_id] = 0
 
             # Check if any player meets or exceeds the required number of cities
             for player_id, city_count in player_city_counts.items():
                 if city_count >= end_game_cities:
-                    update_log(
+                    self.context.update_log(
                         f"Game has ended. Player {player_id} has connected {city_count} cities (required: {end_game_cities}).")
                     return True
 
+            # The houses of a small map can run out before anyone gets there (the step stays at 2, so 3 zones
+            # hold 2 houses in each of about 21 cities, less than 3 players need): the game also ends then
+            if self.environment.map.is_full(self.players, max_occupancy=self.current_step):
+                self.context.update_log("Game has ended. No player can build in any more cities.")
+                return True
+
             return False
 
         async def end_game(self):
@@ -840,23 +895,17 @@ class GameManagerAgent(Agent):
             End the game by querying players for their cities powered and their Elektro balances.
             Determine the winner based on game rules.
             """
-            update_log("Game Over. Calculating final scores.")
+            self.context.update_log("Game Over. Calculating final scores.")
 
             # Dictionary to store player cities powered and Elektro
             player_stats = {}
 
-            # Query each player for their cities powered and Elektro
-            for player_id, player_data in self.players.items():
-                # Send a message to the player to retrieve their powered cities and Elektro
-                msg = Message(to=player_data["jid"])
-                msg.body = json.dumps({
-                    "phase": "end_game",
-                    "action": "get_final_stats"
-                })
-                await self.send(msg)
-
-                # Await the player's response
-                response = await self.receive(timeout=10)  # Timeout of 10 seconds
+            # Query all players for their cities powered and Elektro at once
+            responses = await self.broadcast_request({
+                "phase": "end_game",
+                "action": "get_final_stats"
+            }, timeout=10)  # Timeout of 10 seconds, shared by all players
+            for player_id, response in responses.items():
                 if response:
                     data = json.loads(response.body)
                     if data.get("phase") == "end_game" and data.get("action") == "final_stats":
@@ -866,12 +915,12 @@ class GameManagerAgent(Agent):
                             "cities_powered": cities_powered,
                             "elektro": elektro
                         }
-                        update_log(f"Player {player_id} powered {cities_powered} cities with {elektro} Elektro.")
+                        self.context.update_log(f"Player {player_id} powered {cities_powered} cities with {elektro} Elektro.")
                     else:
-                        update_log(f"Unexpected response from Player {player_id}: {data}")
+                        self.context.update_log(f"Unexpected response from Player {player_id}: {data}")
                         player_stats[player_id] = {"cities_powered": 0, "elektro": 0}
                 else:
-                    update_log(f"No response from Player {player_id}. Assuming 0 cities powered and 0 Elektro.")
+                    self.context.update_log(f"No response from Player {player_id}. Assuming 0 cities powered and 0 Elektro.")
                     player_stats[player_id] = {"cities_powered": 0, "elektro": 0}
 
             # Determine the winner
@@ -892,7 +941,8 @@ class GameManagerAgent(Agent):
 
             winner = self.players[winner_id]
             winner_stats = player_stats[winner_id]
-            update_log(
+            self.winner = winner["jid"]
+            self.context.update_log(
                 f"Game has ended. Winner is Player {winner['jid']} with {winner_stats['cities_powered']} cities powered and {winner_stats['elektro']} Elektro."
             )
 
@@ -908,11 +958,14 @@ class GameManagerAgent(Agent):
                 await self.send(msg)
 
             self.game_over = True
-    def __init__(self, jid, password, player_jids):
+            self.finished.set()
+            self.stop_reply_dispatcher()
+    def __init__(self, jid, password, player_jids, context):
         super().__init__(jid, password)
         self.player_jids = player_jids
+        self.context = context
 
     async def setup(self):
         print("Game Manager agent starting...")
-        game_behaviour = self.GameBehaviour(self, self.player_jids)
-        self.add_behaviour(game_behaviour)
+        self.game_behaviour = self.GameBehaviour(self, self.player_jids, self.context)
+        self.add_behaviour(self.game_behaviour)
@@ -1,2 +0,0 @@
-from game_environment import Environment
-global environment_instance
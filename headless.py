@@ -0,0 +1,103 @@
+# headless.py
+
+import asyncio
+
+from game_manager import GameManagerAgent
+from player_agent import PowerGridPlayer, PowerGridPlayerAgent
+from game_context import GameContext
+from local_bus import LocalBus, LocalTransport
+
+MANAGER_JID = "gamemanager@localhost"
+
+
+class HeadlessGameBehaviour(LocalTransport, GameManagerAgent.GameBehaviour):
+    """The manager's phase1-phase5 logic, talking through a LocalBus."""
+
+
+class HeadlessPlayerBehaviour(LocalTransport, PowerGridPlayerAgent.ReceivePhaseBehaviour):
+    """The player's message handling and decision methods, talking through a LocalBus."""
+
+
+class HeadlessPlayer(PowerGridPlayer):
+    """
+    Plays the role of the spade agent for a HeadlessPlayerBehaviour (behaviour.agent).
+    """
+    def __init__(self, jid, player_id, context):
+        super().__init__(player_id, context)
+        self.jid = jid
+        self.alive = True
+
+    def print_status(self, *args, **kwargs):
+        # No terminal UI in headless mode
+        pass
+
+    async def stop(self):
+        self.alive = False
+
+
+async def play(behaviour, timeout=30):
+    """
+    Player loop: same as ReceivePhaseBehaviour.run(), without the XMPP client and the pause between cycles.
+    """
+    while behaviour.agent.alive:
+        behaviour.agent.get_inventory()
+        msg = await behaviour.receive(timeout=timeout)
+        if msg:
+            await behaviour.handle_message(msg)
+
+
+async def run_headless_game(context):
+    """
+    Plays one full game in the current event loop, without an XMPP server.
+    Games with their own context don't share anything, so many of them can be awaited together.
+
+    :param context: The GameContext of the game.
+    :return: Dictionary {'winner': jid, 'rounds': number of rounds played,
+             'players': {jid: {'elektro': final balance, 'cities': cities on the map}}}.
+    """
+    bus = LocalBus()
+    player_jids = [f"player{i}@localhost" for i in range(1, context.num_players + 1)]
+
+    players = []
+    for i, jid in enumerate(player_jids, start=1):
+        behaviour = HeadlessPlayerBehaviour()
+        behaviour.agent = HeadlessPlayer(jid, player_id=i, context=context)
+        behaviour.attach(bus, jid)
+        players.append(behaviour)
+
+    manager = HeadlessGameBehaviour(None, player_jids, context)
+    manager.attach(bus, MANAGER_JID)
+
+    player_tasks = [asyncio.create_task(play(p)) for p in players]
+    try:
+        while not manager.game_over:
+            await manager.run_current_phase()
+        await asyncio.gather(*player_tasks)
+    finally:
+        for task in player_tasks:
+            task.cancel()
+
+    # Elektro as the players report it, cities as placed on the map
+    city_count = manager.environment.map.count_player_cities()
+    return {
+        "winner": manager.winner,
+        "rounds": manager.round,
+        "players": {
+            p.jid: {"elektro": p.agent.elektro, "cities": city_count.get(p.jid, 0)}
+            for p in players
+        }
+    }
+
+
+async def run_headless_games(contexts):
+    """
+    Plays several games concurrently in the current event loop.
+
+    :param contexts: One GameContext per game.
+    :return: The results of run_headless_game, in the order of the contexts.
+    """
+    return await asyncio.gather(*(run_headless_game(context) for context in contexts))
+
+
+if __name__ == "__main__":
+    print(asyncio.run(run_headless_game(GameContext(3, seed=0))))
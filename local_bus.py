@@ -0,0 +1,73 @@
+# local_bus.py
+
+import asyncio
+import logging
+
+
+class LocalBus:
+    """
+    In-memory stand-in for the XMPP server.
+    Every registered JID gets its own mailbox, and messages are delivered straight into it,
+    so the manager and the players can play a whole game inside one process.
+    """
+    def __init__(self):
+        self.mailboxes = {}  # {jid: asyncio.Queue}
+
+    def register(self, jid):
+        """
+        Creates the mailbox of a JID.
+
+        :param jid: The JID, e.g. 'player1@localhost'.
+        """
+        self.mailboxes[jid] = asyncio.Queue()
+
+    def deliver(self, msg):
+        """
+        Puts a message in the mailbox of its recipient.
+
+        :param msg: A spade Message with 'to', 'sender' and 'body' set.
+        :return: 0 if delivered, 1 if the recipient is unknown.
+        """
+        mailbox = self.mailboxes.get(str(msg.to).split('/')[0])
+        if mailbox is None:
+            logging.error(f"No mailbox for '{msg.to}'. Message dropped.")
+            return 1
+        mailbox.put_nowait(msg)
+        return 0
+
+    async def receive(self, jid, timeout=None):
+        """
+        Same contract as spade's Behaviour.receive: the next message, or None after the timeout.
+
+        :param jid: The JID whose mailbox is read.
+        :param timeout: Seconds to wait, or None to only check what is already there.
+        """
+        mailbox = self.mailboxes[jid]
+        if timeout:
+            try:
+                return await asyncio.wait_for(mailbox.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        try:
+            return mailbox.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+
+class LocalTransport:
+    """
+    Mixin for the spade behaviours: replaces send/receive with calls to a LocalBus.
+    Put it first in the bases, e.g. class HeadlessGameBehaviour(LocalTransport, GameManagerAgent.GameBehaviour).
+    """
+    def attach(self, bus, jid):
+        self.bus = bus
+        self.jid = jid
+        bus.register(jid)
+
+    async def send(self, msg):
+        if msg.empty_sender():
+            msg.sender = self.jid
+        self.bus.deliver(msg)
+
+    async def receive(self, timeout=None):
+        return await self.bus.receive(self.jid, timeout)
@@ -5,36 +5,17 @@ import os
 
 from game_manager import GameManagerAgent  # Adjusted import to match the module name
 from player_agent import PowerGridPlayerAgent
-from game_environment import Environment
-import globals
+from game_context import GameContext
 from time import sleep
 
-#######################  METHODS TO CREATE THE LOG  #########################
-def create_log():
-    """
-    Creates or clears the log file named 'log.txt'.
-    """
-    with open("log.txt", "w") as log_file:
-        # Opening in 'w' mode ensures the file is emptied if it exists.
-        pass
-    print("Log file 'log.txt' created or cleared.")
-
-
-def update_log(message):
-    """
-    Appends the given string to the next line of the log file, called "log.txt".
-
-    :argument:
-        message (str): The message to append to the log file.
-    """
-    with open("log.txt", "a") as log_file:
-        log_file.write(message + "\n")
-    print(f"Message added to log: {message}")
-
 #############################################################################
 async def main():
     num_players = 3 # <- modifiable
-    create_log() # reset log
+    fast_forward = False # <- True skips the pauses meant for watching the UI
+
+    # everything this game needs (environment, log) lives in its context, handed to every agent
+    context = GameContext(num_players, log_path="log.txt", echo=True, fast_forward=fast_forward)
+    context.create_log() # reset log
 
     ascii_art = """\n\n\n
                  _______                                                       ______             __        __                            __                     
@@ -107,24 +88,19 @@ async def main():
     """
     print(ascii_art)
     
-    sleep(2.5)
+    if not fast_forward:
+        sleep(2.5)
     os.system("clear")
 
 
-    # environment instance
-    globals.environment_instance = Environment(num_players) # <- if this is globalized the rest works
-
-    print(globals.environment_instance.players)
-
-    if not (2 <= num_players <= 6):
-        raise ValueError("Number of players must be between 2 and 6.")
+    print(context.environment.players)
 
     # define ids, passwords based on the number of players
     players = []
     for i in range(1, num_players + 1):
         player_jid = f"player{i}@localhost"
         player_passwd = f"player{i}password"
-        player = PowerGridPlayerAgent(player_jid, player_passwd, player_id=i)
+        player = PowerGridPlayerAgent(player_jid, player_passwd, player_id=i, context=context)
         players.append(player)
 
     # start the player agents
@@ -137,16 +113,15 @@ async def main():
     gamemanager_passwd = "gamemanagerpassword"
     player_jids = [f"player{i}@localhost" for i in range(1, num_players + 1)]
 
-    gamemanager = GameManagerAgent(gamemanager_jid, gamemanager_passwd, player_jids)
+    gamemanager = GameManagerAgent(gamemanager_jid, gamemanager_passwd, player_jids, context)
     await gamemanager.start()
     print("Game manager started.")
 
     print("All agents started. Game is running.")
 
     try:
-        # Keep the main coroutine running as long as the game manager is alive
-        while gamemanager.is_alive():
-            await asyncio.sleep(1)
+        # Keep the main coroutine running until the game manager announces the end of the game
+        await gamemanager.game_behaviour.finished.wait()
     except KeyboardInterrupt:
         print("\nGame interrupted by user.")
     finally:
@@ -0,0 +1,120 @@
+# map_generator.py
+
+import argparse
+import math
+
+import numpy as np
+
+from map_graph import DisjointSet
+from map_loader import write_map
+
+# Rows of points handled at once when looking for the nearest neighbours (bounds the memory to ROWS x cities)
+ROWS_PER_BLOCK = 512
+
+
+def nearest_neighbours(points, count):
+    """
+    :param points: Array (n, 2) of coordinates.
+    :param count: Number of neighbours per point.
+    :return: Array (n, count) with the indexes of the nearest other points of every point.
+    """
+    count = min(count, len(points) - 1)
+    squares = (points ** 2).sum(axis=1)
+    nearest = np.empty((len(points), count), dtype=np.int64)
+    for start in range(0, len(points), ROWS_PER_BLOCK):
+        block = points[start:start + ROWS_PER_BLOCK]
+        distances = squares[start:start + len(block), None] + squares[None, :] - 2 * block @ points.T
+        distances[np.arange(len(block)), start + np.arange(len(block))] = np.inf
+        nearest[start:start + len(block)] = np.argpartition(distances, count - 1, axis=1)[:, :count]
+    return nearest
+
+
+def join_components(points, pairs):
+    """
+    Adds links until every city is reachable: each component other than the largest one is joined to the
+    nearest city outside it, and so on until there is one component left.
+
+    :param points: Array (n, 2) of coordinates.
+    :param pairs: Set of (i, j) links with i < j, completed in place.
+    """
+    components = DisjointSet(range(len(points)))
+    for i, j in pairs:
+        components.union(i, j)
+
+    while components.count() > 1:
+        roots = np.array([components.find(i) for i in range(len(points))])
+        labels, sizes = np.unique(roots, return_counts=True)
+        largest = labels[np.argmax(sizes)]
+        for label in labels:
+            if label == largest or components.find(int(label)) != int(label):
+                continue
+            members = np.flatnonzero(roots == label)
+            others = np.flatnonzero(roots != label)
+            distances = ((points[members, None, :] - points[None, others, :]) ** 2).sum(axis=2)
+            row, column = np.unravel_index(np.argmin(distances), distances.shape)
+            i, j = sorted((int(members[row]), int(others[column])))
+            pairs.add((i, j))
+            components.union(i, j)
+
+
+def generate_map(num_cities, seed=None, neighbours=3, num_zones=6, mean_cost=10):
+    """
+    Generates a random, nearly planar map: cities scattered over a rectangle twice as wide as high (like the US
+    map), each one linked to its nearest neighbours, with every city reachable. Link costs grow with the length
+    of the link, with some noise, and average about mean_cost whatever the number of cities (the US map averages
+    10). The rectangle is cut in a grid of num_zones zones, usable with the zones of map_loader.load_map.
+
+    :param num_cities: Number of cities.
+    :param seed: Seed of the generator. The same seed gives the same map.
+    :param neighbours: Nearest neighbours linked to every city (3 gives about 2 links per city, as on the US map).
+    :param num_zones: Number of zones.
+    :param mean_cost: Average connection cost of a link.
+    :return: Tuple (cities {tag: name}, links [(tag, tag, cost)], zones {name: [tag, ...]}), as read_map returns.
+    """
+    rng = np.random.default_rng(seed)
+    points = rng.random((num_cities, 2)) * (2.0, 1.0)
+
+    width = len(str(num_cities - 1))
+    tags = [f"C{i:0{width}d}" for i in range(num_cities)]
+    cities = {tag: f"City {i}" for i, tag in enumerate(tags)}
+
+    pairs = set()
+    if num_cities > 1:
+        for i, row in enumerate(nearest_neighbours(points, neighbours).tolist()):
+            for j in row:
+                pairs.add((min(i, j), max(i, j)))
+        join_components(points, pairs)
+
+    pairs = sorted(pairs)
+    links = []
+    if pairs:
+        first, second = np.array(pairs).T
+        lengths = np.linalg.norm(points[first] - points[second], axis=1)
+        costs = np.rint(lengths * (mean_cost / lengths.mean()) * rng.uniform(0.8, 1.2, len(lengths))).astype(int)
+        links = [(tags[i], tags[j], int(cost)) for i, j, cost in zip(first.tolist(), second.tolist(), costs)]
+
+    rows = max(1, round(math.sqrt(num_zones / 2)))
+    columns = math.ceil(num_zones / rows)
+    column = np.minimum((points[:, 0] / 2.0 * columns).astype(int), columns - 1)
+    row = np.minimum((points[:, 1] * rows).astype(int), rows - 1)
+    zone_ids = np.minimum(column * rows + row, num_zones - 1)
+    zones = {f"zone-{zone + 1}": [tags[i] for i in np.flatnonzero(zone_ids == zone)] for zone in range(num_zones)}
+    return cities, links, zones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a random map file for load_map.")
+    parser.add_argument("--cities", type=int, default=1000, help="number of cities")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the map")
+    parser.add_argument("--zones", type=int, default=6, help="number of zones")
+    parser.add_argument("--out", default=None, help="map file, .json or .graphml (default: map_<cities>.json)")
+    args = parser.parse_args()
+
+    cities, links, zones = generate_map(args.cities, args.seed, num_zones=args.zones)
+    path = args.out or f"map_{args.cities}.json"
+    write_map(path, cities, links, zones)
+    print(f"Wrote {len(cities)} cities and {len(links)} links to {path}.")
+
+
+if __name__ == "__main__":
+    main()
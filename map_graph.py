@@ -1,6 +1,8 @@
-import networkx as nx
+import heapq
 import logging
-from collections import deque # for graph search
+from functools import cached_property
+
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -61,6 +63,16 @@ citiesUS = {
     "NRF": "Norfolk",
 }
 
+# Cities of every color region, in the order of citiesUS
+zonesUS = {
+    "dark-blue": ["SEA", "POR", "BOI", "BIL", "CHE", "DEN", "OMA"],
+    "light-blue": ["SFO", "LVG", "LAX", "SLC", "PHX", "SDG", "SFE"],
+    "red": ["KSC", "OKC", "DAL", "HOU", "NOA", "MEM", "BHM"],
+    "yellow": ["DUL", "FRG", "MIN", "CHI", "STL", "CIN", "KNX"],
+    "orange": ["WAS", "NYC", "BUF", "DET", "PHI", "BOS", "PIT"],
+    "green": ["RAL", "MIA", "TMP", "SAV", "JAX", "ATA", "NRF"],
+}
+
 edgesUS = [
     ("SEA", "POR", 3),
     ("SEA", "BIL", 9),
@@ -150,23 +162,439 @@ edgesUS = [
     ("BOS", "NYC", 3),
 ]
 
-import networkx as nx
-import logging
+
+def choose_zones(count, rng, zone_cities=zonesUS, links=edgesUS):
+    """
+    Picks regions to play on, all joined to each other as the rules require: a random first region,
+    then random regions bordering the ones already picked.
+
+    :param count: Number of regions (see zones_played in rule_tables).
+    :param rng: random.Random of the game.
+    :param zone_cities: Dictionary {color: list of city tags}.
+    :param links: List of links, used to find which regions border each other.
+    :return: List of colors, in the order of zone_cities.
+    """
+    zone_of = {city: zone for zone, zone_list in zone_cities.items() for city in zone_list}
+    borders = {zone: set() for zone in zone_cities}
+    for city_a, city_b, weight in links:
+        zone_a, zone_b = zone_of.get(city_a), zone_of.get(city_b)
+        if zone_a and zone_b and zone_a != zone_b:
+            borders[zone_a].add(zone_b)
+            borders[zone_b].add(zone_a)
+
+    chosen = [rng.choice(list(zone_cities))]
+    while len(chosen) < min(count, len(zone_cities)):
+        candidates = sorted({zone for picked in chosen for zone in borders[picked]} - set(chosen))
+        if not candidates:
+            break
+        chosen.append(rng.choice(candidates))
+    return [zone for zone in zone_cities if zone in chosen]
+
+
+class DisjointSet:
+    """
+    Union-find over hashable items (city tags), with path halving and union by size.
+    Items are added on first use, and find() returns the representative of the item's set.
+    """
+    def __init__(self, items=()):
+        self.parent = {}
+        self.size = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        """
+        Merges the sets of a and b.
+
+        :return: The representative of the merged set.
+        """
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def count(self):
+        """
+        :return: Number of disjoint sets.
+        """
+        return sum(1 for item, parent in self.parent.items() if item == parent)
+
+
+class CityGraph:
+    """
+    Compact core of a map, indexed by integer city ids: city i is the i-th tag of 'cities', and its links are
+    stored as CSR arrays (the neighbours of city i are indices[indptr[i]:indptr[i + 1]], at the costs found in
+    weights at the same positions). It also holds the connected component of every city and, unless the map
+    is too large, the all-pairs distance matrix.
+    Nothing in it changes during a game, so every board of the same cities and links can share one instance.
+    """
+    def __init__(self, cities, links, all_pairs=True):
+        """
+        :param cities: Dictionary {city_tag: city name}.
+        :param links: List of (city_tag, city_tag, connection cost).
+        :param all_pairs: Compute the all-pairs distance matrix (n^2 memory, n^3 time).
+        """
+        self.tags = list(cities)
+        self.ids = {tag: i for i, tag in enumerate(self.tags)}
+        size = len(self.tags)
+
+        # Every link is stored in both directions, sorted by city id
+        city_a = np.array([self.ids[link[0]] for link in links], dtype=np.int32)
+        city_b = np.array([self.ids[link[1]] for link in links], dtype=np.int32)
+        cost = np.array([link[2] for link in links], dtype=np.int32)
+        rows, cols = np.concatenate((city_a, city_b)), np.concatenate((city_b, city_a))
+        order = np.lexsort((cols, rows))
+        self.indices = cols[order]
+        self.weights = np.concatenate((cost, cost))[order]
+        self.indptr = np.zeros(size + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=size), out=self.indptr[1:])
+
+        # Connected components: the links never change, so two cities are linked by a path
+        # exactly when they have the same component id
+        components = DisjointSet(range(size))
+        for a, b in zip(city_a.tolist(), city_b.tolist()):
+            components.union(a, b)
+        self.component = [components.find(i) for i in range(size)]
+
+        # distances[i, j] is the cheapest connection cost between city i and city j (inf if they are not linked)
+        self.distances = self.all_pairs_distances() if all_pairs else None
+
+    # Arrays saved by to_arrays and read back by from_arrays (distances only when there is a matrix)
+    ARRAY_NAMES = ("indptr", "indices", "weights", "component", "distances")
+
+    def to_arrays(self):
+        """
+        :return: Dictionary {name: numpy array} of everything derived from the cities and links.
+        """
+        arrays = {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "weights": self.weights,
+            "component": np.array(self.component, dtype=np.int32),
+        }
+        if self.distances is not None:
+            arrays["distances"] = self.distances
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, tags, arrays):
+        """
+        Rebuilds a CityGraph from the arrays of to_arrays without computing anything (they may be memory-mapped).
+
+        :param tags: City tags, in city id order.
+        :param arrays: Dictionary {name: numpy array}, as returned by to_arrays.
+        :return: A new CityGraph.
+        """
+        graph = cls.__new__(cls)
+        graph.tags = list(tags)
+        graph.ids = {tag: i for i, tag in enumerate(graph.tags)}
+        graph.indptr = arrays["indptr"]
+        graph.indices = arrays["indices"]
+        graph.weights = arrays["weights"]
+        graph.component = arrays["component"].tolist()
+        graph.distances = arrays.get("distances")
+        return graph
+
+    @cached_property
+    def adjacency(self):
+        """
+        The CSR arrays as lists [(neighbour id, cost), ...] per city, for the loops in Python
+        (reading numpy arrays one item at a time is slow). Built on first use.
+        """
+        indices, weights, indptr = self.indices.tolist(), self.weights.tolist(), self.indptr.tolist()
+        return [list(zip(indices[indptr[i]:indptr[i + 1]], weights[indptr[i]:indptr[i + 1]]))
+                for i in range(len(self.tags))]
+
+    def all_pairs_distances(self):
+        """
+        Floyd-Warshall over the CSR arrays, one vectorized relaxation per intermediate city.
+
+        :return: Matrix of the cheapest connection costs, inf between cities that are not linked.
+        """
+        size = len(self.tags)
+        distances = np.full((size, size), np.inf)
+        np.fill_diagonal(distances, 0)
+        rows = np.repeat(np.arange(size), np.diff(self.indptr))
+        np.minimum.at(distances, (rows, self.indices), self.weights)
+        for k in range(size):
+            np.minimum(distances, distances[:, k, None] + distances[k], out=distances)
+        return distances
+
+    def shortest_costs(self, sources, target=None):
+        """
+        Dijkstra seeded with all the sources at cost 0.
+
+        :param sources: City ids.
+        :param target: City id at which to stop (its cost is then final), or None to price every city.
+        :return: Array indexed by city id, inf for cities that can't be reached (or weren't reached before target).
+        """
+        inf = float('inf')
+        costs = [inf] * len(self.tags)
+        best = {city: 0 for city in sources}
+        queue = [(0, city) for city in best]
+        heapq.heapify(queue)
+        adjacency = self.adjacency
+        while queue:
+            cost, city = heapq.heappop(queue)
+            if costs[city] != inf:
+                continue
+            costs[city] = cost
+            if city == target:
+                break
+            for neighbour, weight in adjacency[city]:
+                new_cost = cost + weight
+                if new_cost < best.get(neighbour, inf):
+                    best[neighbour] = new_cost
+                    heapq.heappush(queue, (new_cost, neighbour))
+        return np.array(costs, dtype=float)
+
+    def relax(self, reach, source):
+        """
+        Lowers the costs of reaching every city from a network once source joins it: a Dijkstra from source
+        that stops at the cities the network already reaches as cheaply, so only the part of the map that
+        gets closer is visited.
+
+        :param reach: Array of connection costs by city id (inf where unreachable), updated in place.
+        :param source: City id joining the network.
+        :return: List of (new cost, city id) of the cities whose cost went down.
+        """
+        improved = []
+        queue = [(0, source)]
+        adjacency = self.adjacency
+        while queue:
+            cost, city = heapq.heappop(queue)
+            if cost >= reach[city]:
+                continue
+            reach[city] = cost
+            improved.append((cost, city))
+            for neighbour, weight in adjacency[city]:
+                if cost + weight < reach[neighbour]:
+                    heapq.heappush(queue, (cost + weight, neighbour))
+        return improved
+
+    def link_cost(self, city_a, city_b):
+        """
+        :return: Cost of the direct link between two city ids, None if they aren't linked.
+        """
+        for neighbour, weight in self.adjacency[city_a]:
+            if neighbour == city_b:
+                return weight
+        return None
+
 
 class BoardMap:
-    def __init__(self, cities, links):
+    # Above this many cities the all-pairs distance matrix is not built (n^2 memory, n^3 time) and
+    # connection costs come from one multi-source Dijkstra per query instead
+    ALL_PAIRS_MAX_CITIES = 500
+
+    # Graph cores of the zone sub-maps, built once per combination of zones: {frozenset of zones: CityGraph}
+    zone_graphs = {}
+
+    def __init__(self, cities, links, graph=None):
+        """
+        :param cities: Dictionary {city_tag: city name}.
+        :param links: List of (city_tag, city_tag, connection cost).
+        :param graph: CityGraph of these cities and links, if already built (e.g. shared by from_zones);
+                      built here otherwise.
+        """
         self.nodes = cities
         self.edges = links
         self.step = 2  # Varies with the game phases
 
-        self.map = nx.Graph()
+        if graph is None:
+            graph = CityGraph(cities, links, all_pairs=len(cities) <= self.ALL_PAIRS_MAX_CITIES)
+        self.graph = graph
+        self.city_tags = graph.tags  # {city id: city_tag}, as a list
+        self.city_ids = graph.ids  # {city_tag: city id}
+        self.component = graph.component  # board component of every city id
+        self.distances = graph.distances
+
+        # Ownership, indexed by city id: the owners of every city and their number
+        self.owners = [[] for _ in self.city_tags]
+        self.occupancy = np.zeros(len(self.city_tags), dtype=np.int8)
+
+        # Ownership index, kept in sync by update_owner and remove_owner
+        self.player_cities = {}  # {player_jid: set of the city tags they own}, only players owning a city
+
+        # Per player: how many of their cities lie in each connected component of the board (see self.component),
+        # kept up to date by update_owner and remove_owner
+        self.player_components = {}  # {player_jid: {component id: number of cities}}
+
+        # Expansion frontier of every player owning a city: the cost of connecting each city to their network
+        # and a heap of (connection cost, city id) over it, both updated by update_owner. The heap is lazy:
+        # an entry whose cost is no longer the city's cost is skipped when it reaches the top.
+        self.player_reach = {}  # {player_jid: array of connection costs by city id}
+        self.player_frontiers = {}  # {player_jid: heap of (connection cost, city id)}
+
+        # Version of the ownership, bumped by every change, and the views derived from it (status, counts,
+        # connection costs) memoized for the current version: asking again before the next change is free
+        self.version = 0
+        self.views = {}  # {view key: value}, emptied by every change
+
+    @classmethod
+    def from_zones(cls, zones):
+        """
+        Builds the US map restricted to some color regions: their cities, and the links between two of them.
+        The graph core (and its distance matrix) of every combination of zones is built once and shared by
+        the next games.
+
+        :param zones: Colors of the regions to play (keys of zonesUS), e.g. ["red", "yellow", "orange"].
+        :return: A new BoardMap.
+        """
+        chosen = {city for zone in zones for city in zonesUS[zone]}
+        sub_cities = {code: name for code, name in citiesUS.items() if code in chosen}
+        sub_links = [link for link in edgesUS if link[0] in chosen and link[1] in chosen]
+
+        key = frozenset(zones)
+        board = cls(sub_cities, sub_links, graph=cls.zone_graphs.get(key))
+        cls.zone_graphs[key] = board.graph
+        return board
+
+    def to_networkx(self):
+        """
+        Builds a networkx graph of the map, for export or drawing: every city with a copy of its 'owners'
+        and every link with its 'weight'. The map itself doesn't use networkx.
+
+        :return: networkx.Graph
+        """
+        import networkx as nx  # only needed for the export
+
+        graph = nx.Graph()
+        for code, owners in zip(self.city_tags, self.owners):
+            graph.add_node(code, owners=list(owners))
+        graph.add_weighted_edges_from(self.edges)
+        return graph
+
+    def _changed(self):
+        self.version += 1
+        self.views.clear()
+
+    def _view(self, key, compute):
+        """
+        Memoized derived view: computed on the first call after a change, then returned as is. The value is
+        shared by every caller until the next change, so it must not be modified.
+
+        :param key: Key of the view, e.g. "status" or "counts".
+        :param compute: Function without arguments computing the view.
+        """
+        try:
+            return self.views[key]
+        except KeyError:
+            value = self.views[key] = compute()
+            return value
 
-        # Each node is added here
-        for code, city_name in cities.items():
-            self.map.add_node(code, owners=[])
+    def snapshot_owners(self):
+        """
+        Captures the owners of every city, the only part of the map that changes during a game.
 
-        # Add edges with weights (cost A -> B)
-        self.map.add_weighted_edges_from(links)
+        :return: Tuple with the owners of every city, as tuples, in city id order.
+        """
+        return tuple(tuple(owners) for owners in self.owners)
+
+    def restore_owners(self, snapshot):
+        """
+        Puts back the owners captured by snapshot_owners. The owner lists are refilled in place.
+
+        :param snapshot: Value returned by snapshot_owners on this map.
+        """
+        for owners, saved in zip(self.owners, snapshot):
+            owners[:] = saved
+
+        # Rebuild the ownership index from the restored owners
+        self.player_cities = {}
+        for city_id, saved in enumerate(snapshot):
+            self.occupancy[city_id] = len(saved)
+            for player_jid in saved:
+                self.player_cities.setdefault(player_jid, set()).add(self.city_tags[city_id])
+        self.player_components = {}
+        self.player_reach = {}
+        self.player_frontiers = {}
+        for player_jid in self.player_cities:
+            self._rebuild_components(player_jid)
+            self._rebuild_frontier(player_jid)
+        self._changed()
+
+    def _add_to_components(self, player_jid, city_tag):
+        """
+        Counts a new city of the player in its board component.
+        """
+        city_id = self.city_ids[city_tag]
+        counts = self.player_components.setdefault(player_jid, {})
+        counts[self.component[city_id]] = counts.get(self.component[city_id], 0) + 1
+
+    def _rebuild_components(self, player_jid):
+        self.player_components.pop(player_jid, None)
+        owned = self.player_cities.get(player_jid)
+        if not owned:
+            return
+
+        counts = self.player_components[player_jid] = {}
+        for city in owned:
+            city_id = self.city_ids[city]
+            counts[self.component[city_id]] = counts.get(self.component[city_id], 0) + 1
+
+    def _relax(self, reach, city_id):
+        """
+        Lowers reach to the costs through city_id (see CityGraph.relax), from its row of the distance matrix
+        when there is one.
+
+        :return: List of (new cost, city id) of the cities whose cost went down, ready for a frontier heap.
+        """
+        if self.distances is None:
+            return self.graph.relax(reach, city_id)
+        row = self.distances[city_id]
+        improved = np.flatnonzero(row < reach)
+        reach[improved] = row[improved]
+        return list(zip(row[improved].tolist(), improved.tolist()))
+
+    def _extend_frontier(self, player_jid, city_tag):
+        """
+        Adds a new city of the player to their frontier: the cities that got cheaper to connect are pushed
+        again with their new cost.
+        """
+        reach = self.player_reach.get(player_jid)
+        if reach is None:
+            reach = self.player_reach[player_jid] = np.full(len(self.city_tags), np.inf)
+        frontier = self.player_frontiers.setdefault(player_jid, [])
+        for entry in self._relax(reach, self.city_ids[city_tag]):
+            heapq.heappush(frontier, entry)
+
+        # Drop the outdated entries once they outnumber the cities
+        if len(frontier) > 4 * len(self.city_tags):
+            self._rebuild_frontier(player_jid)
+
+    def _rebuild_frontier(self, player_jid):
+        self.player_reach.pop(player_jid, None)
+        self.player_frontiers.pop(player_jid, None)
+        owned = self.player_cities.get(player_jid)
+        if not owned:
+            return
+
+        owned_ids = [self.city_ids[city] for city in owned]
+        if self.distances is not None:
+            reach = self.distances[owned_ids].min(axis=0)
+        else:
+            reach = self.graph.shortest_costs(owned_ids)
+        frontier = [(cost, city_id) for city_id, cost in enumerate(reach.tolist()) if cost != float('inf')]
+        heapq.heapify(frontier)
+        self.player_reach[player_jid] = reach
+        self.player_frontiers[player_jid] = frontier
 
     def update_owner(self, player_jid, city_tag, max_occupancy=2):
         """
@@ -177,11 +605,12 @@ class BoardMap:
         :param max_occupancy: Maximum number of owners per city.
         :return: 0 if successful, 1 otherwise.
         """
-        if city_tag not in self.map:
+        city_id = self.city_ids.get(city_tag)
+        if city_id is None:
             logging.error(f"City with tag '{city_tag}' not found.")
             return 1
 
-        owners = self.map.nodes[city_tag].get('owners', [])
+        owners = self.owners[city_id]
         if len(owners) >= max_occupancy:
             logging.error("City has reached maximum occupancy.")
             return 1
@@ -191,7 +620,11 @@ class BoardMap:
             return 0
 
         owners.append(player_jid)
-        self.map.nodes[city_tag]['owners'] = owners
+        self.occupancy[city_id] += 1
+        self.player_cities.setdefault(player_jid, set()).add(city_tag)
+        self._add_to_components(player_jid, city_tag)
+        self._extend_frontier(player_jid, city_tag)
+        self._changed()
         logging.info(f"Player {player_jid} now owns city {city_tag}.")
         return 0
 
@@ -203,14 +636,23 @@ class BoardMap:
         :param city_tag: The 3-letter tag of the city.
         :return: 0 if successful, 1 otherwise.
         """
-        if city_tag not in self.map:
+        city_id = self.city_ids.get(city_tag)
+        if city_id is None:
             logging.error(f"City with tag '{city_tag}' not found.")
             return 1
 
-        owners = self.map.nodes[city_tag].get('owners', [])
+        owners = self.owners[city_id]
         if player_jid in owners:
             owners.remove(player_jid)
-            self.map.nodes[city_tag]['owners'] = owners
+            self.occupancy[city_id] -= 1
+            self.player_cities[player_jid].discard(city_tag)
+            if not self.player_cities[player_jid]:
+                del self.player_cities[player_jid]
+            # Losing a city can only raise the player's connection costs, which the lazy frontier heap can't
+            # take: rebuild their reach and frontier, and recount their cities per component with them
+            self._rebuild_components(player_jid)
+            self._rebuild_frontier(player_jid)
+            self._changed()
             logging.info(f"Player {player_jid} removed ownership from city {city_tag}.")
             return 0
         else:
@@ -224,12 +666,21 @@ class BoardMap:
         :param tag: The city 3-letter tag.
         :return: List of owners.
         """
-        if tag in self.map.nodes:
-            return self.map.nodes[tag].get('owners', [])
+        city_id = self.city_ids.get(tag)
+        if city_id is not None:
+            return self.owners[city_id]
         else:
             logging.error(f"City with tag '{tag}' not found.")
             return []
 
+    def get_occupancy(self, tag):
+        """
+        :param tag: The city 3-letter tag.
+        :return: Number of owners of the city, None if there is no such city.
+        """
+        city_id = self.city_ids.get(tag)
+        return None if city_id is None else int(self.occupancy[city_id])
+
     def is_connected(self, player_jid, new_city):
         """
         Check if the new_city can be connected to the player's existing network.
@@ -238,18 +689,25 @@ class BoardMap:
         :param new_city: The 3-letter tag of the city to connect.
         :return: True if connected, False otherwise.
         """
-        # Get all cities owned by the player
-        player_cities = [city for city, data in self.map.nodes(data=True) if player_jid in data.get('owners', [])]
-
-        if not player_cities:
+        if not self.player_cities.get(player_jid):
             # Player has no cities; can connect anywhere
             return True
 
-        # Check if there's a path from new_city to any of the player's cities
-        for owned_city in player_cities:
-            if nx.has_path(self.map, new_city, owned_city):
-                return True
-        return False
+        city_id = self.city_ids.get(new_city)
+        if city_id is None:
+            logging.error(f"City with tag '{new_city}' not found.")
+            return False
+
+        # There is a path to one of the player's cities if one of them is in the same component
+        return self.player_components[player_jid].get(self.component[city_id], 0) > 0
+
+    def is_reachable(self, city_a, city_b):
+        """
+        Same answer as nx.has_path on the map of city_a and city_b, in constant time.
+
+        :return: True if a path of links joins the two cities.
+        """
+        return self.component[self.city_ids[city_a]] == self.component[self.city_ids[city_b]]
 
     def get_connection_cost(self, player_jid, new_city):
         """
@@ -259,23 +717,122 @@ class BoardMap:
         :param new_city: The 3-letter tag of the city to connect.
         :return: Minimum connection cost or float('inf') if no connection exists.
         """
-        player_cities = [city for city, data in self.map.nodes(data=True) if player_jid in data.get('owners', [])]
+        player_cities = self.player_cities.get(player_jid)
 
         if not player_cities:
             # Player has no cities; connection cost is 0
             return 0
 
-        min_cost = float('inf')
-        for owned_city in player_cities:
-            try:
-                path = nx.shortest_path(self.map, source=new_city, target=owned_city, weight='weight')
-                cost = self.calculate_path_cost(path)
-                if cost < min_cost:
-                    min_cost = cost
-            except nx.NetworkXNoPath:
-                continue
+        city_id = self.city_ids.get(new_city)
+        if city_id is None:
+            logging.error(f"City with tag '{new_city}' not found.")
+            return float('inf')
+
+        # The player's frontier holds the cost of every city
+        min_cost = self.player_reach[player_jid][city_id]
+        return int(min_cost) if min_cost != float('inf') else float('inf')
+
+    def next_city(self, player_jid, max_occupancy=2):
+        """
+        The cheapest city to connect to the player's network next, from the top of their frontier.
+        Outdated entries and the player's own cities are popped for good on the way; full cities are kept,
+        since a removal can free them.
 
-        return min_cost if min_cost != float('inf') else float('inf')
+        :param player_jid: The JID of the player.
+        :param max_occupancy: Maximum number of owners per city.
+        :return: Tuple (city_tag, connection_cost), or None if the player has no city or can't reach any free one.
+        """
+        frontier = self.player_frontiers.get(player_jid)
+        if not frontier:
+            return None
+        reach = self.player_reach[player_jid]
+        owned = self.player_cities[player_jid]
+
+        full = []
+        found = None
+        while frontier:
+            cost, city_id = frontier[0]
+            if cost != reach[city_id] or self.city_tags[city_id] in owned:
+                heapq.heappop(frontier)
+            elif self.occupancy[city_id] >= max_occupancy:
+                full.append(heapq.heappop(frontier))
+            else:
+                found = (self.city_tags[city_id], int(cost))
+                break
+        for entry in full:
+            heapq.heappush(frontier, entry)
+        return found
+
+    def is_full(self, player_jids, max_occupancy=2):
+        """
+        Whether the map is full for the players: every one of them has a network, and none can reach a city
+        with room left for them. The game can't go on then, whatever their elektro.
+
+        :param player_jids: The JIDs of the players.
+        :param max_occupancy: Maximum number of owners per city.
+        :return: True if no player can build in any more cities.
+        """
+        return all(self.player_cities.get(player_jid) and self.next_city(player_jid, max_occupancy) is None
+                   for player_jid in player_jids)
+
+    def plan_build(self, player_jid, candidates, budget, building_cost, max_cities):
+        """
+        Chooses the cities to build in one turn, pricing each one against the network as it grows during
+        the turn (a city planned earlier in the turn connects the next ones), not only against the cities
+        owned at the start of the turn.
+        Greedy Steiner-tree approximation (Prim's algorithm over the candidates), run on a copy of the
+        player's frontier: the cheapest city to connect to the network is added first, and so on while
+        the budget and the houses last.
+
+        :param player_jid: The JID of the player.
+        :param candidates: Dictionary {city_tag: priority} of the cities the player may build in;
+                           the highest priority wins between cities of the same cost.
+        :param budget: Elektro the player can spend on connections and buildings.
+        :param building_cost: Cost of one house at the current step.
+        :param max_cities: Maximum number of cities to build (e.g. the houses left).
+        :return: List of (city_tag, connection_cost) in build order.
+        """
+        priorities = {self.city_ids[city]: priority for city, priority in candidates.items() if city in self.city_ids}
+
+        reach = self.player_reach.get(player_jid)
+        if reach is None:
+            # No city yet: the first one is free to connect, wherever it is
+            reach = np.zeros(len(self.city_tags))
+            frontier = [(0, city_id) for city_id in range(len(self.city_tags))]
+        else:
+            reach = reach.copy()
+            frontier = list(self.player_frontiers[player_jid])
+
+        plan = []
+        while len(plan) < max_cities and priorities:
+            # Every candidate at the cheapest connection cost, in map order
+            ties = []
+            while frontier and (not ties or frontier[0][0] == ties[0][0]):
+                cost, city_id = heapq.heappop(frontier)
+                if city_id in priorities and cost == reach[city_id]:
+                    ties.append((cost, city_id))
+            if not ties:
+                break
+
+            # Highest priority first, then map order
+            cost, choice = max(ties, key=lambda entry: priorities[entry[1]])
+            if cost + building_cost > budget:
+                break
+            for entry in ties:
+                if entry[1] != choice:
+                    heapq.heappush(frontier, entry)
+
+            plan.append((self.city_tags[choice], int(cost)))
+            budget -= cost + building_cost
+            del priorities[choice]
+            if len(plan) == 1 and player_jid not in self.player_reach:
+                # The network starts at the first city: price everything against it from now on
+                reach[:] = np.inf
+                frontier = []
+            for entry in self._relax(reach, choice):
+                if entry[1] in priorities:
+                    heapq.heappush(frontier, entry)
+        return plan
 
     def calculate_path_cost(self, path):
         """
@@ -286,9 +843,11 @@ class BoardMap:
         """
         total_cost = 0
         for i in range(len(path) - 1):
-            edge_data = self.map.get_edge_data(path[i], path[i + 1])
-            if edge_data and 'weight' in edge_data:
-                total_cost += edge_data['weight']
+            weight = None
+            if path[i] in self.city_ids and path[i + 1] in self.city_ids:
+                weight = self.graph.link_cost(self.city_ids[path[i]], self.city_ids[path[i + 1]])
+            if weight is not None:
+                total_cost += weight
             else:
                 logging.error(f"Missing weight for edge {path[i]} - {path[i + 1]}.")
                 return float('inf')
@@ -297,44 +856,30 @@ class BoardMap:
     def get_status(self):
         """
         Returns the current status of the map, including city ownership.
+        Memoized until the next ownership change, so the dictionary must not be modified.
 
         :return: A dictionary with city tags as keys and lists of owners as values.
         """
-        status = {}
-        for city in self.map.nodes:
-            status[city] = self.get_current_owners(city)
-        return status
+        return self._view("status", lambda: {code: list(owners) for code, owners in zip(self.city_tags, self.owners)})
 
     def get_all_players(self):
         """
         Returns a dictionary with all players as keys and 0 as the initial value.
+        Memoized until the next ownership change, so the dictionary must not be modified.
 
         :return: Dictionary {player_jid: 0, ...}
         """
-        players = {}
-        for city in self.map.nodes:
-            owners = self.get_current_owners(city)
-            for owner in owners:
-                if owner not in players:
-                    players[owner] = 0
-        return players
+        return self._view("players", lambda: {player_jid: 0 for player_jid in self.player_cities})
 
     def count_player_cities(self):
         """
         Returns a dictionary with each player as the key and the number of cities they own as the value.
+        Memoized until the next ownership change, so the dictionary must not be modified.
 
         :return: Dictionary {player_jid: city_count, ...}
         """
-        player_city_count = self.get_all_players()
-
-        # Iterate over all cities in the map
-        for city in self.map.nodes:
-            owners = self.get_current_owners(city)
-            for owner in owners:
-                if owner in player_city_count:
-                    player_city_count[owner] += 1
-
-        return player_city_count
+        return self._view("counts", lambda: {player_jid: len(cities)
+                                             for player_jid, cities in self.player_cities.items()})
 
     def has_ended(self, required_cities):
         """
@@ -358,9 +903,9 @@ class BoardMap:
         - It exists in the map.
         - Its occupancy is less than the step limit.
         """
-        if city_tag not in self.map.nodes:
+        city_id = self.city_ids.get(city_tag)
+        if city_id is None:
             logging.error(f"City with tag '{city_tag}' not found.")
             return False
 
-        owners = self.map.nodes[city_tag].get('owners', [])
-        return len(owners) <= 2
\ No newline at end of file
+        return bool(self.occupancy[city_id] < step)
\ No newline at end of file
@@ -0,0 +1,179 @@
+# map_loader.py
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from map_graph import BoardMap, CityGraph
+
+# Bump when the layout of the cached arrays changes, so old caches are not read back
+CACHE_VERSION = 1
+CACHE_DIR_NAME = ".map_cache"
+
+
+def read_map(path):
+    """
+    Reads a map file. Two formats are accepted, by extension:
+
+    - .json: {"cities": {tag: name}, "links": [[tag, tag, cost], ...], "zones": {color: [tag, ...]}},
+      "zones" being optional;
+    - .graphml: one node per city (its id is the tag, with optional 'name' and 'zone' attributes)
+      and one edge per link with a 'weight' attribute (needs networkx).
+
+    :param path: Path of the map file.
+    :return: Tuple (cities {tag: name}, links [(tag, tag, cost)], zones {color: [tag, ...]}, empty if none).
+    """
+    if path.endswith(".graphml"):
+        import networkx as nx  # only needed for GraphML
+
+        graph = nx.read_graphml(path)
+        cities = {str(tag): str(data.get("name", tag)) for tag, data in graph.nodes(data=True)}
+        links = [(str(a), str(b), int(float(data["weight"]))) for a, b, data in graph.edges(data=True)]
+        zones = {}
+        for tag, data in graph.nodes(data=True):
+            if "zone" in data:
+                zones.setdefault(str(data["zone"]), []).append(str(tag))
+    else:
+        with open(path) as map_file:
+            data = json.load(map_file)
+        cities = dict(data["cities"])
+        links = [(a, b, int(cost)) for a, b, cost in data["links"]]
+        zones = {zone: list(tags) for zone, tags in data.get("zones", {}).items()}
+
+    for a, b, cost in links:
+        if a not in cities or b not in cities:
+            raise ValueError(f"Link {a} - {b} of '{path}' joins an unknown city.")
+    return cities, links, zones
+
+
+def write_map(path, cities, links, zones=None):
+    """
+    Writes a map file that read_map can load, in JSON or GraphML by extension.
+
+    :param path: Path of the map file.
+    :param cities: Dictionary {tag: name}.
+    :param links: List of (tag, tag, cost).
+    :param zones: Optional dictionary {color: [tag, ...]}.
+    """
+    if path.endswith(".graphml"):
+        import networkx as nx  # only needed for GraphML
+
+        zone_of = {tag: zone for zone, tags in (zones or {}).items() for tag in tags}
+        graph = nx.Graph()
+        for tag, name in cities.items():
+            if tag in zone_of:
+                graph.add_node(tag, name=name, zone=zone_of[tag])
+            else:
+                graph.add_node(tag, name=name)
+        graph.add_weighted_edges_from(links)
+        nx.write_graphml(graph, path)
+    else:
+        data = {"cities": cities, "links": [list(link) for link in links]}
+        if zones:
+            data["zones"] = zones
+        with open(path, "w") as map_file:
+            json.dump(data, map_file)
+
+
+def restrict_to_zones(cities, links, zone_cities, zones):
+    """
+    :return: Tuple (cities, links) of the given zones only: their cities, and the links between two of them.
+    """
+    chosen = set()
+    for zone in zones:
+        if zone not in zone_cities:
+            raise ValueError(f"Unknown zone '{zone}'.")
+        chosen.update(zone_cities[zone])
+    sub_cities = {tag: name for tag, name in cities.items() if tag in chosen}
+    sub_links = [link for link in links if link[0] in chosen and link[1] in chosen]
+    return sub_cities, sub_links
+
+
+def cache_key(content, zones=None, all_pairs=True):
+    """
+    :param content: Bytes of the map file.
+    :param zones: Zones played, if only part of the map is.
+    :param all_pairs: Whether the cache holds the distance matrix.
+    :return: Hex digest naming the cache of this map (changes with the file, the zones and CACHE_VERSION).
+    """
+    digest = hashlib.sha256(content)
+    digest.update(f"\0version={CACHE_VERSION};all_pairs={all_pairs}".encode())
+    if zones:
+        digest.update(("\0zones=" + ",".join(sorted(zones))).encode())
+    return digest.hexdigest()[:32]
+
+
+def read_cache(directory, tags):
+    """
+    Reads the arrays of a CityGraph back from a cache directory, memory-mapped.
+
+    :return: The CityGraph, or None if the cache is missing or doesn't match the cities.
+    """
+    try:
+        arrays = {}
+        for name in CityGraph.ARRAY_NAMES:
+            array_path = os.path.join(directory, name + ".npy")
+            if os.path.exists(array_path):
+                arrays[name] = np.load(array_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if "indptr" not in arrays or len(arrays["indptr"]) != len(tags) + 1:
+        return None
+    return CityGraph.from_arrays(tags, arrays)
+
+
+def write_cache(directory, graph):
+    """
+    Saves the arrays of a CityGraph in a cache directory. They are written in a temporary directory that is
+    then renamed, so a process reading the cache never sees it half written; if another process
+    wrote the same cache in the meantime, its copy is kept.
+    """
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    temporary = tempfile.mkdtemp(dir=parent)
+    try:
+        for name, array in graph.to_arrays().items():
+            np.save(os.path.join(temporary, name + ".npy"), np.ascontiguousarray(array))
+        os.rename(temporary, directory)
+    except OSError:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+
+def load_map(path, zones=None, cache_dir=None, use_cache=True, all_pairs_max_cities=BoardMap.ALL_PAIRS_MAX_CITIES):
+    """
+    Builds a BoardMap from a map file (see read_map). The integer ids, the CSR adjacency, the components and
+    the distance matrix are computed once and cached in binary files, named after a hash of the file content
+    (and of the zones), and the next loads memory-map them instead of computing them again.
+
+    :param path: Path of the map file (.json or .graphml).
+    :param zones: Zones to play, from the "zones" of the file. None plays the whole map.
+    :param cache_dir: Directory of the caches, by default a .map_cache directory beside the map file.
+    :param use_cache: False computes everything and writes no cache.
+    :param all_pairs_max_cities: Largest map that gets a distance matrix. Above BoardMap's own limit it is only
+                                 worth it with the cache: the matrix takes seconds to compute on thousands of
+                                 cities, but milliseconds to map back.
+    :return: A new BoardMap.
+    """
+    with open(path, "rb") as map_file:
+        content = map_file.read()
+    cities, links, zone_cities = read_map(path)
+    if zones:
+        cities, links = restrict_to_zones(cities, links, zone_cities, zones)
+
+    all_pairs = len(cities) <= all_pairs_max_cities
+    if not use_cache:
+        return BoardMap(cities, links, graph=CityGraph(cities, links, all_pairs))
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    directory = os.path.join(cache_dir, cache_key(content, zones, all_pairs))
+
+    graph = read_cache(directory, list(cities)) if os.path.isdir(directory) else None
+    if graph is None:
+        graph = CityGraph(cities, links, all_pairs)
+        write_cache(directory, graph)
+    return BoardMap(cities, links, graph=graph)
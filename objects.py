@@ -1,8 +1,37 @@
 # objects.py
 
 import random
+from collections import namedtuple
+
+import numpy as np
+
 from rule_tables import price_table, resource_replenishment, remove_cards
 
+
+def price_ladder(resource_type, capacity):
+    """
+    Walks the price table of a resource once.
+
+    :param resource_type: "coal", "oil", "garbage" or "uranium".
+    :param capacity: Maximum amount of the resource in the market.
+    :return: Array where item n is the price of the next unit when n units are in the market (0 for n = 0).
+    """
+    ladder = np.zeros(capacity + 1, dtype=np.int64)
+    for amounts, price in price_table[resource_type].items():
+        for amount in (amounts if isinstance(amounts, tuple) else (amounts,)):
+            if amount <= capacity:
+                ladder[amount] = price
+    return ladder
+
+
+# Capacity of the market for each resource
+MARKET_CAPACITY = {"coal": 24, "oil": 24, "garbage": 24, "uranium": 12}
+# PRICE_LADDERS[resource][n]: price of the next unit with n units in the market
+PRICE_LADDERS = {resource: price_ladder(resource, capacity) for resource, capacity in MARKET_CAPACITY.items()}
+# PRICE_PREFIX[resource][n]: sum of the ladder up to n, so that buying k units with n in the market
+# costs PRICE_PREFIX[resource][n] - PRICE_PREFIX[resource][n - k]
+PRICE_PREFIX = {resource: np.cumsum(ladder) for resource, ladder in PRICE_LADDERS.items()}
+
 class PowerPlant:
     def __init__(self, min_bid, cities, resource_type=None, resource_num=0, is_hybrid=False, is_step=False):
         if resource_type is None:
@@ -109,10 +138,15 @@ class PowerPlant:
             is_step=data.get('is_step', False)
         )
 
+# Answer of ResourceMarket.quote_order and ResourceMarket.order: whether the whole basket is accepted, the units
+# and the cost of every resource, the total cost, and why the basket was refused ("" when accepted)
+OrderReceipt = namedtuple("OrderReceipt", ["accepted", "purchases", "costs", "total_cost", "reason"])
+
+
 class ResourceMarket:
     def __init__(self, coal=24, oil=24, garbage=24, uranium=12):
         # Maximum capacities for each resource in the market
-        self.max = {"coal": 24, "oil": 24, "garbage": 24, "uranium": 12}
+        self.max = dict(MARKET_CAPACITY)
         # Current availability of each resource in the market
         self.in_market = {"coal": coal, "oil": oil, "garbage": garbage, "uranium": uranium}
 
@@ -125,36 +159,91 @@ class ResourceMarket:
         If the resource is unavailable, returns None.
         """
         current_amount = self.in_market.get(resource_type, 0)
-        if current_amount == 0:
+        ladder = PRICE_LADDERS.get(resource_type)
+        if ladder is None or not 0 < current_amount < len(ladder):
             return None  # No resources available
-        if resource_type == "uranium":
-            # Uranium has a distinct pricing structure based on the current amount
-            return price_table["uranium"].get(current_amount, None)
-        else:
-            # For coal, oil, and garbage, pricing depends on how many units are left
-            # This logic is simplified and doesn't reflect the exact increments from the original game board
-            # For a more accurate reflection, you'd need to map the number of resources to specific prices
-            for ranges, price in price_table[resource_type].items():
-                if current_amount in ranges:
-                    return price
-        return None
+        return ladder.item(current_amount)
+
+    def quote(self, resource_type, quantity):
+        """
+        Cost of buying a quantity of a resource at the current market level, without buying it:
+        the units are priced from the cheapest slot up, as purchase_resource would.
+        Returns None if there aren't enough resources.
+        """
+        current_amount = self.in_market.get(resource_type, 0)
+        prefix = PRICE_PREFIX.get(resource_type)
+        if prefix is None or not 0 <= quantity <= current_amount < len(prefix):
+            return None
+        return prefix.item(current_amount) - prefix.item(current_amount - quantity)
+
+    def quotes(self, resource_type):
+        """
+        Costs of buying every quantity of a resource at the current market level, in one array:
+        item k is the cost of k units, from 0 up to every unit in the market.
+        """
+        current_amount = self.in_market.get(resource_type, 0)
+        prefix = PRICE_PREFIX.get(resource_type)
+        if prefix is None or current_amount >= len(prefix):
+            return np.zeros(1, dtype=np.int64)
+        return prefix[current_amount] - prefix[current_amount::-1]
 
     def purchase_resource(self, resource_type, quantity):
         """
         Attempts to purchase a certain quantity of a resource type.
         Returns the total cost if successful, or None if there aren't enough resources.
         """
-        if self.in_market.get(resource_type, 0) < quantity:
+        total_cost = self.quote(resource_type, quantity)
+        if total_cost is None:
             return None
-        total_cost = 0
-        for _ in range(quantity):
-            unit_price = self.resource_price(resource_type)
-            if unit_price is None:
-                return None  # Not enough resources to complete the purchase
-            total_cost += unit_price
-            self.in_market[resource_type] -= 1
+        self.in_market[resource_type] -= quantity
         return total_cost
 
+    def quote_order(self, basket, budget=None):
+        """
+        Validates and prices a basket of resources in one pass, without buying anything.
+
+        :param basket: Dictionary {resource: units}, e.g. {"coal": 2, "uranium": 1}; missing resources aren't bought.
+        :param budget: Elektro the buyer has, or None for no limit.
+        :return: OrderReceipt. The basket is refused, and nothing is priced, if a resource is unknown, a quantity
+                 isn't a non-negative integer, the market doesn't have enough units or the total exceeds the budget.
+        """
+        purchases = {resource: 0 for resource in self.in_market}
+        costs = dict(purchases)
+        for resource, units in basket.items():
+            if resource not in self.in_market:
+                return self._refused(f"unknown resource '{resource}'")
+            if not isinstance(units, int) or isinstance(units, bool) or units < 0:
+                return self._refused(f"invalid quantity {units!r} of {resource}")
+            cost = self.quote(resource, units)
+            if cost is None:
+                return self._refused(f"{units} {resource} asked, {self.in_market[resource]} in the market")
+            purchases[resource] = units
+            costs[resource] = cost
+
+        total_cost = sum(costs.values())
+        if budget is not None and total_cost > budget:
+            return self._refused(f"total cost {total_cost} over the budget of {budget}")
+        return OrderReceipt(True, purchases, costs, total_cost, "")
+
+    def order(self, basket, budget=None):
+        """
+        Buys a whole basket of resources, or nothing: quote_order, then the units of an accepted basket
+        leave the market.
+
+        :param basket: Dictionary {resource: units}.
+        :param budget: Elektro the buyer has, or None for no limit.
+        :return: The OrderReceipt of quote_order, for the buyer to apply as it is.
+        """
+        receipt = self.quote_order(basket, budget)
+        if receipt.accepted:
+            for resource, units in receipt.purchases.items():
+                self.in_market[resource] -= units
+        return receipt
+
+    def _refused(self, reason):
+        nothing = {resource: 0 for resource in self.in_market}
+        return OrderReceipt(False, nothing, dict(nothing), 0, reason)
+
     def refill_market(self, step, player_count):
         """
         Refill the market at the end of a turn based on the number of players and the current game step.
@@ -168,6 +257,23 @@ class ResourceMarket:
             amount_to_add = min(available_space, amount)
             self.in_market[resource] += amount_to_add
 
+    def snapshot(self):
+        """
+        Captures the resources in the market.
+
+        :return: Tuple of (resource, amount) pairs.
+        """
+        return tuple(self.in_market.items())
+
+    def restore(self, snapshot):
+        """
+        Puts back the resources captured by snapshot.
+
+        :param snapshot: Value returned by snapshot.
+        """
+        self.in_market.clear()
+        self.in_market.update(snapshot)
+
     def add_resources_back_to_bank(self, used_resources):
         """
         Adds the used resources back to the resource bank (which can be managed if needed).
@@ -176,13 +282,15 @@ class ResourceMarket:
         pass
 
 class PowerPlantMarket:
-    def __init__(self, player_count):
+    def __init__(self, player_count, rng=None):
         """
         Initializes the PowerPlantMarket based on the number of players.
 
         :param player_count: Number of players in the game.
+        :param rng: random.Random used to shuffle the deck (a fresh unseeded one if None).
         """
         self.player_count = player_count
+        self.rng = rng if rng is not None else random.Random()
         self.current_market = []
         self.future_market = []
         self.deck = []
@@ -217,7 +325,7 @@ class PowerPlantMarket:
         all_plants = power_plant_plug + power_plant_socket
 
         # Shuffle them to ensure randomness
-        random.shuffle(all_plants)
+        self.rng.shuffle(all_plants)
 
         # Remove power plants based on player count as per game rules
         plug_to_remove, socket_to_remove = remove_cards.get(self.player_count, (0, 0))
@@ -300,6 +408,26 @@ class PowerPlantMarket:
         else:
             print("Deck is empty. No new power plant to draw.")
 
+    def snapshot(self):
+        """
+        Captures the current market, the future market and the deck.
+        Power plants are cards that never change, so they are shared, not copied.
+
+        :return: Tuple (current market, future market, deck), each one a tuple of PowerPlant.
+        """
+        return tuple(self.current_market), tuple(self.future_market), tuple(self.deck)
+
+    def restore(self, snapshot):
+        """
+        Puts back the markets and the deck captured by snapshot.
+
+        :param snapshot: Value returned by snapshot.
+        """
+        current_market, future_market, deck = snapshot
+        self.current_market = list(current_market)
+        self.future_market = list(future_market)
+        self.deck = list(deck)
+
     def get_current_market(self):
         """
         Returns the current market as a list of PowerPlant instances.
@@ -2,7 +2,6 @@
 from time import sleep
 import os
 import asyncio
-import random
 
 from spade.agent import Agent
 from spade.behaviour import CyclicBehaviour
@@ -10,10 +9,8 @@ from spade.message import Message
 import json
 
 from objects import PowerPlant
-from game_environment import Environment
+from fuel_planner import RESOURCES, allocate_fuel, plan_purchase
 from rule_tables import *
-import globals
-import networkx as nx
 
 #######################  METHODS TO FORMAT STRINGS  ###########################
 
@@ -21,41 +18,23 @@ import networkx as nx
 def split_parts():
     print("\n" + "-" * 30 + "\n")
 
-#######################  METHODS TO CREATE THE LOG  #########################
-def create_log():
-    """
-    Creates or clears the log file named 'log.txt'.
-    """
-    with open("log.txt", "w") as log_file:
-        # Opening in 'w' mode ensures the file is emptied if it exists.
-        pass
-    print("Log file 'log.txt' created or cleared.")
-
-
-def update_log(message):
-    """
-    Appends the given string to the next line of the log file, called "log.txt".
-
-    :argument:
-        message (str): The message to append to the log file.
-    """
-    with open("log.txt", "a") as log_file:
-        log_file.write(message + "\n")
-    #print(f"Message added to log: {message}")
-
 #############################################################################
 
 
 
-class PowerGridPlayerAgent(Agent):
-    def __init__(self, jid, password, player_id):
-        super().__init__(jid, password)
+class PowerGridPlayer:
+    """
+    Player state and the decisions that don't depend on how messages are delivered.
+    Shared by the XMPP agent below and by the in-process players of headless.py.
+    """
+    def __init__(self, player_id, context):
         self.player_id = player_id
+        self.context = context  # GameContext of the game this player is in
         self.houses = 0  # Starting with 22 houses as per game rules
         self.elektro = 0  # Starting money
         self.cities_owned = []  # List of city tags where the player has houses
         self.number_cities_owned = 0
-        self.cities_powered = []  # List of city tags that the player can power
+        self.cities_powered = 0  # Number of cities powered in the last bureaucracy phase
         self.power_plants = []  # List of power plant dictionaries
         self.resources = {}
         self.has_bought_power_plant = False
@@ -63,7 +42,6 @@ class PowerGridPlayerAgent(Agent):
         # Removed: self.power_plant_market as it's not needed as an attribute
         self.step = 2  # Current game step
         self.connected_cities = 0  # Number of connected cities
-        globals.environment_instance = Environment(None)
         self.get_inventory()
 
         '''
@@ -78,12 +56,12 @@ class PowerGridPlayerAgent(Agent):
         """
         Updates the player's attributes with the current inventory from the global environment.
         """
-        inventory = globals.environment_instance.players.get(self.player_id, {})
+        inventory = self.context.environment.players.get(self.player_id, {})
         self.houses = inventory.get('houses', 0)
         self.elektro = inventory.get('elektro', 0)
         self.cities_owned = inventory.get('cities_owned', [])
         self.number_cities_owned = inventory.get('number_cities_owned', 0)
-        self.cities_powered = inventory.get('cities_powered', [])
+        self.cities_powered = inventory.get('cities_powered', 0)
         self.power_plants = inventory.get('power_plants', [])
         self.resources = inventory.get('resources', {})
         self.has_bought_power_plant = inventory.get('has_bought_power_plant', False)
@@ -95,7 +73,7 @@ class PowerGridPlayerAgent(Agent):
         Updates the global environment's inventory for this player
         based on the current attributes.
         """
-        globals.environment_instance.players[self.player_id] = {
+        self.context.environment.players[self.player_id] = {
             'houses': self.houses,
             'elektro': self.elektro,
             'cities_owned': self.cities_owned,
@@ -113,67 +91,27 @@ class PowerGridPlayerAgent(Agent):
         Decides how many cities to power based on the player's resources, power plants, and owned cities.
         Updates Elektro and resources directly.
         """
+        # Best allocation of the resources held to the plants, capped by the cities owned
+        allocation = allocate_fuel(self.power_plants, self.resources, len(self.cities_owned))
+        cities_powered = allocation.cities
+        resources_consumed = {rtype: amount for rtype, amount in zip(RESOURCES, allocation.consumed) if amount > 0}
         available_resources = self.resources.copy()
-        cities_powered = 0
-        resources_consumed = {}
-
-        for plant in self.power_plants:
-            resource_needed = plant.resource_num
-
-            # Stop if we've powered all owned cities
-            if cities_powered >= len(self.cities_owned):
-                break
-
-            # If it's free, just power
-            if not plant.resource_type:
-                # Eco-friendly plant: powers cities without consuming resources
-                cities_powered += plant.cities
-
-            # If it's hybrid, use any combination of resources
-            elif plant.is_hybrid:
-                # Hybrid plant: mix resources
-                total_available = sum(available_resources.get(r, 0) for r in plant.resource_type)
-                if total_available >= resource_needed:
-                    consumed = {}
-                    for rtype in plant.resource_type:
-                        used = min(resource_needed, available_resources.get(rtype, 0))
-                        if used > 0:
-                            consumed[rtype] = consumed.get(rtype, 0) + used
-                            available_resources[rtype] -= used
-                            resource_needed -= used
-                            if resource_needed == 0:
-                                break
-
-                    cities_powered += plant.cities
-                    # Stop if we've powered all owned cities
-                    if cities_powered >= len(self.cities_owned):
-                        break
-                    # Record consumed resources
-                    for r, amt in consumed.items():
-                        resources_consumed[r] = resources_consumed.get(r, 0) + amt
-            else:
-                # Single-resource plant
-                rtype = plant.resource_type[0]
-                if available_resources.get(rtype, 0) >= resource_needed:
-                    available_resources[rtype] -= resource_needed
-                    cities_powered += plant.cities
-                    resources_consumed[rtype] = resources_consumed.get(rtype, 0) + resource_needed
-
-        if cities_powered > len(self.cities_owned):
-            cities_powered = len(self.cities_owned)
+        for rtype, amount in resources_consumed.items():
+            available_resources[rtype] -= amount
 
         # Calculate income based on city_cashback
-        if cities_powered <= len(city_cashback):
+        if cities_powered < len(city_cashback):
             elektro_earned = city_cashback[cities_powered]
         else:
             elektro_earned = city_cashback[-1]  # Use max cashback value if cities_powered exceeds defined cashback
 
-        # Update Elektro and resources
+        # Update Elektro, resources and the cities powered (reported at the end of the game)
         self.elektro += elektro_earned
         self.resources = available_resources
+        self.cities_powered = cities_powered
         self.update_inventory()
 
-        update_log(f"Player {self.player_id} powered {cities_powered} cities,"
+        self.context.update_log(f"Player {self.player_id} powered {cities_powered} cities,"
                    f" earned {elektro_earned} Elektro,"
                    f" and consumed {resources_consumed}."
                    f"\n Elektro after cashback: {self.elektro}")
@@ -185,11 +123,18 @@ class PowerGridPlayerAgent(Agent):
         print(f"Current round: {round_no}")
         print(f"The current phase is {phase} and sub phase is {subphase}")
         print(f"The decision is: {decision}")
-        globals.environment_instance.print_environment()
-        sleep(1)
-        os.system("clear")
+        self.context.environment.print_environment()
+        if not self.context.fast_forward:
+            # Only when watching the game: leave the status on screen for a moment, then clear it
+            sleep(1)
+            os.system("clear")
 
 
+class PowerGridPlayerAgent(PowerGridPlayer, Agent):
+    def __init__(self, jid, password, player_id, context):
+        Agent.__init__(self, jid, password)
+        PowerGridPlayer.__init__(self, player_id, context)
+
     class ReceivePhaseBehaviour(CyclicBehaviour):
         async def run(self):
             # Synchronize inventory at the start of each cycle
@@ -197,347 +142,357 @@ class PowerGridPlayerAgent(Agent):
 
             msg = await self.receive(timeout=30)
             if msg:
-                sender = str(msg.sender).split('/')[0]
-
-                # Parse the JSON content of the message
-                try:
-                    data = json.loads(msg.body)
-                except json.JSONDecodeError:
-                    update_log(f"Player {self.agent.player_id} received invalid JSON.")
-                    return
-
-                phase = data.get("phase")
-                action = data.get("action")
-
-                if phase == "setup":
-                    # Handle setup phase
-                    player_order = data.get("player_order")
-                    self.agent.position = player_order
-                    self.agent.update_inventory()
-                    update_log(f"Player {self.agent.player_id} received setup information. Position: {player_order}")
-
-                elif phase == "phase1":
-                    # Handle player order notification
-                    player_order = data.get("player_order")
-                    self.agent.position = player_order
-                    self.agent.update_inventory()
-                    update_log(f"Player {self.agent.player_id} is in position {player_order}")
-                    self.agent.print_status(phase=phase, round_no=data.get("round"), 
-                                            turn=self.agent.player_id, subphase=action, decision = "Phase 1 (choose order based on city ownership).")
-
-
-                elif phase == "phase2":
-                    if action == "choose_or_pass":
-                        # Decide whether to start an auction or pass
-                        power_plant_market_data = data.get("power_plants", [])
-                        power_plant_market = [PowerPlant.from_dict(pp) for pp in power_plant_market_data]
-                        can_pass = data.get("can_pass", True)
-                        if can_pass:
-                            # Decide to pass or choose a power plant
-                            if self.should_pass(power_plant_market):
-                                choice_msg = Message(to=sender)
-                                choice_data = {
-                                    "choice": "pass"
-                                }
-                                choice_msg.body = json.dumps(choice_data)
-                                await self.send(choice_msg)
-                                update_log(f"Player {self.agent.player_id} decides to pass on starting an auction.")
-                                self.agent.print_status(phase=phase, round_no=data.get("round"), 
-                                                        turn=self.agent.player_id,
-                                                        subphase=action, decision="Pass.")
-
-                            else:
-                                chosen_plant_number = self.choose_power_plant_to_auction(power_plant_market)
-                                if chosen_plant_number is not None:
-                                    choice_msg = Message(to=sender)
-                                    choice_data = {
-                                        "choice": "auction",
-                                        "power_plant_number": chosen_plant_number
-                                    }
-                                    choice_msg.body = json.dumps(choice_data)
-                                    await self.send(choice_msg)
-                                    update_log(f"Player {self.agent.player_id} chooses to auction power plant {chosen_plant_number}.")
-                                    self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                            turn=self.agent.player_id, 
-                                                            subphase=action, decision="Proceed to auction.")
-
-
-                                else:
-                                    # Cannot afford any power plant, so pass
-                                    choice_msg = Message(to=sender)
-                                    choice_data = {
-                                        "choice": "pass"
-                                    }
-                                    choice_msg.body = json.dumps(choice_data)
-                                    await self.send(choice_msg)
-                                    update_log(f"Player {self.agent.player_id} cannot afford any power plant and passes.")
-                                    self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                            turn=self.agent.player_id, 
-                                                            subphase=action, decision="Pass (can't afford).")
+                await self.handle_message(msg)
+            else:
+                self.agent.context.update_log(f"Player {self.agent.player_id} did not receive any message.")
+            # Yield control to event loop (receive already waits for the next message, so no pause in fast-forward)
+            await asyncio.sleep(0 if self.agent.context.fast_forward else 0.2)
 
+        async def handle_message(self, msg):
+            """
+            Parses one message from the game manager and answers it.
+            Kept apart from run() so the headless engine can drive it without the XMPP loop.
+            """
+            sender = str(msg.sender).split('/')[0]
+            # Replies carry the thread of the request, so the manager can match them to it
+
+            # Parse the JSON content of the message
+            try:
+                data = json.loads(msg.body)
+            except json.JSONDecodeError:
+                self.agent.context.update_log(f"Player {self.agent.player_id} received invalid JSON.")
+                return
+
+            phase = data.get("phase")
+            action = data.get("action")
+
+            if phase == "setup":
+                # Handle setup phase
+                player_order = data.get("player_order")
+                self.agent.position = player_order
+                self.agent.update_inventory()
+                self.agent.context.update_log(f"Player {self.agent.player_id} received setup information. Position: {player_order}")
 
-                        else:
-                            # Must choose a power plant (first round)
-                            chosen_plant_number = self.choose_power_plant_to_auction(power_plant_market)
-                            choice_msg = Message(to=sender)
+            elif phase == "phase1":
+                # Handle player order notification
+                player_order = data.get("player_order")
+                self.agent.position = player_order
+                self.agent.update_inventory()
+                self.agent.context.update_log(f"Player {self.agent.player_id} is in position {player_order}")
+                self.agent.print_status(phase=phase, round_no=data.get("round"), 
+                                        turn=self.agent.player_id, subphase=action, decision = "Phase 1 (choose order based on city ownership).")
+
+
+            elif phase == "phase2":
+                if action == "choose_or_pass":
+                    # Decide whether to start an auction or pass
+                    power_plant_market_data = data.get("power_plants", [])
+                    power_plant_market = [PowerPlant.from_dict(pp) for pp in power_plant_market_data]
+                    can_pass = data.get("can_pass", True)
+                    if can_pass:
+                        # Decide to pass or choose a power plant
+                        if self.should_pass(power_plant_market):
+                            choice_msg = Message(to=sender, thread=msg.thread)
                             choice_data = {
-                                "choice": "auction",
-                                "power_plant_number": chosen_plant_number
+                                "choice": "pass"
                             }
                             choice_msg.body = json.dumps(choice_data)
                             await self.send(choice_msg)
-                            update_log(f"Player {self.agent.player_id} must auction power plant {chosen_plant_number} (first round).")
-                            self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                    turn=self.agent.player_id, 
-                                                    subphase=action, decision="Proceed to auction (mandatory).")
-
-                    elif action == "initial_bid":
-                        # Handle initial bid from starting player
-                        base_min_bid = data.get("base_min_bid")
-                        power_plant_data = data.get("power_plant")
-                        power_plant = PowerPlant.from_dict(power_plant_data) if power_plant_data else None
-                        bid_amount = self.decide_initial_bid(base_min_bid, power_plant)
-                        bid_msg = Message(to=sender)
-                        bid_data = {
-                            "bid": bid_amount
-                        }
-                        bid_msg.body = json.dumps(bid_data)
-                        await self.send(bid_msg)
-                        update_log(f"Player {self.agent.player_id} places initial bid of {bid_amount} on power plant {power_plant.min_bid if power_plant else 'unknown'}.")
-                        self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                turn=self.agent.player_id, 
-                                                subphase=action, decision=f"Initial bid of {bid_amount} elektro.")
-
+                            self.agent.context.update_log(f"Player {self.agent.player_id} decides to pass on starting an auction.")
+                            self.agent.print_status(phase=phase, round_no=data.get("round"), 
+                                                    turn=self.agent.player_id,
+                                                    subphase=action, decision="Pass.")
 
-                    elif action == "bid":
-                        wants_powerplant = [True,False] # adds randomness to player choice
+                        else:
+                            chosen_plant_number = self.choose_power_plant_to_auction(power_plant_market)
+                            if chosen_plant_number is not None:
+                                choice_msg = Message(to=sender, thread=msg.thread)
+                                choice_data = {
+                                    "choice": "auction",
+                                    "power_plant_number": chosen_plant_number
+                                }
+                                choice_msg.body = json.dumps(choice_data)
+                                await self.send(choice_msg)
+                                self.agent.context.update_log(f"Player {self.agent.player_id} chooses to auction power plant {chosen_plant_number}.")
+                                self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                                        turn=self.agent.player_id, 
+                                                        subphase=action, decision="Proceed to auction.")
 
-                        # wants powerplant
-                        if random.choice(wants_powerplant):
 
-                            # Receive bid request
-                            current_bid = data.get("current_bid", 0)
-                            power_plant_data = data.get("power_plant", {})
-                            power_plant = PowerPlant.from_dict(power_plant_data) if power_plant_data else None
-                            # Decide whether to bid or pass
-                            bid_amount = self.decide_bid_amount(current_bid, power_plant)
-                            bid_msg = Message(to=sender)
-                            bid_data = {
-                                "bid": bid_amount
-                            }
-                            bid_msg.body = json.dumps(bid_data)
-                            await self.send(bid_msg)
-                            if bid_amount > current_bid:
-                                self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                        turn=self.agent.player_id,
-                                                        subphase=action,
-                                                        decision=f"Bid {bid_amount} elektro for the power_plant {power_plant.min_bid if power_plant else 'unknown'}.")
-                                update_log(f"Player {self.agent.player_id} bids {bid_amount} for power plant {power_plant.min_bid if power_plant else 'unknown'}.")
                             else:
+                                # Cannot afford any power plant, so pass
+                                choice_msg = Message(to=sender, thread=msg.thread)
+                                choice_data = {
+                                    "choice": "pass"
+                                }
+                                choice_msg.body = json.dumps(choice_data)
+                                await self.send(choice_msg)
+                                self.agent.context.update_log(f"Player {self.agent.player_id} cannot afford any power plant and passes.")
                                 self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                        turn=self.agent.player_id,
-                                                        subphase=action,
-                                                        decision=f"Passes for {bid_amount}, not beneficial.")
-                                update_log(f"Player {self.agent.player_id} passes on bidding.")
+                                                        turn=self.agent.player_id, 
+                                                        subphase=action, decision="Pass (can't afford).")
 
-                        # doesn't want powerplant
-                        else:
-                            pass
-                            bid_amount = 0
-                            self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                    turn=self.agent.player_id,
-                                                    subphase=action,
-                                                    decision=f"Passes on {bid_amount}, since he does.")
-                            update_log(f"Player {self.agent.player_id} passes on bidding, doesn't want power plant.")
 
-                        self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                turn=self.agent.player_id, 
-                                                subphase=action, decision=f"Passes, since it doesn't want the power plant.")
-
-                    elif action == "discard_power_plant":
-                        # Player has more than 3 power plants and must discard one
-                        power_plants_data = data.get("power_plants", [])
-                        power_plants = [PowerPlant.from_dict(pp) for pp in power_plants_data]
-                        discard_number = self.choose_power_plant_to_discard(power_plants)
-                        discard_msg = Message(to=sender)
-                        discard_data = {
-                            "discard_number": discard_number
+                    else:
+                        # Must choose a power plant (first round)
+                        chosen_plant_number = self.choose_power_plant_to_auction(power_plant_market)
+                        choice_msg = Message(to=sender, thread=msg.thread)
+                        choice_data = {
+                            "choice": "auction",
+                            "power_plant_number": chosen_plant_number
                         }
-                        discard_msg.body = json.dumps(discard_data)
-                        await self.send(discard_msg)
-                        update_log(f"Player {self.agent.player_id} discards power plant {discard_number}.")
+                        choice_msg.body = json.dumps(choice_data)
+                        await self.send(choice_msg)
+                        self.agent.context.update_log(f"Player {self.agent.player_id} must auction power plant {chosen_plant_number} (first round).")
                         self.agent.print_status(phase=phase, round_no=data.get("round"),
                                                 turn=self.agent.player_id, 
-                                                subphase=action, decision=f"Discard {discard_number}, can't have more than 3 pp.")
-
-
-                    elif action == "auction_result":
-                        # Handle auction result
-                        winner = data.get("winner")
+                                                subphase=action, decision="Proceed to auction (mandatory).")
+
+                elif action == "initial_bid":
+                    # Handle initial bid from starting player
+                    base_min_bid = data.get("base_min_bid")
+                    power_plant_data = data.get("power_plant")
+                    power_plant = PowerPlant.from_dict(power_plant_data) if power_plant_data else None
+                    bid_amount = self.decide_initial_bid(base_min_bid, power_plant)
+                    bid_msg = Message(to=sender, thread=msg.thread)
+                    bid_data = {
+                        "bid": bid_amount
+                    }
+                    bid_msg.body = json.dumps(bid_data)
+                    await self.send(bid_msg)
+                    self.agent.context.update_log(f"Player {self.agent.player_id} places initial bid of {bid_amount} on power plant {power_plant.min_bid if power_plant else 'unknown'}.")
+                    self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                            turn=self.agent.player_id, 
+                                            subphase=action, decision=f"Initial bid of {bid_amount} elektro.")
+
+
+                elif action == "bid":
+                    wants_powerplant = [True,False] # adds randomness to player choice
+
+                    # wants powerplant
+                    if self.agent.context.rng.choice(wants_powerplant):
+
+                        # Receive bid request
+                        current_bid = data.get("current_bid", 0)
                         power_plant_data = data.get("power_plant", {})
                         power_plant = PowerPlant.from_dict(power_plant_data) if power_plant_data else None
-                        bid = data.get("bid", 0)
-
-                        if winner == f'player{self.agent.player_id}@localhost':
-                            self.agent.elektro -= bid  # Deduct the bid amount
-                            self.agent.update_inventory()
-                            # Add the power plant to the player's state only if it's not already present
-                            if power_plant and all(pp.min_bid != power_plant.min_bid for pp in self.agent.power_plants):
-                                self.agent.power_plants.append(power_plant)
-                                self.agent.update_inventory()
-                                update_log(f"Bid amount: {bid}")
-                                update_log(f"Winner {self.agent.player_id} currently has {self.agent.elektro} elektro, after bidding")
-
-                                update_log(f"Player {self.agent.player_id} won the auction for power plant {power_plant.min_bid} with bid {bid}.")
-                                self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                        turn=self.agent.player_id,
-                                                        subphase=action, decision="Appends the power plant to the inventory and changes balance.")
-                        else:
-                            update_log(f"Player {self.agent.player_id} currently has {self.agent.elektro} elektro, after bidding")
-
-                            update_log(f"Player {self.agent.player_id} observed that player {winner} won the auction for power plant {power_plant.min_bid if power_plant else 'unknown'} with bid {bid}.")
-
-                elif phase == "phase3":
-                    if action == "buy_resources":
-                        # Receive resource market information
-                        resource_market = data.get("resource_market", {})
-                        # Decide which resources to buy
-                        purchases, total_cost = self.decide_resources_to_buy(resource_market)
-                        purchase_msg = Message(to=sender)
-                        purchase_data = {
-                            "purchases": purchases,  # Dict of resources to buy
-                            "total_cost": total_cost  # Total cost of purchases
+                        # Decide whether to bid or pass
+                        bid_amount = self.decide_bid_amount(current_bid, power_plant)
+                        bid_msg = Message(to=sender, thread=msg.thread)
+                        bid_data = {
+                            "bid": bid_amount
                         }
-                        purchase_msg.body = json.dumps(purchase_data)
-                        await self.send(purchase_msg)
-                        update_log(f"Player {self.agent.player_id} decides to buy resources: {purchases} for total cost {total_cost}.")
-                        update_log(f"Player {self.agent.player_id} currently has {self.agent.elektro} elektro")
-                        self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                turn=self.agent.player_id,
-                                                subphase=action,
-                                                decision=f"Buy resources: {purchases} for total cost {total_cost}.")
-
-
-                    elif action == "purchase_result":
-                        # Handle purchase result
-                        purchases = data.get("purchases", {})
-                        total_cost = data.get("total_cost", 0)
-                        if total_cost > self.agent.elektro:
-                            print(f"Error: Player {self.agent.player_id} cannot afford the total cost of {total_cost}.")
-                            # Handle the error appropriately, possibly reverting the purchases
+                        bid_msg.body = json.dumps(bid_data)
+                        await self.send(bid_msg)
+                        if bid_amount > current_bid:
+                            self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                                    turn=self.agent.player_id,
+                                                    subphase=action,
+                                                    decision=f"Bid {bid_amount} elektro for the power_plant {power_plant.min_bid if power_plant else 'unknown'}.")
+                            self.agent.context.update_log(f"Player {self.agent.player_id} bids {bid_amount} for power plant {power_plant.min_bid if power_plant else 'unknown'}.")
                         else:
-                            # Deduct the total cost
-                            self.agent.elektro -= total_cost
-                            # Update player's resources
-                            for resource, amount in purchases.items():
-                                if amount > 0:
-                                    self.agent.resources[resource] = self.agent.resources.get(resource, 0) + amount
-                            self.agent.update_inventory()
-                            update_log(f"Player {self.agent.player_id} purchased resources: {purchases} for total cost {total_cost}. Remaining elektro: {self.agent.elektro}")
-
-
-                elif phase == "phase4":
-                    if action == "build_houses":
-                        # Receive map status and current step
-                        map_status = data.get("map_status", {})
-                        current_step = data.get("step", 2)
-                        self.agent.step = current_step
-                        # Decide where to build
-                        cities_to_build = self.decide_cities_to_build(map_status)
-                        build_msg = Message(to=sender)
-                        build_data = {
-                            "cities": cities_to_build
-                        }
-                        build_msg.body = json.dumps(build_data)
-                        await self.send(build_msg)
-                        update_log(f"Player {self.agent.player_id} decides to build in cities: {cities_to_build}.")
-                        self.agent.print_status(phase=phase, round_no=data.get("round"),
-                                                turn=self.agent.player_id,
-                                                subphase=action,
-                                                decision=f"Build in cities: {cities_to_build}.")
-
-                    elif action == "build_result":
-                        # Handle build result
-                        cities = data.get("cities", [])
-                        total_cost = data.get("total_cost", 0)
-                        # Update player's cities
-                        self.agent.cities_owned.extend(cities)
-                        self.agent.cities_owned = list(set(self.agent.cities_owned))
-                        self.agent.update_inventory()
-                        update_log(f"Player {self.agent.player_id} "
-                              f"chose to purchase {cities},"
-                              f" updating them to {self.agent.cities_owned}"
-                              f" totaling {total_cost}"
-                              f" while having {self.agent.elektro}")
-                        self.agent.update_inventory()
-                        update_log(f"Player {self.agent.player_id} built houses in cities: {cities} for total cost {total_cost}.")
-
-
-                elif phase == "phase5":
-                    if action == "power_cities_request":
-                        # Handle power cities request
-                        update_log(f"Player {self.agent.player_id} received power_cities_request.")
-                        # Decide how to power cities
-                        cities_powered, resources_consumed = self.agent.decide_cities_to_power()
-                        # Send the number of cities powered and resources consumed back to the manager
-                        response = Message(to=sender)
-                        response.body = json.dumps({
-                            "phase": "phase5",
-                            "action": "power_cities",
-                            "cities_powered": cities_powered,
-                            "resources_consumed": resources_consumed,
-                            "elektro": self.agent.elektro  # Include updated Elektro
-                        })
+                            self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                                    turn=self.agent.player_id,
+                                                    subphase=action,
+                                                    decision=f"Passes for {bid_amount}, not beneficial.")
+                            self.agent.context.update_log(f"Player {self.agent.player_id} passes on bidding.")
+
+                    # doesn't want powerplant
+                    else:
+                        bid_amount = 0
+                        # answer with an explicit pass, otherwise the manager only moves on after its timeout
+                        bid_msg = Message(to=sender, thread=msg.thread)
+                        bid_msg.body = json.dumps({"bid": bid_amount})
+                        await self.send(bid_msg)
                         self.agent.print_status(phase=phase, round_no=data.get("round"),
                                                 turn=self.agent.player_id,
                                                 subphase=action,
-                                                decision=f"Powered {cities_powered} for total cost {resources_consumed}.")
-                        await self.send(response)
-
-                elif phase == "check_game_end":
-                    if action == "get_cities_owned":
-                        # Respond with the list of cities owned
-                        response = Message(to=sender)
-                        response.body = json.dumps({
-                            "phase": "check_game_end",
-                            "action": "cities_owned",
-                            "cities_owned": self.agent.cities_owned
-                        })
-                        await self.send(response)
-                        update_log(
-                            f"Player {self.agent.player_id} responded with cities_owned: {self.agent.cities_owned}")
-
-
-                elif phase == "game_over":
-                    # Handle game over
+                                                decision=f"Passes on {bid_amount}, since he does.")
+                        self.agent.context.update_log(f"Player {self.agent.player_id} passes on bidding, doesn't want power plant.")
+
+                    self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                            turn=self.agent.player_id, 
+                                            subphase=action, decision=f"Passes, since it doesn't want the power plant.")
+
+                elif action == "discard_power_plant":
+                    # Player has more than 3 power plants and must discard one
+                    power_plants_data = data.get("power_plants", [])
+                    power_plants = [PowerPlant.from_dict(pp) for pp in power_plants_data]
+                    discard_number = self.choose_power_plant_to_discard(power_plants)
+                    discard_msg = Message(to=sender, thread=msg.thread)
+                    discard_data = {
+                        "discard_number": discard_number
+                    }
+                    discard_msg.body = json.dumps(discard_data)
+                    await self.send(discard_msg)
+                    self.agent.context.update_log(f"Player {self.agent.player_id} discards power plant {discard_number}.")
+                    self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                            turn=self.agent.player_id, 
+                                            subphase=action, decision=f"Discard {discard_number}, can't have more than 3 pp.")
+
+
+                elif action == "auction_result":
+                    # Handle auction result
                     winner = data.get("winner")
-                    final_elektro = data.get("final_elektro")
+                    power_plant_data = data.get("power_plant", {})
+                    power_plant = PowerPlant.from_dict(power_plant_data) if power_plant_data else None
+                    bid = data.get("bid", 0)
+
                     if winner == f'player{self.agent.player_id}@localhost':
-                        update_log(f"Player {self.agent.player_id} has won the game with {final_elektro} Elektro!")
+                        self.agent.elektro -= bid  # Deduct the bid amount
+                        self.agent.update_inventory()
+                        # Add the power plant to the player's state only if it's not already present
+                        if power_plant and all(pp.min_bid != power_plant.min_bid for pp in self.agent.power_plants):
+                            self.agent.power_plants.append(power_plant)
+                            self.agent.update_inventory()
+                            self.agent.context.update_log(f"Bid amount: {bid}")
+                            self.agent.context.update_log(f"Winner {self.agent.player_id} currently has {self.agent.elektro} elektro, after bidding")
+
+                            self.agent.context.update_log(f"Player {self.agent.player_id} won the auction for power plant {power_plant.min_bid} with bid {bid}.")
+                            self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                                    turn=self.agent.player_id,
+                                                    subphase=action, decision="Appends the power plant to the inventory and changes balance.")
+                    else:
+                        self.agent.context.update_log(f"Player {self.agent.player_id} currently has {self.agent.elektro} elektro, after bidding")
+
+                        self.agent.context.update_log(f"Player {self.agent.player_id} observed that player {winner} won the auction for power plant {power_plant.min_bid if power_plant else 'unknown'} with bid {bid}.")
+
+            elif phase == "phase3":
+                if action == "buy_resources":
+                    # Receive resource market information
+                    resource_market = data.get("resource_market", {})
+                    # Decide which resources to buy
+                    purchases, total_cost = self.decide_resources_to_buy(resource_market)
+                    purchase_msg = Message(to=sender, thread=msg.thread)
+                    purchase_data = {
+                        "purchases": purchases,  # Dict of resources to buy
+                        "total_cost": total_cost  # Total cost of purchases
+                    }
+                    purchase_msg.body = json.dumps(purchase_data)
+                    await self.send(purchase_msg)
+                    self.agent.context.update_log(f"Player {self.agent.player_id} decides to buy resources: {purchases} for total cost {total_cost}.")
+                    self.agent.context.update_log(f"Player {self.agent.player_id} currently has {self.agent.elektro} elektro")
+                    self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                            turn=self.agent.player_id,
+                                            subphase=action,
+                                            decision=f"Buy resources: {purchases} for total cost {total_cost}.")
+
+
+                elif action == "purchase_result":
+                    # Apply the receipt of the market as it is: the basket was bought whole, or not at all
+                    receipt = data.get("receipt", {})
+                    if not receipt.get("accepted"):
+                        self.agent.context.update_log(f"Player {self.agent.player_id} bought no resources: {receipt.get('reason', 'no receipt')}.")
                     else:
-                        update_log(f"Player {self.agent.player_id} has lost. Winner: {winner} with {final_elektro} Elektro.")
-                    await self.agent.stop()
-
-                elif phase == "end_game" and action == "get_final_stats":
-                    # Respond with the number of cities powered and current Elektro
-                    cities_powered = len(self.agent.cities_powered)
-                    elektro = self.agent.elektro  # Current Elektro balance
-                    response = Message(to=sender)
+                        purchases = receipt["purchases"]
+                        total_cost = receipt["total_cost"]
+                        self.agent.elektro -= total_cost
+                        for resource, amount in purchases.items():
+                            if amount > 0:
+                                self.agent.resources[resource] = self.agent.resources.get(resource, 0) + amount
+                        self.agent.update_inventory()
+                        self.agent.context.update_log(f"Player {self.agent.player_id} purchased resources: {purchases} for total cost {total_cost}. Remaining elektro: {self.agent.elektro}")
+
+
+            elif phase == "phase4":
+                if action == "build_houses":
+                    # Receive map status and current step
+                    map_status = data.get("map_status", {})
+                    current_step = data.get("step", 2)
+                    self.agent.step = current_step
+                    # Decide where to build
+                    cities_to_build = self.decide_cities_to_build(map_status)
+                    build_msg = Message(to=sender, thread=msg.thread)
+                    build_data = {
+                        "cities": cities_to_build
+                    }
+                    build_msg.body = json.dumps(build_data)
+                    await self.send(build_msg)
+                    self.agent.context.update_log(f"Player {self.agent.player_id} decides to build in cities: {cities_to_build}.")
+                    self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                            turn=self.agent.player_id,
+                                            subphase=action,
+                                            decision=f"Build in cities: {cities_to_build}.")
+
+                elif action == "build_result":
+                    # Handle build result
+                    cities = data.get("cities", [])
+                    total_cost = data.get("total_cost", 0)
+                    # Update player's cities
+                    self.agent.cities_owned.extend(cities)
+                    self.agent.cities_owned = list(dict.fromkeys(self.agent.cities_owned))  # dedupe, keeping the order
+                    self.agent.update_inventory()
+                    self.agent.context.update_log(f"Player {self.agent.player_id} "
+                          f"chose to purchase {cities},"
+                          f" updating them to {self.agent.cities_owned}"
+                          f" totaling {total_cost}"
+                          f" while having {self.agent.elektro}")
+                    self.agent.update_inventory()
+                    self.agent.context.update_log(f"Player {self.agent.player_id} built houses in cities: {cities} for total cost {total_cost}.")
+
+
+            elif phase == "phase5":
+                if action == "power_cities_request":
+                    # Handle power cities request
+                    self.agent.context.update_log(f"Player {self.agent.player_id} received power_cities_request.")
+                    # Decide how to power cities
+                    cities_powered, resources_consumed = self.agent.decide_cities_to_power()
+                    # Send the number of cities powered and resources consumed back to the manager
+                    response = Message(to=sender, thread=msg.thread)
                     response.body = json.dumps({
-                        "phase": "end_game",
-                        "action": "final_stats",
+                        "phase": "phase5",
+                        "action": "power_cities",
                         "cities_powered": cities_powered,
-                        "elektro": elektro
+                        "resources_consumed": resources_consumed,
+                        "elektro": self.agent.elektro  # Include updated Elektro
                     })
+                    self.agent.print_status(phase=phase, round_no=data.get("round"),
+                                            turn=self.agent.player_id,
+                                            subphase=action,
+                                            decision=f"Powered {cities_powered} for total cost {resources_consumed}.")
                     await self.send(response)
-                    update_log(
-                        f"Player {self.agent.player_id} reports {cities_powered} cities powered and {elektro} Elektro.")
 
+            elif phase == "check_game_end":
+                if action == "get_cities_owned":
+                    # Respond with the list of cities owned
+                    response = Message(to=sender, thread=msg.thread)
+                    response.body = json.dumps({
+                        "phase": "check_game_end",
+                        "action": "cities_owned",
+                        "cities_owned": self.agent.cities_owned
+                    })
+                    await self.send(response)
+                    self.agent.context.update_log(
+                        f"Player {self.agent.player_id} responded with cities_owned: {self.agent.cities_owned}")
+
+
+            elif phase == "game_over":
+                # Handle game over
+                winner = data.get("winner")
+                final_elektro = data.get("final_elektro")
+                if winner == f'player{self.agent.player_id}@localhost':
+                    self.agent.context.update_log(f"Player {self.agent.player_id} has won the game with {final_elektro} Elektro!")
                 else:
-                    update_log(f"Player {self.agent.player_id} received an unknown message: {msg.body}")
+                    self.agent.context.update_log(f"Player {self.agent.player_id} has lost. Winner: {winner} with {final_elektro} Elektro.")
+                await self.agent.stop()
+
+            elif phase == "end_game" and action == "get_final_stats":
+                # Respond with the number of cities powered and current Elektro
+                cities_powered = self.agent.cities_powered
+                elektro = self.agent.elektro  # Current Elektro balance
+                response = Message(to=sender, thread=msg.thread)
+                response.body = json.dumps({
+                    "phase": "end_game",
+                    "action": "final_stats",
+                    "cities_powered": cities_powered,
+                    "elektro": elektro
+                })
+                await self.send(response)
+                self.agent.context.update_log(
+                    f"Player {self.agent.player_id} reports {cities_powered} cities powered and {elektro} Elektro.")
+
             else:
-                update_log(f"Player {self.agent.player_id} did not receive any message.")
-            await asyncio.sleep(0.2)  # Yield control to event loop
+                self.agent.context.update_log(f"Player {self.agent.player_id} received an unknown message: {msg.body}")
 
 
         # Decision-making methods
@@ -581,13 +536,13 @@ class PowerGridPlayerAgent(Agent):
             Choose the best affordable power plant to auction based on strategic evaluation.
             """
             if not market:
-                update_log(f"Player {self.agent.player_id} finds no available power plants to auction.")
+                self.agent.context.update_log(f"Player {self.agent.player_id} finds no available power plants to auction.")
                 return None
 
             # Evaluate power plants assuming 'market' contains PowerPlant objects
             affordable_plants = [pp for pp in market if pp.min_bid <= self.agent.elektro]
             if not affordable_plants:
-                update_log(f"Player {self.agent.player_id} cannot afford any power plant.")
+                self.agent.context.update_log(f"Player {self.agent.player_id} cannot afford any power plant.")
                 return None
 
             # Strategy: pick the plant that provides the best ratio of cities powered per Elektro
@@ -644,157 +599,59 @@ class PowerGridPlayerAgent(Agent):
 
         def decide_resources_to_buy(self, resource_market):
             """
-            Decide which resources to buy based on the power plants owned, their storage capacity, and the price table.
-            Ensures the player does not spend more Elektro than they have and does not exceed storage capacity.
-            Returns a dictionary of purchases and the total cost.
+            Decide which resources to buy, together with the cities to build next (phase 4): for every number of
+            cities of the build plan, the rest of the Elektro goes to the cheapest basket powering the most cities
+            next round (see fuel_planner.plan_purchase), no more than the cities owned and built by then.
+            The number of builds powering the most cities is kept (the most builds between equals).
+            The stock already held is used first, hybrid plants take coal or oil, whichever is cheaper, and nothing is
+            bought beyond what the plants can store.
+            Returns a dictionary of purchases and the total cost (the basket for ResourceMarket.order, and its quote).
             """
-            purchases = {"coal": 0, "oil": 0, "garbage": 0, "uranium": 0}
-            total_cost = 0
-
-            # Step 1: Calculate the total storage limits and current needs for each resource type
-            resource_needs = {"coal": 0, "oil": 0, "garbage": 0, "uranium": 0}
-            resource_storage_limits = {"coal": 0, "oil": 0, "garbage": 0, "uranium": 0}
-
-            for plant in self.agent.power_plants:
-                if plant.resource_type and plant.resource_num > 0:
-                    for rtype in plant.resource_type:
-                        # Calculate remaining capacity for the resource in this plant
-                        remaining_capacity = plant.available_storage - sum(plant.storage.values())
-                        resource_needs[rtype] += max(plant.resource_num - plant.storage.get(rtype, 0), 0)
-                        resource_storage_limits[rtype] += remaining_capacity
-
-            # Step 2: Helper function to get sorted unit costs for each resource type
-            def get_sorted_unit_costs(resource_type):
-                """
-                Returns a list of unit costs sorted from cheapest to most expensive.
-                """
-                unit_costs = []
-                available_units = resource_market.get(resource_type, 0)
-                if available_units <= 0:
-                    return unit_costs
-
-                if resource_type == "uranium":
-                    for unit, cost in price_table["uranium"].items():
-                        if unit <= available_units:
-                            unit_costs.append(cost)
-                else:
-                    for range_key, price in price_table[resource_type].items():
-                        if isinstance(range_key, tuple):
-                            for unit in range(range_key[0], range_key[1] + 1):
-                                if unit <= available_units:
-                                    unit_costs.append(price)
-                unit_costs.sort()
-                return unit_costs
-
-            # Step 3: Create a sorted list of resources by cheapest unit cost
-            resource_priority = []
-            for resource in ["coal", "oil", "garbage", "uranium"]:
-                unit_costs = get_sorted_unit_costs(resource)
-                if unit_costs:
-                    resource_priority.append((unit_costs[0], resource))
-            resource_priority.sort(key=lambda x: x[0])
-
-            # Step 4: Buy resources, considering storage and affordability
-            for cost, resource in resource_priority:
-                # Determine how much can be bought based on needs, availability, and storage
-                current_stock = self.agent.resources.get(resource, 0) + purchases[resource]
-                max_storage = resource_storage_limits[resource]
-                if current_stock >= max_storage:
-                    update_log(
-                        f"{resource.capitalize()} storage at capacity ({current_stock}/{max_storage}). Skipping.")
-                    continue
-
-                needed = resource_needs[resource] - purchases[resource]
-                available = resource_market.get(resource, 0)
-                max_additional_storage = max_storage - current_stock
-
-                if needed <= 0 or available <= 0:
-                    update_log(f"No {resource} needed or available. Skipping.")
-                    continue
-
-                # Determine how many units can be bought
-                units_to_buy = min(needed, available, max_additional_storage)
-                max_affordable_units = self.agent.elektro // cost
-                units_to_buy = min(units_to_buy, max_affordable_units)
-
-                if units_to_buy <= 0:
-                    update_log(f"Cannot afford {resource} at {cost} Elektro/unit.")
-                    continue
-
-                # Calculate total cost and enforce spending limit
-                purchase_cost = units_to_buy * cost
-                if purchase_cost > self.agent.elektro * 0.6:
-                    units_affordable = int((self.agent.elektro * 0.6) // cost)
-                    units_to_buy = min(units_to_buy, units_affordable)
-                    purchase_cost = units_to_buy * cost
-
-                if units_to_buy <= 0:
-                    update_log(f"Purchase of {resource} exceeds spending limit. Skipping.")
-                    continue
-
-                # Register the purchase
-                purchases[resource] += units_to_buy
-                total_cost += purchase_cost
-                self.agent.elektro -= purchase_cost
-
-                update_log(f"Bought {units_to_buy} of {resource} for {purchase_cost} Elektro.")
+            environment = self.agent.context.environment
+            building_cost = environment.building_cost[environment.step]
+            builds = self.plan_builds(environment.map.get_status(), self.agent.elektro)
+
+            best = None
+            build_spend = 0
+            for planned in range(len(builds) + 1):
+                if planned:
+                    build_spend += builds[planned - 1][1] + building_cost
+                purchases, total_cost, cities = plan_purchase(self.agent.power_plants, self.agent.resources,
+                                                              resource_market, self.agent.elektro - build_spend,
+                                                              len(self.agent.cities_owned) + planned)
+                if best is not None and cities < best[2]:
+                    break  # the budget is what limits the cities now: more builds only leave less of it
+                best = (purchases, total_cost, cities, planned, build_spend)
+            purchases, total_cost, cities, planned, build_spend = best
+            self.agent.context.update_log(
+                f"Player {self.agent.player_id} can power {cities} cities next round, spending {total_cost} Elektro "
+                f"on resources and keeping {build_spend} for {planned} new cities.")
 
             # Final Debugging Output
-            update_log(
+            self.agent.context.update_log(
                 f"Player {self.agent.player_id} decides to buy resources: {purchases} with total_cost: {total_cost} Elektro.")
             return purchases, total_cost
 
         def decide_cities_to_build(self, map_status):
-            environment = globals.environment_instance
-            board_map = environment.map
+            environment = self.agent.context.environment
             available_elektro = self.agent.elektro
             available_houses = self.agent.houses
             cities_to_build = []
 
-            update_log(f"Player {self.agent.player_id} has {available_elektro} elektro and {available_houses} houses.")
-
-            # Calculate priorities for all cities not owned by the player
-            city_priorities = []
-            for city, data in map_status.items():
-                if city in self.agent.cities_owned:
-                    update_log(f"Player {self.agent.player_id} already owns city {city}. Skipping.")
-                    continue
-
-                if not board_map.is_city_available(city, environment.step):
-                    update_log(f"City {city} is not available. Skipping.")
-                    continue
-
-                # Evaluate city priority
-                priority = self.evaluate_city_priority(city, data)
-                city_priorities.append((city, priority))
+            self.agent.context.update_log(f"Player {self.agent.player_id} has {available_elektro} elektro and {available_houses} houses.")
 
-            # Sort cities by priority in descending order
-            city_priorities.sort(key=lambda x: x[1], reverse=True)
+            # Plan the whole turn: the cheapest cities to connect to the network as it grows,
+            # priorities breaking the ties, within the elektro and the houses left
+            building_cost = environment.building_cost[environment.step]
+            plan = self.plan_builds(map_status, available_elektro)
 
-            # Attempt to build only the highest-priority city
-            for city, priority in city_priorities:
-                connection_cost = board_map.get_connection_cost(f"player{self.agent.player_id}@localhost", city)
-                building_cost = environment.building_cost[environment.step]
+            for city, connection_cost in plan:
                 total_cost = connection_cost + building_cost
 
                 # Print the city and its associated costs
-                update_log(
+                self.agent.context.update_log(
                     f"Considering city {city}: Connection cost = {connection_cost}, Building cost = {building_cost}, Total cost = {total_cost}")
 
-                # Check if the player can afford the city
-                if total_cost > available_elektro:
-                    update_log(f"Player {self.agent.player_id} cannot afford city {city}. Skipping.")
-                    continue
-
-                if available_houses <= 0:
-                    update_log(f"Player {self.agent.player_id} has no houses left to build in city {city}. Skipping.")
-                    break
-
-                # Deduct costs and ensure funds don't go negative
-                if available_elektro - total_cost < 0:
-                    update_log(f"Building in city {city} would result in negative elektro. Skipping.")
-                    continue
-
                 # Add city to build list and deduct costs
                 cities_to_build.append(city)
                 available_elektro -= total_cost
@@ -807,14 +664,27 @@ class PowerGridPlayerAgent(Agent):
 
                 # Reflect changes in inventory
                 self.agent.update_inventory()
-                update_log(
+                self.agent.context.update_log(
                     f"Player {self.agent.player_id} builds in city {city}. Remaining elektro: {available_elektro}, houses: {available_houses}")
 
-                # Stop after building one city
-                break
+            if not cities_to_build:
+                self.agent.context.update_log(f"Player {self.agent.player_id} cannot afford any city this turn.")
 
             return cities_to_build
 
+        def plan_builds(self, map_status, budget):
+            """
+            The cities to build this turn within a budget (see BoardMap.plan_build): the cities not owned yet and
+            still available at this step, the cheapest to connect first, their priority breaking the ties.
+            Returns a list of (city_tag, connection_cost) in build order.
+            """
+            environment = self.agent.context.environment
+            board_map = environment.map
+            candidates = {city: self.evaluate_city_priority(city, data) for city, data in map_status.items()
+                          if city not in self.agent.cities_owned and board_map.is_city_available(city, environment.step)}
+            return board_map.plan_build(f"player{self.agent.player_id}@localhost", candidates, budget,
+                                        environment.building_cost[environment.step], self.agent.houses)
+
         def evaluate_city_priority(self, city_tag, city_data):
             """
             Evaluate a city's priority for building.
@@ -822,13 +692,13 @@ class PowerGridPlayerAgent(Agent):
             - Proximity to already owned cities.
             - Strategic growth potential.
             """
-            environment = globals.environment_instance  # Access the global environment instance
+            environment = self.agent.context.environment  # Access the environment of this game
             board_map = environment.map
             proximity_score = 0
 
-            # Calculate proximity to owned cities
+            # Calculate proximity to owned cities (the board's components answer has_path in constant time)
             for owned_city in self.agent.cities_owned:
-                if nx.has_path(board_map.map, source=city_tag, target=owned_city):
+                if board_map.is_reachable(city_tag, owned_city):
                     proximity_score += 1
 
             # Handle occupancy score
@@ -843,11 +713,11 @@ class PowerGridPlayerAgent(Agent):
 
             # Combine scores (weights can be adjusted based on strategy)
             priority_score = proximity_score + occupancy_score
-            update_log(
+            self.agent.context.update_log(
                 f"City {city_tag}: Proximity score = {proximity_score}, Occupancy score = {occupancy_score}, Total priority = {priority_score}")
             return priority_score
 
     async def setup(self):
-        update_log(f"Player {self.player_id} agent starting...")
+        self.context.update_log(f"Player {self.player_id} agent starting...")
         receive_phase_behaviour = PowerGridPlayerAgent.ReceivePhaseBehaviour()
         self.add_behaviour(receive_phase_behaviour)
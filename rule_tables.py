@@ -92,6 +92,15 @@ game_end_cities = {
     6: 14
 }
 
+# Number of color regions of the map played, adjacent to each other
+zones_played = {
+    2: 3,
+    3: 3,
+    4: 4,
+    5: 5,
+    6: 5
+}
+
 # Building cost table: Cost to build a house based on the current step
 building_cost = {
     1: 10,  # Step 1
@@ -0,0 +1,63 @@
+import numpy as np
+
+from batch_sim import BatchGames, NO_PLANT, PLANTS, RESOURCES, STEP, popcount, unpack_cities
+from fuel_planner import allocate_fuel
+from rule_tables import building_cost, game_end_cities
+
+
+def first_turn(elektro):
+    """Plays phase 4 of a fresh 2-player game where only one player has money, and returns what it left."""
+    games = BatchGames(1, 2, seed=0)
+    builder, other = games.order[0, -1], games.order[0, 0]
+    games.elektro[0, builder] = elektro
+    games.elektro[0, other] = 0
+    games.phase4()
+    return popcount(games.cities[0, builder]), games.elektro[0, builder]
+
+
+def test_second_first_turn_city_pays_its_connection():
+    # The first city goes to the first city of the map (cheapest, then least occupied, then map order)
+    games = BatchGames(1, 2, seed=0)
+    first = np.flatnonzero(games.playable[0])[0]
+    distances = games.board_distance[games.board[0], first]
+    link = int(np.min(distances[distances > 0]))
+
+    # Two building costs only pay for one city: the second one has a connection to pay too
+    cities, left = first_turn(2 * building_cost[STEP])
+    assert cities == 1
+    assert left == building_cost[STEP]
+
+    # With the connection on top, the second city is built and everything is spent
+    cities, left = first_turn(2 * building_cost[STEP] + link)
+    assert cities == 2
+    assert left == 0
+
+
+def test_phase5_powers_cities_like_allocate_fuel():
+    # Random plants (or empty slots), stocks and numbers of cities
+    rng = np.random.default_rng(0)
+    games = BatchGames(500, 3, seed=0)
+    games.plants = rng.integers(0, NO_PLANT + 1, games.plants.shape)
+    games.resources = rng.integers(0, 10, games.resources.shape)
+    city_count = rng.integers(0, 12, games.cities.shape)
+    games.cities = ((np.uint64(1) << city_count.astype(np.uint64)) - np.uint64(1)).astype(np.uint64)
+    held = games.resources.copy()
+    games.phase5()
+
+    for k in range(games.num_games):
+        for p in range(games.num_players):
+            plants = [PLANTS[plant] for plant in games.plants[k, p] if plant != NO_PLANT]
+            allocation = allocate_fuel(plants, dict(zip(RESOURCES, held[k, p].tolist())), int(city_count[k, p]))
+            assert games.cities_powered[k, p] == allocation.cities
+            assert tuple((held[k, p] - games.resources[k, p]).tolist()) == allocation.consumed
+
+
+def test_games_build_on_their_zones_only_and_end_when_full():
+    games = BatchGames(200, 3, seed=0)
+    result = games.run()
+    owned = unpack_cities(games.cities)
+    assert not (owned & ~games.playable[:, None, :]).any()
+
+    # 3 zones hold fewer houses than 3 players need to reach game_end_cities: every game still ends
+    assert (result["winner"] >= 0).all()
+    assert (result["cities"].max(axis=1) < game_end_cities[3]).any()
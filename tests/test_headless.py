@@ -0,0 +1,65 @@
+import asyncio
+
+from game_context import GameContext
+from headless import MANAGER_JID, HeadlessGameBehaviour, HeadlessPlayer, HeadlessPlayerBehaviour, play
+from local_bus import LocalBus
+
+
+async def first_round_purchases(seed):
+    """
+    Plays a 3-player game up to the end of phase 3 of round 1.
+
+    :return: Tuple (receipts {jid: OrderReceipt}, manager, {jid: player agent}), once the players applied them.
+    """
+    context = GameContext(3, seed=seed)
+    bus = LocalBus()
+    player_jids = [f"player{i}@localhost" for i in range(1, 4)]
+    players = []
+    for i, jid in enumerate(player_jids, start=1):
+        behaviour = HeadlessPlayerBehaviour()
+        behaviour.agent = HeadlessPlayer(jid, player_id=i, context=context)
+        behaviour.attach(bus, jid)
+        players.append(behaviour)
+    manager = HeadlessGameBehaviour(None, player_jids, context)
+    manager.attach(bus, MANAGER_JID)
+
+    # Record the receipt of the market for each player
+    receipts = {}
+    handle_resource_purchase = manager.handle_resource_purchase
+
+    async def record_purchase(player):
+        order = context.environment.resource_market.order
+
+        def recorded_order(purchases, budget):
+            receipts[player["jid"]] = order(purchases, budget=budget)
+            return receipts[player["jid"]]
+
+        context.environment.resource_market.order = recorded_order
+        try:
+            await handle_resource_purchase(player)
+        finally:
+            context.environment.resource_market.order = order
+
+    manager.handle_resource_purchase = record_purchase
+
+    player_tasks = [asyncio.create_task(play(p)) for p in players]
+    try:
+        while manager.current_phase != "phase4":
+            await manager.run_current_phase()
+        await asyncio.sleep(0.1)  # let the players apply the last receipt
+    finally:
+        for task in player_tasks:
+            task.cancel()
+    return receipts, manager, {p.agent.jid: p.agent for p in players}
+
+
+def test_first_round_purchase_is_credited_once():
+    receipts, manager, agents = asyncio.run(first_round_purchases(seed=0))
+    bought = {jid: receipt.purchases for jid, receipt in receipts.items() if receipt.accepted}
+    assert any(any(purchases.values()) for purchases in bought.values())
+
+    # Players start with no resources, so they end round 1 with exactly what they bought
+    for jid, purchases in bought.items():
+        for resource, amount in purchases.items():
+            assert agents[jid].resources.get(resource, 0) == amount
+            assert manager.players[jid]["resources"][resource] == amount
@@ -0,0 +1,30 @@
+from map_graph import BoardMap
+
+# A-B-C in a line, and D on its own
+CITIES = {"A": "Alpha", "B": "Bravo", "C": "Charlie", "D": "Delta"}
+LINKS = [("A", "B", 5), ("B", "C", 7)]
+
+
+def test_is_full_needs_a_network_for_every_player():
+    board = BoardMap(CITIES, LINKS)
+    assert not board.is_full(["p1", "p2"])
+    board.update_owner("p1", "A")
+    assert not board.is_full(["p1", "p2"])
+
+
+def test_is_full_when_no_player_can_reach_a_free_city():
+    board = BoardMap(CITIES, LINKS)
+    for city in ("A", "B", "C"):
+        board.update_owner("p1", city)
+    board.update_owner("p2", "A")
+    # p2 can still connect B and C; p1 owns all it can reach
+    assert not board.is_full(["p1", "p2"], max_occupancy=2)
+    # p1 owns every city it can reach (D is not connected)
+    assert board.is_full(["p1"], max_occupancy=1)
+    board.update_owner("p2", "B")
+    board.update_owner("p2", "C")
+    assert board.is_full(["p1", "p2"], max_occupancy=2)
+
+    # Freeing a city opens the map again
+    board.remove_owner("p2", "C")
+    assert not board.is_full(["p1", "p2"], max_occupancy=2)
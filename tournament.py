@@ -0,0 +1,102 @@
+# tournament.py
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from headless import run_headless_game
+from game_context import GameContext
+from map_loader import load_map
+
+
+def init_worker():
+    """
+    Runs once in each worker process: silences the terminal output of the agents.
+    """
+    sys.stdout = open(os.devnull, "w")
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def play_game(game_id, num_players, seed, log_dir=None, map_path=None):
+    """
+    Plays one headless game. Runs inside a worker process, one game at a time.
+
+    :param game_id: Index of the game in the tournament.
+    :param num_players: Number of players.
+    :param seed: Seed of the game.
+    :param log_dir: Directory for a per-game log file, or None for no log.
+    :param map_path: Map file to play on, or None for the US map.
+    :return: The result of run_headless_game, tagged with the game id, seed and number of players.
+    """
+    log_path = os.path.join(log_dir, f"game_{game_id}.txt") if log_dir else None
+    context = GameContext(num_players, seed=seed, log_path=log_path, map_path=map_path)
+    context.create_log()
+
+    result = asyncio.run(run_headless_game(context))
+    result.update({"game_id": game_id, "seed": seed, "num_players": num_players})
+    return result
+
+
+def run_tournament(games, num_players=3, workers=None, base_seed=0, log_dir=None, map_path=None):
+    """
+    Plays games across a process pool and yields each result as soon as it is ready.
+    Game i is played with seed base_seed + i, so a tournament can be split in several runs and merged.
+
+    :param games: Number of games.
+    :param num_players: Number of players in every game.
+    :param workers: Number of processes (defaults to the number of cores).
+    :param base_seed: Seed of the first game.
+    :param log_dir: Directory for per-game log files, or None for no logs.
+    :param map_path: Map file to play on, or None for the US map. Its cache is written here, before the pool
+                     starts, and every game memory-maps it.
+    """
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    if map_path:
+        load_map(map_path)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [
+            pool.submit(play_game, i, num_players, base_seed + i, log_dir, map_path)
+            for i in range(games)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many headless Power Grid games in parallel.")
+    parser.add_argument("--games", type=int, default=100, help="number of games")
+    parser.add_argument("--players", type=int, default=3, help="players per game (2-6)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--out", default="results.jsonl", help="results file, one JSON line per game (appended)")
+    parser.add_argument("--log-dir", default=None, help="write one log file per game in this directory")
+    parser.add_argument("--map", default=None, help="map file to play on (.json or .graphml), default: the US map")
+    args = parser.parse_args()
+
+    if not (2 <= args.players <= 6):
+        raise ValueError("Number of players must be between 2 and 6.")
+
+    wins = Counter()
+    rounds = 0
+    # Appending JSON lines keeps result files of separate runs mergeable with a plain cat
+    with open(args.out, "a") as out:
+        for result in run_tournament(args.games, args.players, args.workers, args.seed, args.log_dir, args.map):
+            out.write(json.dumps(result) + "\n")
+            wins[result["winner"]] += 1
+            rounds += result["rounds"]
+
+    print(f"Played {args.games} games, results appended to {args.out}.")
+    print(f"Average rounds: {rounds / max(args.games, 1):.1f}")
+    for jid, count in wins.most_common():
+        print(f"{jid}: {count} wins")
+
+
+if __name__ == "__main__":
+    main()